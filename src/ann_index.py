@@ -0,0 +1,320 @@
+# src/ann_index.py
+"""
+ANN Index Module
+----------------
+Configurable FAISS index types for the embed store, plus a recall/latency
+auto-tuner.
+
+Index types (all inner product on normalized vectors, wrapped in IndexIDMap):
+- flat:     exhaustive scan (exact, the recall baseline)
+- ivf_flat: inverted file, search cost ~ nprobe / nlist of the corpus
+- hnsw:     graph index, search cost ~ efSearch
+- ivf_pq:   inverted file + product quantization (smallest, approximate scores)
+
+The index type, build parameters and search parameters (nprobe / efSearch)
+are saved next to the index as `<index>.params.json`; retrieval reads them
+from there instead of hard-coding anything.
+
+Usage:
+    python ann_index.py tune --k 5 --target-recall 0.95 [--types ivf_flat,hnsw] [--apply]
+    python ann_index.py rebuild --type hnsw --efSearch 128
+"""
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+import numpy as np
+import faiss
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+DEFAULT_PARAMS = {"type": "flat"}
+TRAIN_SAMPLE = 100_000
+
+
+def params_path(index_path: Path) -> Path:
+    """Sidecar file holding type + parameters for an index file."""
+    index_path = Path(index_path)
+    return index_path.with_name(index_path.stem + ".params.json")
+
+
+def load_params(index_path: Path) -> dict:
+    """Saved index parameters, or the flat defaults if no sidecar exists."""
+    p = params_path(index_path)
+    if not p.exists():
+        return dict(DEFAULT_PARAMS)
+    with open(p, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_params(index_path: Path, params: dict) -> None:
+    # Written to a temp file and renamed, so readers never see a partial file
+    path = params_path(index_path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+    os.replace(tmp, path)
+
+
+def replace_index(src: Path, dst: Path) -> None:
+    """
+    Move a written index file and its params sidecar over `dst`: the index
+    first and the params last. Until the params follow, readers apply the old
+    nprobe / efSearch, which the new index ignores if its type does not use them;
+    the other order would pair new params with the old index.
+    """
+    os.replace(src, dst)
+    if params_path(src).exists():
+        os.replace(params_path(src), params_path(dst))
+
+
+def default_params(kind: str, n: int, dim: int) -> dict:
+    """
+    Reasonable build/search parameters for `n` vectors of size `dim`.
+
+    Args:
+        kind (str): One of INDEX_TYPES.
+        n (int): Number of vectors the index will be trained on.
+        dim (int): Embedding dimension.
+
+    Returns:
+        dict: Parameters including "type".
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {kind!r}; choose from {INDEX_TYPES}")
+    params = {"type": kind}
+    if kind.startswith("ivf"):
+        # ~39 training points per centroid is FAISS' lower bound for stable k-means
+        params["nlist"] = int(max(1, min(4 * np.sqrt(max(n, 1)), n // 39)))
+        params["nprobe"] = min(params["nlist"], 8)
+    if kind == "ivf_pq":
+        params["m"] = next(m for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1) if dim % m == 0 and m <= max(1, dim // 4))
+        params["nbits"] = int(min(8, max(1, np.log2(max(n // 39, 2)))))
+    if kind == "hnsw":
+        params.update({"M": 32, "efConstruction": 40, "efSearch": 64})
+    return params
+
+
+def _make(dim: int, params: dict):
+    kind = params["type"]
+    if kind == "flat":
+        return faiss.IndexFlatIP(dim)
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["M"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["efConstruction"]
+        return index
+    quantizer = faiss.IndexFlatIP(dim)
+    if kind == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dim, params["nlist"], faiss.METRIC_INNER_PRODUCT)
+    if kind == "ivf_pq":
+        return faiss.IndexIVFPQ(quantizer, dim, params["nlist"], params["m"], params["nbits"], faiss.METRIC_INNER_PRODUCT)
+    raise ValueError(f"Unknown index type {kind!r}; choose from {INDEX_TYPES}")
+
+
+def build_ann_index(embeddings: np.ndarray, ids: np.ndarray = None, params: dict = None,
+                    train_sample: int = TRAIN_SAMPLE, seed: int = 0):
+    """
+    Build, train and fill an IndexIDMap-wrapped index.
+
+    Args:
+        embeddings (np.ndarray): (n, dim) normalized float32 vectors.
+        ids (np.ndarray): int64 FAISS ids per row; defaults to row numbers.
+        params (dict): Index parameters (see default_params); missing keys get defaults.
+        train_sample (int): Max vectors sampled for training IVF / PQ.
+        seed (int): Sampling seed, for reproducible builds.
+
+    Returns:
+        tuple: (index, params actually used).
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    n, dim = embeddings.shape
+    params = dict(params or DEFAULT_PARAMS)
+    params = {**default_params(params["type"], n, dim), **params}
+    if params["type"] == "ivf_pq" and n < 2 ** params["nbits"]:
+        print(f"[WARN] {n} vectors is too few to train ivf_pq; falling back to flat.")
+        params = default_params("flat", n, dim)
+
+    base = _make(dim, params)
+    if not base.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = embeddings if n <= train_sample else embeddings[np.sort(rng.choice(n, train_sample, replace=False))]
+        base.train(sample)
+    index = faiss.IndexIDMap(base)
+    if ids is None:
+        ids = np.arange(n, dtype="int64")
+    if n:
+        index.add_with_ids(embeddings, np.asarray(ids, dtype="int64"))
+    apply_search_params(index, params)
+    return index, params
+
+
+def _inner(index):
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_type(index) -> str:
+    """Index type name (one of INDEX_TYPES) of a loaded index."""
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def apply_search_params(index, params: dict) -> None:
+    """Set nprobe / efSearch on a (possibly IndexIDMap-wrapped) index."""
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexIVF) and "nprobe" in params:
+        inner.nprobe = int(params["nprobe"])
+    if isinstance(inner, faiss.IndexHNSW) and "efSearch" in params:
+        inner.hnsw.efSearch = int(params["efSearch"])
+
+
+def search_parameters(index, params: dict, selector=None):
+    """
+    faiss SearchParameters of the right subclass for `index` (IVF and HNSW
+    reject the base class), carrying nprobe / efSearch and an optional IDSelector.
+    """
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexIVF):
+        sp = faiss.SearchParametersIVF()
+        sp.nprobe = int(params.get("nprobe", inner.nprobe))
+    elif isinstance(inner, faiss.IndexHNSW):
+        sp = faiss.SearchParametersHNSW()
+        sp.efSearch = int(params.get("efSearch", inner.hnsw.efSearch))
+    else:
+        sp = faiss.SearchParameters()
+    if selector is not None:
+        sp.sel = selector
+    return sp
+
+
+# -----------------------------
+# Auto-tuning
+# -----------------------------
+def _sweep(params: dict):
+    """Candidate search settings for one built index, cheapest first."""
+    if params["type"].startswith("ivf"):
+        nprobe = 1
+        while nprobe < params["nlist"]:
+            yield {"nprobe": nprobe}
+            nprobe *= 2
+        yield {"nprobe": params["nlist"]}
+    elif params["type"] == "hnsw":
+        for ef in (8, 16, 32, 64, 128, 256, 512):
+            yield {"efSearch": ef}
+    else:
+        yield {}
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Mean fraction of the exact top-k ids recovered per query."""
+    hits = sum(len(np.intersect1d(f[f >= 0], t[t >= 0])) for f, t in zip(found, truth))
+    return hits / max(1, int((truth >= 0).sum()))
+
+
+def autotune(embeddings: np.ndarray, k: int = 5, target_recall: float = 0.95,
+             types=INDEX_TYPES, n_queries: int = 500, seed: int = 0):
+    """
+    Pick the fastest index type + search setting meeting `target_recall` at k.
+
+    Queries are perturbed copies of sampled corpus vectors; ground truth comes
+    from an exact flat search.
+
+    Returns:
+        tuple: (best params or None, list of all measured candidates).
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    n, dim = embeddings.shape
+    rng = np.random.default_rng(seed)
+    q = embeddings[rng.choice(n, min(n_queries, n), replace=False)]
+    q = q + rng.normal(scale=0.05, size=q.shape).astype("float32")
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+
+    exact = faiss.IndexFlatIP(dim)
+    exact.add(embeddings)
+    _, truth = exact.search(q, k)
+
+    results = []
+    for kind in types:
+        try:
+            t0 = time.perf_counter()
+            index, params = build_ann_index(embeddings, params={"type": kind}, seed=seed)
+            build_s = time.perf_counter() - t0
+        except Exception as e:
+            print(f"[WARN] Could not build {kind}: {e}")
+            continue
+        for setting in _sweep(params):
+            cand = {**params, **setting}
+            apply_search_params(index, cand)
+            t0 = time.perf_counter()
+            _, found = index.search(q, k)
+            ms = (time.perf_counter() - t0) * 1000.0 / len(q)
+            results.append({"params": cand, "recall": round(recall_at_k(found, truth), 4),
+                            "ms_per_query": round(ms, 4), "build_s": round(build_s, 2)})
+    ok = [r for r in results if r["recall"] >= target_recall]
+    best = min(ok, key=lambda r: r["ms_per_query"])["params"] if ok else None
+    return best, results
+
+
+def rebuild_store_index(params: dict, data_dir: Path = None) -> None:
+    """
+    Rebuild the embed store's FAISS index from saved embeddings (no re-encoding),
+    keeping the FAISS ids recorded in the metadata.
+    """
+    from embed_store import store_paths, load_chunks
+
+    paths = store_paths(data_dir)
+    embeddings = np.load(paths["embeddings"])
+    meta = load_chunks(paths["meta"])
+    ids = np.array([m.get("faiss_id", i) for i, m in enumerate(meta)], dtype="int64")
+    index, used = build_ann_index(embeddings, ids, params)
+    tmp = paths["index"].with_name(paths["index"].name + ".tmp")
+    faiss.write_index(index, str(tmp))
+    save_params(tmp, used)
+    replace_index(tmp, paths["index"])
+    print(f"✅ Rebuilt {used['type']} index over {index.ntotal} vectors: {used}")
+
+
+if __name__ == "__main__":
+    from embed_store import store_paths
+
+    ap = argparse.ArgumentParser(description="Tune or rebuild the FAISS index type")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    t = sub.add_parser("tune", help="find the fastest setting meeting a target recall@k")
+    t.add_argument("--k", type=int, default=5)
+    t.add_argument("--target-recall", type=float, default=0.95)
+    t.add_argument("--types", default=",".join(INDEX_TYPES))
+    t.add_argument("--queries", type=int, default=500)
+    t.add_argument("--apply", action="store_true", help="rebuild the store index with the winner")
+    r = sub.add_parser("rebuild", help="rebuild the store index with explicit parameters")
+    r.add_argument("--type", choices=INDEX_TYPES, required=True)
+    r.add_argument("--nlist", type=int)
+    r.add_argument("--nprobe", type=int)
+    r.add_argument("--M", type=int)
+    r.add_argument("--efSearch", type=int)
+    r.add_argument("--m", type=int)
+    r.add_argument("--nbits", type=int)
+    args = ap.parse_args()
+
+    if args.cmd == "tune":
+        emb = np.load(store_paths()["embeddings"], mmap_mode="r")
+        best, results = autotune(emb, args.k, args.target_recall, args.types.split(","), args.queries)
+        for res in sorted(results, key=lambda x: x["ms_per_query"]):
+            print(f"{res['ms_per_query']:>9.4f} ms  recall@{args.k}={res['recall']:.3f}  {res['params']}")
+        if best is None:
+            print(f"No setting reached recall@{args.k} >= {args.target_recall}.")
+        else:
+            print("Best:", best)
+            if args.apply:
+                rebuild_store_index(best)
+    else:
+        given = {k: v for k, v in vars(args).items() if k not in ("cmd",) and v is not None}
+        rebuild_store_index(given)
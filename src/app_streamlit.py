@@ -1,39 +1,122 @@
 # src/app_streamlit.py
 
+import time
+_t_start = time.perf_counter()
+
 import streamlit as st
 import json
+import sys
 from pathlib import Path
-from assess_answer import retrieve_top_k, grade_answer
-from generate_questions import generate
-from sentence_transformers import SentenceTransformer
-import faiss
-import numpy as np
+import models  # lazy model registry: nothing is loaded until a mode needs it
 
 # -----------------------------
 # Paths
 # -----------------------------
 DATA_DIR = Path("data")
 TRANSCRIPTS = DATA_DIR / "video_transcripts.jsonl"
-INDEX_PATH = DATA_DIR / "embed_store.pkl"  # <-- debug check
 
 # -----------------------------
-# Auto-build embed index if missing (for Streamlit Cloud)
+# Streamlit page setup
+# -----------------------------
+st.set_page_config(page_title="EdTech RAG MVP")
+st.title("RAG-based EdTech MVP — Economics Chapter")
+
+# -----------------------------
+# Cached resources (shared across reruns and sessions)
 # -----------------------------
-from embed_store import build_embed_store  # make sure this exists in src/embed_store.py
+from embed_store import BackgroundBuild, FAISS_INDEX_FILE as INDEX_PATH, use_shards
+
+
+@st.cache_resource
+def get_build_job():
+    return BackgroundBuild()
+
+
+@st.cache_resource(show_spinner="Loading search index...")
+def get_retrieval():
+    import assess_answer  # resident Retriever + query cache
+    assess_answer.retriever.refresh()
+    return assess_answer
+
+
+@st.cache_data(show_spinner=False)
+def transcript_offsets(path: str, mtime: float) -> list[int]:
+    """Byte offset of every record, so a page of lessons parses only its own lines."""
+    offsets, pos = [], 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                offsets.append(pos)
+            pos += len(line)
+    return offsets
+
+
+@st.cache_data(show_spinner=False)
+def transcript_page(path: str, mtime: float, page: int, page_size: int) -> list[dict]:
+    recs = []
+    with open(path, "rb") as f:
+        for off in transcript_offsets(path, mtime)[page * page_size:(page + 1) * page_size]:
+            f.seek(off)
+            recs.append(json.loads(f.readline()))
+    return recs
+
+
+@st.cache_resource(show_spinner="Loading knowledge graph...")
+def get_knowledge_graph(path: str, mtime: float):
+    from build_graph import KnowledgeGraph
+    return KnowledgeGraph(path)
+
+
+def filter_controls(retriever, key: str) -> dict:
+    """Sidebar controls for metadata-filtered retrieval; returns a filter dict (empty = no filter)."""
+    if not retriever.refresh():
+        return {}
+    fidx = retriever.filters
+    filters = {}
+    with st.sidebar.expander("Filters"):
+        # Stores sharded by book: pick the books to search (subject shards follow the Subject filter)
+        shard_names = getattr(retriever, "names", [])
+        if len(shard_names) > 1 and retriever.manifest.get("shard_by") == "source":
+            filters["shards"] = st.multiselect("Books", shard_names, key=f"{key}_shards")
+        for field in ("subject", "topic", "difficulty"):
+            values = fidx.values(field)
+            if len(values) > 1:
+                filters[field] = st.multiselect(field.capitalize(), values, key=f"{key}_{field}")
+        bounds = fidx.page_bounds()
+        if bounds and bounds[0] < bounds[1]:
+            rng = st.slider("Pages", bounds[0], bounds[1], bounds, key=f"{key}_pages")
+            if tuple(rng) != tuple(bounds):
+                filters["page_range"] = tuple(rng)
+    return {f: v for f, v in filters.items() if v}
 
-if not INDEX_PATH.exists():
-    st.info("⚠️ Index not found. Building embed index now...")
-    try:
-        build_embed_store()  # This should create data/embed_store.pkl
-        st.success("✅ Embed index built successfully!")
-    except Exception as e:
-        st.error(f"Failed to build embed index: {e}")
 
 # -----------------------------
-# Streamlit page setup
+# Auto-build embed index if missing or out of date (for Streamlit Cloud)
+# Runs in a background thread; a lock keeps it to one build at a time and a
+# failed build waits for an explicit retry instead of restarting every rerun.
 # -----------------------------
-st.set_page_config(page_title="EdTech RAG MVP")
-st.title("RAG-based EdTech MVP — Economics Chapter")
+build_job = get_build_job()
+if not use_shards() and build_job.needs_start():  # shards are built with embed_store.py --shard-by
+    build_job.start()  # incremental: only new/changed chunks are encoded
+
+
+build_was_running = build_job.state == "running"
+
+
+@st.fragment(run_every=2 if build_was_running else None)
+def build_status():
+    if build_was_running and build_job.state != "running":
+        st.rerun()  # build finished: full rerun picks up the new index and stops polling
+    if build_job.state == "running":
+        st.progress(build_job.progress, text=f"⏳ Updating embed index in the background: {build_job.message}")
+    elif build_job.state == "failed":
+        st.error(f"Failed to build embed index: {build_job.error}")
+        if st.button("Retry index build"):
+            build_job.start()
+            st.rerun()
+
+
+build_status()
 
 # -----------------------------
 # Debug snippet: check index file
@@ -54,27 +137,56 @@ mode = st.sidebar.selectbox(
 # Mode: Search / QA
 # -----------------------------
 if mode == "Search / QA":
+    # Heavy imports only for the modes that need them; models load in the background
+    retrieval = get_retrieval()
+    retrieve_top_k, query_cache = retrieval.retrieve_top_k, retrieval.query_cache
+    from generate_questions import generate_stream, DECODING
+    from context_packer import pack_prompt, MAX_INPUT_TOKENS
+
+    retrieval_mode = st.sidebar.radio("Retrieval", retrieval.RETRIEVAL_MODES, index=0, horizontal=True,
+                                      help="lexical = BM25 keyword search (no encoder); hybrid = rank fusion of both")
+    # Lexical-only search never needs the sentence encoder
+    models.warm(*(("generator",) if retrieval_mode == "lexical" else ("encoder", "generator")))
+
+    with st.sidebar.expander("Answer generation"):
+        strategy = st.selectbox("Decoding", list(DECODING), index=0)
+        max_new_tokens = st.slider("Max new tokens", 32, 512, 256, step=32)
+        max_input_tokens = st.slider("Context budget (prompt tokens)", 128, MAX_INPUT_TOKENS, MAX_INPUT_TOKENS, step=32)
+    filters = filter_controls(retrieval.retriever, "qa")
+
     query = st.text_input("Enter question for RAG:")
     if st.button("Search & Answer"):
-        results = retrieve_top_k(query, k=5)
+        results, q_emb = retrieve_top_k(query, k=5, return_embedding=True, filters=filters, mode=retrieval_mode)
+        # Cached answers were generated from unfiltered dense results, with these settings
+        use_semantic = q_emb is not None and not filters and retrieval_mode == "dense"
+        gen_settings = {"strategy": strategy, "max_new_tokens": max_new_tokens, "max_input_tokens": max_input_tokens}
+        cached = query_cache.get_semantic(q_emb, gen_settings) if use_semantic else None
+        if cached:
+            results = cached["results"]
+            st.caption(f"♻️ Answer reused from a similar earlier question: \"{cached['query']}\"")
         if not results:
             st.warning("⚠️ No results found. Please check if index is built (`python build_index.py`).")
         else:
             st.subheader("Top retrieved chunks:")
-            context = ""
             for r in results:
                 st.write(f"Page: {r.get('page')} | Topic: {r.get('topic')}")
                 st.write(r.get("text")[:500] + "...")
-                context += "\n\n" + r.get("text")
             try:
-                prompt = (
-                    f"Use the context below to answer the question.\n\n"
-                    f"Context:\n{context}\n\n"
-                    f"Question: {query}\nAnswer in concise points."
-                )
-                answer = generate(prompt)
                 st.subheader("Generated Answer")
-                st.write(answer)
+                if cached:
+                    st.write(cached["answer"])
+                else:
+                    # Deduplicated, query-ranked sentences packed into a fixed token budget
+                    prompt, info = pack_prompt(query, results, q_emb, max_input_tokens)
+                    st.caption(
+                        f"Context: {info['kept']} of {info['sentences']} sentences, "
+                        f"{info['prompt_tokens']}/{max_input_tokens} prompt tokens"
+                    )
+                    # Tokens are rendered as they are decoded
+                    answer = st.write_stream(generate_stream(prompt, strategy, max_new_tokens))
+                    if use_semantic:
+                        query_cache.put_semantic(query, q_emb, results, answer, gen_settings)
+                        query_cache.save()
             except Exception as e:
                 st.error(f"Answer generation failed: {e}")
 
@@ -85,8 +197,11 @@ elif mode == "Lessons":
     st.header("Auto-generated Lesson Pages (videos)")
     if TRANSCRIPTS.exists():
         try:
-            for line in open(TRANSCRIPTS, "r", encoding="utf-8"):
-                rec = json.loads(line)
+            mtime = TRANSCRIPTS.stat().st_mtime
+            page_size = 10
+            n_pages = max(1, -(-len(transcript_offsets(str(TRANSCRIPTS), mtime)) // page_size))
+            page = st.number_input("Page", min_value=1, max_value=n_pages, value=1) if n_pages > 1 else 1
+            for rec in transcript_page(str(TRANSCRIPTS), mtime, page - 1, page_size):
                 with st.expander(
                     f"Video {rec['video_id']} — Key terms: {', '.join(rec.get('keyterms', [])[:5])}"
                 ):
@@ -108,6 +223,11 @@ elif mode == "Lessons":
 # Mode: Assess answer
 # -----------------------------
 elif mode == "Assess answer":
+    retrieval = get_retrieval()
+    retrieve_top_k, grade_answer = retrieval.retrieve_top_k, retrieval.grade_answer
+    models.warm("encoder")
+    filters = filter_controls(retrieval.retriever, "assess")
+
     st.header("Student Answer Assessment")
     question = st.text_input("Question (for context):")
     student_answer = st.text_area("Paste student's answer here:")
@@ -115,11 +235,12 @@ elif mode == "Assess answer":
         if not student_answer.strip():
             st.warning("⚠️ Please enter a student answer.")
         else:
-            refs = [r["text"] for r in retrieve_top_k(question, k=5)]
-            if not refs:
+            rows = [r["row"] for r in retrieve_top_k(question, k=5, filters=filters)]
+            if not rows:
                 st.warning("⚠️ No reference material found. Rebuild the index first.")
             else:
-                score, sims = grade_answer(student_answer, refs)
+                # Reference vectors come from the stored chunk embeddings; only the answer is encoded
+                score, sims = grade_answer(student_answer, reference_rows=rows)
                 st.metric("Score (0-100)", score)
                 st.write("Similarity scores per reference chunk:", sims)
 
@@ -128,8 +249,40 @@ elif mode == "Assess answer":
 # -----------------------------
 elif mode == "Knowledge Graph":
     st.header("Knowledge Graph")
+    graphml = DATA_DIR / "knowledge_graph.graphml"
     gpath = DATA_DIR / "knowledge_graph.png"
-    if gpath.exists():
+    if graphml.exists():
+        kg = get_knowledge_graph(str(graphml), graphml.stat().st_mtime)
+        query = st.text_input("Look up a term:")
+        terms = kg.find_terms(query) if query.strip() else []
+        if query.strip() and not terms:
+            st.warning("⚠️ No matching term in the graph.")
+        if terms:
+            term = st.selectbox("Matching terms", terms)
+            st.write("Related terms (co-occurrence count):")
+            st.table([{"term": n, "weight": w} for n, w in kg.neighbors(term)])
+            st.write("Source chunks:", kg.chunks(term))
+        if gpath.exists():
+            with st.expander("Graph preview"):
+                st.image(str(gpath))
+    elif gpath.exists():
         st.image(str(gpath))
     else:
         st.info("Run build_graph.py to create knowledge graph.")
+
+# -----------------------------
+# Sidebar: Query cache counters (only once retrieval has been imported)
+# -----------------------------
+if "assess_answer" in sys.modules:
+    cache_stats = sys.modules["assess_answer"].query_cache.stats()
+    with st.sidebar.expander("Query cache"):
+        st.write(f"Exact: {cache_stats['exact_hits']} hits / {cache_stats['exact_misses']} misses")
+        st.write(f"Semantic: {cache_stats['semantic_hits']} hits / {cache_stats['semantic_misses']} misses")
+
+# -----------------------------
+# Sidebar: Cold-start / render timing per mode
+# -----------------------------
+with st.sidebar.expander("Timing"):
+    st.write(f"{mode}: page run {time.perf_counter() - _t_start:.2f}s")
+    for name, secs in models.load_times.items():
+        st.write(f"Model load ({name}): {secs:.2f}s")
@@ -1,46 +1,65 @@
 # src/assess_answer.py
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+import argparse
 import json
-from pathlib import Path
-import faiss
 import os
+import time
+from pathlib import Path
+from retriever import Retriever, DATA_DIR, META_FILE, FAISS_INDEX_FILE, MODEL_NAME
+from query_cache import QueryCache
+from embed_store import use_shards
 
-DATA_DIR = Path("../data")
-META_FILE = DATA_DIR / "emb_metadata.jsonl"
-FAISS_INDEX_FILE = DATA_DIR / "faiss_index.index"
-MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+QUERY_CACHE_DIR = DATA_DIR / "query_cache"
 
-model = SentenceTransformer(MODEL_NAME)
+# Long-lived retriever: index + metadata stay loaded between queries; the encoder
+# comes from the shared model registry on first use.
+# (set RAG_INDEX_MMAP=1 to memory-map the index instead of reading it into RAM;
+# RAG_SHARDS=1 searches the per-subject / per-book shards in data/shards/ instead)
+if use_shards():
+    from sharded_retriever import ShardedRetriever
+    retriever = ShardedRetriever(mmap=os.environ.get("RAG_INDEX_MMAP") == "1")
+else:
+    retriever = Retriever(FAISS_INDEX_FILE, META_FILE, mmap=os.environ.get("RAG_INDEX_MMAP") == "1")
+
+# Exact query LRU + semantic answer cache (RAG_QUERY_CACHE_PERSIST=1 keeps it on disk)
+query_cache = QueryCache(
+    threshold=float(os.environ.get("RAG_SEMANTIC_THRESHOLD", "0.92")),
+    path=QUERY_CACHE_DIR if os.environ.get("RAG_QUERY_CACHE_PERSIST") == "1" else None,
+)
 
 
 def load_meta():
-    if not META_FILE.exists():
-        print(f"[WARN] Metadata file {META_FILE} not found. Run build_index.py first.")
-        return []
-    meta = []
-    with open(META_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                meta.append(json.loads(line))
-            except json.JSONDecodeError:
-                continue
-    return meta
+    retriever.refresh()
+    return retriever.meta
 
 
-def grade_answer(student_answer, reference_texts, weights=None):
+def grade_answer(student_answer, reference_texts=None, weights=None, reference_rows=None):
+    """
+    Score a student answer by cosine similarity to reference chunks.
+
+    Pass `reference_rows` (the "row" of retrieve_top_k results) to reuse the
+    stored chunk embeddings, so only the student answer is encoded; raw
+    `reference_texts` are encoded together with the answer.
+    """
     if not student_answer.strip():
         return 0.0, []  # friendly return if empty answer
-    if not reference_texts:
+    if not reference_texts and reference_rows is None:
+        return 0.0, []
+    if reference_rows is not None and len(reference_rows) == 0:
         return 0.0, []
 
     try:
-        all_texts = [student_answer] + reference_texts
-        embs = model.encode(all_texts, convert_to_numpy=True, normalize_embeddings=True)
-        s_emb = embs[0:1]
-        refs = embs[1:]
-        sims = cosine_similarity(s_emb, refs)[0]
+        sims = None
+        if reference_rows is not None:
+            # Scored on the stored (possibly fp16 / int8) vectors, nothing else is encoded
+            s_emb = retriever.encode([student_answer])[0]
+            sims = retriever.scores(reference_rows, s_emb)
+        if sims is None:
+            if reference_texts is None:
+                reference_texts = [r["text"] for r in retriever.lookup(reference_rows)]
+            embs = retriever.encode([student_answer] + list(reference_texts))
+            s_emb, refs = embs[0], embs[1:]
+            sims = refs @ s_emb  # normalized vectors: dot product == cosine similarity
         score = float(sims.mean())  # 0..1
         return round(score * 100, 1), sims.tolist()
     except Exception as e:
@@ -48,30 +67,206 @@ def grade_answer(student_answer, reference_texts, weights=None):
         return 0.0, []
 
 
-def retrieve_top_k(query, k=5):
-    if not FAISS_INDEX_FILE.exists():
-        print(f"[WARN] FAISS index not found at {FAISS_INDEX_FILE}. Run build_index.py first.")
-        return []
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+
+
+def retrieve_top_k(query, k=5, return_embedding=False, filters=None, mode="dense", shards=None):
+    """
+    Top-k metadata records for a query, served from the exact query cache when possible.
+    With return_embedding=True returns (results, query_embedding) for the semantic cache.
+    `filters` (see metadata_filter) restricts the search to matching chunks; the
+    query embedding is still cached, filtered result rows are not.
+    `mode`: "dense" (FAISS), "lexical" (BM25 only; the encoder is never loaded and
+    the returned embedding is None) or "hybrid" (reciprocal rank fusion of both).
+    `shards` limits a sharded store to the named shards (ignored by a single index).
+    """
     if not query.strip():
-        return []
+        return ([], None) if return_embedding else []
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}; choose from {RETRIEVAL_MODES}")
+    if shards:
+        filters = dict(filters or {}, shards=list(shards))
 
     try:
-        q_emb = model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
-        index = faiss.read_index(str(FAISS_INDEX_FILE))
-        D, I = index.search(q_emb, k)
-        meta = load_meta()
-        results = []
-        for idx in I[0]:
-            if 0 <= idx < len(meta):
-                results.append(meta[idx])
-        return results
+        if not retriever.refresh():
+            return ([], None) if return_embedding else []
+        if mode == "lexical" and not retriever.has_lexical:
+            mode = "dense"  # no current BM25 index (warned above); the query path never builds one
+        if mode == "lexical":
+            _, rows = retriever.search_lexical(query, k, filters)
+            results = retriever.lookup(rows)
+            return (results, None) if return_embedding else results
+        query_cache.validate(retriever.fingerprint)
+        hit = query_cache.get_exact(query, k)
+        if mode == "hybrid":
+            q_emb = hit[0] if hit else retriever.encode([query])[0]
+            if not hit:
+                query_cache.put_exact(query, q_emb, [])  # embedding only
+            results = retriever.lookup(retriever.search_hybrid(q_emb, query, k, filters))
+            return (results, q_emb) if return_embedding else results
+        if hit and hit[1] is not None and not filters:
+            q_emb, rows = hit
+        else:
+            q_emb = hit[0] if hit else retriever.encode([query])[0]
+            _, I = retriever.search_vectors(q_emb[None, :], k, filters)
+            rows = I[0]
+            if not filters:
+                query_cache.put_exact(query, q_emb, rows)
+            elif not hit:
+                query_cache.put_exact(query, q_emb, [])  # embedding only
+        results = retriever.lookup(rows)
+        return (results, q_emb) if return_embedding else results
     except Exception as e:
         print(f"[ERROR] Retrieval failed: {e}")
-        return []
+        return ([], None) if return_embedding else []
+
+
+def _grade_block(records, k=5, question_rows=None):
+    """
+    Grade a block of {"question", "answer"} records with batched encodes,
+    one multi-row FAISS search for the distinct new questions and a
+    vectorized similarity computation.
+    """
+    question_rows = {} if question_rows is None else question_rows
+    new_qs = list(dict.fromkeys(r.get("question", "") for r in records if r.get("question", "").strip()))
+    new_qs = [q for q in new_qs if q not in question_rows]
+    if new_qs:
+        _, I = retriever.search_vectors(retriever.encode(new_qs), k)
+        question_rows.update(zip(new_qs, I))
+
+    answers = [r.get("answer", "") or "" for r in records]
+    graded = [i for i, a in enumerate(answers) if a.strip() and _has_refs(question_rows, records[i])]
+    out = [{"score": 0.0, "sims": [], "rows": []} for _ in records]
+    if not graded:
+        return out
+
+    rows = np.stack([question_rows[records[i]["question"]] for i in graded])  # (n, k), -1 = missing
+    a_embs = retriever.encode([answers[i] for i in graded])                 # (n, dim)
+    sims = retriever.scores(np.where(rows >= 0, rows, 0), a_embs)           # (n, k)
+    if sims is None:
+        raise RuntimeError("No stored embeddings available for grading")
+    valid = rows >= 0
+    scores = np.where(valid, sims, 0.0).sum(1) / np.maximum(valid.sum(1), 1)
+    for j, i in enumerate(graded):
+        out[i] = {
+            "score": round(float(scores[j]) * 100, 1),
+            "sims": sims[j][valid[j]].tolist(),
+            "rows": rows[j][valid[j]].tolist(),
+        }
+    return out
+
+
+def _has_refs(question_rows, rec):
+    q = rec.get("question", "")
+    return q in question_rows and (question_rows[q] >= 0).any()
+
+
+_worker_question_rows = {}
+
+
+def _init_worker(threads):
+    import torch
+    torch.set_num_threads(threads)
+
+
+def _grade_block_worker(args):
+    lines, records, k = args
+    return lines, records, _grade_block(records, k, _worker_question_rows)
+
+
+def _read_blocks(path, skip, batch_size):
+    # (input line numbers, records) per block; the records are left exactly as read
+    lines, block = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            if line_no < skip or not line.strip():
+                continue
+            lines.append(line_no)
+            block.append(json.loads(line))
+            if len(block) >= batch_size:
+                yield lines, block
+                lines, block = [], []
+    if block:
+        yield lines, block
+
+
+def grade_batch(in_path, out_path=None, k=5, batch_size=256, workers=1):
+    """
+    Grade a JSONL file of {"question", "answer", ...} records.
+
+    Results are appended to `out_path` (default: <input>.graded.jsonl) as each
+    block finishes; rerunning resumes after the last graded input line. Each
+    output record's "line" is its input line number (it replaces an input
+    field of that name).
+
+    Args:
+        in_path (Path): Input JSONL file.
+        out_path (Path): Output JSONL file.
+        k (int): Reference chunks per question.
+        batch_size (int): Records per encode / search block.
+        workers (int): Worker processes (each loads its own encoder).
+    """
+    in_path = Path(in_path)
+    out_path = Path(out_path) if out_path else in_path.with_suffix(".graded.jsonl")
+    skip = 0
+    if out_path.exists():
+        good = 0
+        with open(out_path, "rb") as f:
+            for line in f:
+                try:
+                    skip = json.loads(line)["line"] + 1
+                    good += len(line)
+                except (json.JSONDecodeError, KeyError):
+                    break
+        with open(out_path, "r+b") as f:
+            f.truncate(good)  # drop a partial last line from an interrupted run
+    if skip:
+        print(f"Resuming after input line {skip}.")
+
+    blocks = ((lines, b, k) for lines, b in _read_blocks(in_path, skip, batch_size))
+    if workers > 1:
+        import multiprocessing as mp
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        pool = mp.get_context("spawn").Pool(workers, initializer=_init_worker, initargs=(threads,))
+        graded_blocks = pool.imap(_grade_block_worker, blocks)
+    else:
+        pool = None
+        graded_blocks = map(_grade_block_worker, blocks)
+
+    n, t0 = 0, time.perf_counter()
+    try:
+        with open(out_path, "a", encoding="utf-8") as f:
+            for lines, block, results in graded_blocks:  # in input order, even with several workers
+                for line_no, rec, res in zip(lines, block, results):
+                    out = {key: val for key, val in rec.items() if key != "answer"}
+                    out.update(res)
+                    out["line"] = line_no  # resume key last, so an input "line" field cannot shadow it
+                    f.write(json.dumps(out, ensure_ascii=False) + "\n")
+                f.flush()
+                n += len(block)
+                print(f"Graded {n} answers ({n / (time.perf_counter() - t0):.1f}/s)")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    print(f"✅ Wrote {n} graded answers to {out_path}")
 
 
 if __name__ == "__main__":
-    refs = [r["text"] for r in retrieve_top_k("What is inflation?", k=5)]
-    s = "Inflation is rise in general price level due to increased money supply and demand."
-    score, sims = grade_answer(s, refs)
-    print("Score:", score, "sims:", sims)
+    ap = argparse.ArgumentParser(description="Retrieve reference chunks and grade student answers")
+    sub = ap.add_subparsers(dest="cmd")
+    gb = sub.add_parser("grade-batch", help="grade a JSONL file of {question, answer} records")
+    gb.add_argument("answers", help="input JSONL with question/answer fields")
+    gb.add_argument("--out", help="output JSONL (default: <answers>.graded.jsonl)")
+    gb.add_argument("--k", type=int, default=5)
+    gb.add_argument("--batch-size", type=int, default=256)
+    gb.add_argument("--workers", type=int, default=1)
+    args = ap.parse_args()
+
+    if args.cmd == "grade-batch":
+        grade_batch(args.answers, args.out, args.k, args.batch_size, args.workers)
+    else:
+        rows = [r["row"] for r in retrieve_top_k("What is inflation?", k=5)]
+        s = "Inflation is rise in general price level due to increased money supply and demand."
+        score, sims = grade_answer(s, reference_rows=rows)
+        print("Score:", score, "sims:", sims)
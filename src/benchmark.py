@@ -0,0 +1,425 @@
+# src/benchmark.py
+"""
+Benchmark Suite
+---------------
+Reproducible timings for every pipeline stage on the deterministic synthetic
+corpus (synthetic_corpus.py), so a performance change can be measured and
+compared across commits. Nothing reads the real data/ files.
+
+Stages:
+- ingest:   ingest_pdf.load_pdf on a generated PDF (pages/sec per backend)
+- chunk:    chunker.simple_chunk (words/sec) and chunker.run with / without dedup
+- embed:    embed_store.build_index, full and no-op incremental, per scale
+- retrieve: assess_answer.retrieve_top_k p50/p95/p99 latency and QPS per scale
+            (dense, filtered, lexical, hybrid, and exact-cache hits)
+- grade:    assess_answer.grade_answer with stored reference rows and with texts
+- generate: generate_questions.generate latency (greedy, LRU cache cleared)
+- graph:    build_graph.build_graph, cold and with the keyword cache
+
+Chunk corpora and stores are generated once per (scale, seed, encoder) under
+data/benchmarks/work/ and reused. With --encoder hashing (default) the
+shared encoder is synthetic_corpus.HashingEncoder, so runs at 1k / 100k / 1M
+chunks work offline; --encoder model times the real all-MiniLM-L6-v2.
+Latencies are single-client (one query at a time); QPS = queries / total time.
+
+Results are saved as JSON (data/benchmarks/<time>-<commit>.json). A run
+with --baseline, or the compare command, flags every latency that grew /
+throughput that dropped by more than --threshold and exits with status 1.
+
+Usage:
+    python benchmark.py run                                        # all stages, 1k chunks
+    python benchmark.py run --scales 1000 100000 1000000 --stages embed retrieve grade
+    python benchmark.py run --baseline ../data/benchmarks/base.json --threshold 0.2
+    python benchmark.py compare old.json new.json --threshold 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+import synthetic_corpus as sc
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT_DIR / "data"
+BENCH_DIR = DATA_DIR / "benchmarks"
+WORK_DIR = BENCH_DIR / "work"
+
+STAGES = ("ingest", "chunk", "embed", "retrieve", "grade", "generate", "graph")
+SCALES = (1000,)
+QUERIES = 200          # timed retrievals / gradings per scale and mode
+WARMUP = 10
+K = 5
+PDF_PAGES = 50
+CHUNK_PAGES = 2000     # pages fed to chunker.run
+GEN_PROMPTS = 8
+GEN_TOKENS = 64
+GRAPH_CHUNKS = 2000    # YAKE is ~ms per chunk: the graph stage uses a fixed-size corpus
+THRESHOLD = 0.2        # relative change counted as a regression
+MIN_DELTA_MS = 0.1     # smaller latency changes are timer / scheduler noise, never regressions
+RESULTS_VERSION = 1
+
+# Metric name suffix -> direction: +1 higher is better, -1 lower is better
+_DIRECTIONS = (("_ms", -1), ("_s", -1), ("per_sec", 1), ("qps", 1))
+
+
+def latency_stats(seconds) -> dict:
+    """p50 / p95 / p99 / mean latency in ms and sequential QPS of per-call durations."""
+    s = np.asarray(seconds, dtype="float64")
+    ms = s * 1000.0
+    return {"n": int(len(s)), "p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(ms, 95)), 3), "p99_ms": round(float(np.percentile(ms, 99)), 3),
+            "mean_ms": round(float(ms.mean()), 3), "qps": round(float(len(s) / s.sum()), 1) if s.sum() else 0.0}
+
+
+def _time_calls(fn, items, warmup=WARMUP) -> dict:
+    for x in items[:warmup]:
+        fn(x)
+    durations = []
+    for x in items[warmup:]:
+        t0 = time.perf_counter()
+        fn(x)
+        durations.append(time.perf_counter() - t0)
+    return latency_stats(durations)
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def _rate(n, seconds):
+    return round(n / seconds, 1) if seconds else 0.0
+
+
+def environment(encoder: str) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    import faiss
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "faiss": getattr(faiss, "__version__", None), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "encoder": encoder}
+
+
+# ---------------------------------------------------------------- corpus / stores
+
+def corpus_path(n: int, seed: int, work: Path = WORK_DIR) -> Path:
+    """Chunk JSONL of the synthetic corpus, generated on first use."""
+    path = Path(work) / f"chunks-{n}-s{seed}.jsonl"
+    if not path.exists():
+        print(f"Generating {n} synthetic chunks -> {path}")
+        tmp = path.with_name(path.name + ".tmp")
+        sc.write_jsonl(sc.iter_chunks(n, seed), tmp)
+        os.replace(tmp, path)
+    return path
+
+
+def store_dir(n: int, seed: int, encoder: str, work: Path = WORK_DIR) -> Path:
+    return Path(work) / f"store-{n}-s{seed}-{encoder}"
+
+
+def _load_chunks(n, seed, work):
+    from embed_store import load_chunks
+    return load_chunks(corpus_path(n, seed, work))
+
+
+def _build_store(chunks, data_dir: Path, incremental=False):
+    from embed_store import build_index
+    Path(data_dir).mkdir(parents=True, exist_ok=True)
+    build_index(chunks, incremental=incremental, data_dir=data_dir)
+
+
+def _retriever(data_dir: Path):
+    # Point assess_answer at the benchmark store with an empty query cache
+    import assess_answer as aa
+    from embed_store import store_paths
+    from query_cache import QueryCache
+    from retriever import Retriever
+    paths = store_paths(data_dir)
+    aa.retriever = Retriever(paths["index"], paths["meta"])
+    aa.query_cache = QueryCache()
+    return aa
+
+
+# ---------------------------------------------------------------- stages
+
+def bench_ingest(work: Path, seed: int, pages: int = PDF_PAGES) -> dict:
+    from ingest_pdf import load_pdf
+    pdf = Path(work) / f"synthetic-{pages}p-s{seed}.pdf"
+    if not pdf.exists():
+        sc.write_pdf(pdf, pages, seed)
+    out = {"pages": pages}
+    for backend in ("pymupdf", "pypdf2"):
+        try:
+            load_pdf(pdf, backend)  # warm imports / file cache
+        except ImportError as e:
+            out[backend] = {"skipped": str(e)}
+            continue
+        best = min(_timed(lambda: load_pdf(pdf, backend))[1] for _ in range(3))
+        out[backend] = {"seconds": round(best, 4), "pages_per_sec": _rate(pages, best)}
+    return out
+
+
+def bench_chunk(work: Path, seed: int, pages: int = CHUNK_PAGES) -> dict:
+    import chunker
+    text = "\n".join(sc.page_text(i, seed) for i in range(min(pages, 200)))
+    words = len(text.split())
+    chunks, secs = min((_timed(lambda: chunker.simple_chunk(text)) for _ in range(3)), key=lambda x: x[1])
+    in_path = Path(work) / f"pages-{pages}-s{seed}.jsonl"
+    if not in_path.exists():
+        sc.write_jsonl(sc.iter_pages(pages, seed), in_path)
+    out = {"simple_chunk": {"words": words, "seconds": round(secs, 4), "words_per_sec": _rate(words, secs)}}
+    for dedup in (False, True):
+        stats, secs = _timed(lambda: chunker.run(dedup=dedup, in_path=in_path,
+                                                 out_path=Path(work) / "emb_chunks.jsonl"))
+        out["run_dedup" if dedup else "run"] = {"pages": pages, "chunks": stats["chunks"], "seconds": round(secs, 3),
+                                                "pages_per_sec": _rate(pages, secs)}
+    return out
+
+
+def bench_embed(chunks, data_dir: Path) -> dict:
+    shutil.rmtree(data_dir, ignore_errors=True)
+    _, full = _timed(lambda: _build_store(chunks, data_dir))
+    _, noop = _timed(lambda: _build_store(chunks, data_dir, incremental=True))
+    return {"chunks": len(chunks), "full_s": round(full, 3), "chunks_per_sec": _rate(len(chunks), full),
+            "incremental_noop_s": round(noop, 3)}
+
+
+def bench_retrieve(data_dir: Path, seed: int, n_queries: int = QUERIES, k: int = K) -> dict:
+    from query_cache import QueryCache
+    aa = _retriever(data_dir)
+    _, load = _timed(aa.retriever.refresh)
+    qs = sc.queries(n_queries + WARMUP, seed)
+    topic = sc._TOPIC_NAMES[0]
+    out = {"load_s": round(load, 3)}
+    # Every mode starts with an empty query cache, so each query is encoded once
+    for mode in aa.RETRIEVAL_MODES:
+        aa.query_cache = QueryCache()
+        out[mode] = _time_calls(lambda q: aa.retrieve_top_k(q, k, mode=mode), qs)
+        if mode == "dense":
+            out["dense_cached"] = _time_calls(lambda q: aa.retrieve_top_k(q, k), qs)  # all exact-cache hits
+    aa.query_cache = QueryCache()
+    out["dense_filtered"] = _time_calls(lambda q: aa.retrieve_top_k(q, k, filters={"topic": [topic]}), qs)
+    return out
+
+
+def bench_grade(data_dir: Path, seed: int, n: int = QUERIES, k: int = K) -> dict:
+    aa = _retriever(data_dir)
+    qs = sc.queries(n + WARMUP, seed)
+    ans = sc.answers(n + WARMUP, seed)
+    refs = [aa.retrieve_top_k(q, k) for q in qs]
+    items = list(zip(ans, refs))
+    return {
+        "stored_rows": _time_calls(lambda x: aa.grade_answer(x[0], reference_rows=[r["row"] for r in x[1]]), items),
+        "reference_texts": _time_calls(lambda x: aa.grade_answer(x[0], reference_texts=[r["text"] for r in x[1]]),
+                                       items),
+    }
+
+
+def bench_generate(seed: int, n: int = GEN_PROMPTS, max_new_tokens: int = GEN_TOKENS) -> dict:
+    import generate_questions as gq
+    from models import get_generator, load_times
+    get_generator()
+    gq._cache.clear()
+    prompts = [gq.mcq_prompt(t) for t in sc.answers(n + 2, seed, n_words=120)]
+    stats = _time_calls(lambda p: gq.generate(p, strategy="greedy", max_new_tokens=max_new_tokens), prompts, warmup=2)
+    return {"load_s": load_times.get("generator"), "max_new_tokens": max_new_tokens, "greedy": stats}
+
+
+def bench_graph(work: Path, seed: int, n: int = GRAPH_CHUNKS, workers: int = 1) -> dict:
+    from build_graph import build_graph
+    meta = Path(work) / f"graph-meta-{n}-s{seed}.jsonl"
+    if not meta.exists():
+        sc.write_jsonl(sc.iter_chunks(n, seed), meta)
+    cache, graphml = Path(work) / "keyword_cache.json", Path(work) / "knowledge_graph.graphml"
+    if cache.exists():
+        cache.unlink()
+    run = lambda: build_graph(workers=workers, png=False, meta_file=meta, out_graphml=graphml, cache_path=cache)
+    G, cold = _timed(run)
+    _, warm = _timed(run)
+    return {"chunks": n, "workers": workers, "terms": G.number_of_nodes(), "cold_s": round(cold, 3),
+            "chunks_per_sec": _rate(n, cold), "cached_s": round(warm, 3)}
+
+
+# ---------------------------------------------------------------- run / compare
+
+def run(stages=STAGES, scales=SCALES, seed: int = sc.SEED, encoder: str = "hashing", queries: int = QUERIES,
+        work: Path = WORK_DIR, graph_workers: int = 1) -> dict:
+    """
+    Run the selected stages and return the results document.
+
+    Args:
+        stages (list[str]): Subset of STAGES.
+        scales (list[int]): Corpus sizes (chunks) for embed / retrieve / grade.
+        seed (int): Synthetic corpus seed.
+        encoder (str): "hashing" (offline stand-in) or "model" (all-MiniLM-L6-v2).
+        queries (int): Timed queries / answers per scale.
+        work (Path): Directory for generated corpora and stores.
+        graph_workers (int): YAKE processes for the graph stage.
+    """
+    work = Path(work)
+    work.mkdir(parents=True, exist_ok=True)
+    if encoder == "hashing":
+        from models import register
+        register("encoder", sc.HashingEncoder())
+        # Offline run: a generator that is not in the local model cache fails at once instead of retrying
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    results = {"version": RESULTS_VERSION, "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+               "env": environment(encoder),
+               "config": {"stages": list(stages), "scales": list(scales), "seed": seed, "queries": queries, "k": K},
+               "stages": {}}
+    out = results["stages"]
+
+    def _stage(name, fn, *key):
+        print(f"== {name} {' '.join(map(str, key))}")
+        try:
+            res = fn()
+        except (ImportError, OSError) as e:
+            res = {"skipped": f"{type(e).__name__}: {e}"}
+            print(f"[WARN] {name} skipped: {e}")
+        node = out.setdefault(name, {})
+        for part in key[:-1]:
+            node = node.setdefault(part, {})
+        if key:
+            node[key[-1]] = res
+        else:
+            out[name] = res
+
+    if "ingest" in stages:
+        _stage("ingest", lambda: bench_ingest(work, seed))
+    if "chunk" in stages:
+        _stage("chunk", lambda: bench_chunk(work, seed))
+    for n in scales:
+        if not {"embed", "retrieve", "grade"} & set(stages):
+            break
+        chunks = _load_chunks(n, seed, work)
+        data_dir = store_dir(n, seed, encoder, work)
+        if "embed" in stages:
+            _stage("embed", lambda: bench_embed(chunks, data_dir), str(n))
+        elif not (data_dir / "emb_manifest.json").exists():
+            print(f"Building benchmark store for {n} chunks (not timed)")
+            _build_store(chunks, data_dir)
+        del chunks
+        if "retrieve" in stages:
+            _stage("retrieve", lambda: bench_retrieve(data_dir, seed, queries), str(n))
+        if "grade" in stages:
+            _stage("grade", lambda: bench_grade(data_dir, seed, queries), str(n))
+    if "generate" in stages:
+        _stage("generate", lambda: bench_generate(seed))
+    if "graph" in stages:
+        _stage("graph", lambda: bench_graph(work, seed, workers=graph_workers))
+    return results
+
+
+def flatten(node, prefix="") -> dict:
+    """{"retrieve.1000.dense.p95_ms": value, ...} for every numeric leaf."""
+    out = {}
+    for key, value in node.items():
+        name = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            out.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def _direction(name: str) -> int:
+    for suffix, d in _DIRECTIONS:
+        if name.endswith(suffix):
+            return d
+    return 0
+
+
+def compare(baseline: dict, current: dict, threshold: float = THRESHOLD) -> list[dict]:
+    """
+    Metrics that got worse by more than `threshold` (relative) since `baseline`.
+
+    Latencies / durations (*_ms, *_s) regress when they grow, throughputs
+    (*per_sec, qps) when they drop; counts are ignored. Only metrics present
+    in both documents are compared; latency changes under MIN_DELTA_MS are ignored.
+
+    Returns:
+        list[dict]: {"metric", "baseline", "current", "change"} per regression.
+    """
+    old, new = flatten(baseline.get("stages", {})), flatten(current.get("stages", {}))
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        d, a, b = _direction(name), old[name], new[name]
+        if d == 0 or a <= 0:
+            continue
+        change = (b - a) / a
+        delta_ms = (b - a) * (1000.0 if name.endswith("_s") else 1.0)
+        if d < 0 and delta_ms < MIN_DELTA_MS:
+            continue
+        if -d * change > threshold:
+            regressions.append({"metric": name, "baseline": a, "current": b, "change": round(change, 3)})
+    return regressions
+
+
+def report_regressions(baseline: dict, current: dict, threshold: float) -> bool:
+    """Print the comparison; True if there are regressions."""
+    for key in ("config", "env"):
+        b, c = baseline.get(key, {}), current.get(key, {})
+        diff = {k: (b.get(k), c.get(k)) for k in sorted(b.keys() | c.keys())
+                if b.get(k) != c.get(k) and k not in ("commit", "stages")}
+        if diff:
+            print(f"[WARN] {key} differs from the baseline: {diff}")
+    regressions = compare(baseline, current, threshold)
+    shared = len(flatten(baseline.get("stages", {})).keys() & flatten(current.get("stages", {})).keys())
+    if not regressions:
+        print(f"✅ No regressions beyond {threshold:.0%} ({shared} metrics compared)")
+        return False
+    print(f"⚠️ {len(regressions)} regressions beyond {threshold:.0%} ({shared} metrics compared):")
+    for r in regressions:
+        print(f"  {r['metric']:<45} {r['baseline']:>12} -> {r['current']:<12} ({r['change']:+.0%})")
+    return True
+
+
+def _load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark every pipeline stage on a synthetic corpus")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="run benchmarks and save the results as JSON")
+    r.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    r.add_argument("--scales", nargs="+", type=int, default=list(SCALES), help="corpus sizes in chunks")
+    r.add_argument("--encoder", choices=["hashing", "model"], default="hashing",
+                   help="hashing: offline stand-in encoder; model: all-MiniLM-L6-v2")
+    r.add_argument("--queries", type=int, default=QUERIES)
+    r.add_argument("--seed", type=int, default=sc.SEED)
+    r.add_argument("--graph-workers", type=int, default=1)
+    r.add_argument("--work-dir", default=str(WORK_DIR))
+    r.add_argument("--out", help="results file (default: data/benchmarks/<time>-<commit>.json)")
+    r.add_argument("--baseline", help="results file to check for regressions")
+    r.add_argument("--threshold", type=float, default=THRESHOLD)
+    c = sub.add_parser("compare", help="check a results file against a baseline")
+    c.add_argument("baseline")
+    c.add_argument("current")
+    c.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = ap.parse_args()
+
+    if args.cmd == "compare":
+        raise SystemExit(1 if report_regressions(_load(args.baseline), _load(args.current), args.threshold) else 0)
+
+    results = run(args.stages, args.scales, args.seed, args.encoder, args.queries, Path(args.work_dir),
+                  args.graph_workers)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    out = Path(args.out) if args.out else BENCH_DIR / f"{stamp}-{results['env']['commit'] or 'nogit'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results saved to {out}")
+    if args.baseline and report_regressions(_load(args.baseline), results, args.threshold):
+        raise SystemExit(1)
@@ -0,0 +1,219 @@
+# src/bm25_index.py
+"""
+BM25 Index Module
+-----------------
+Sparse lexical index over the embed store's chunks, saved next to the FAISS
+index, for exact-term queries ("GDP deflator", "Laffer curve") that do not
+need a transformer encode.
+
+Postings are stored CSR-style in flat NumPy arrays: for term t, rows
+docs[indptr[t]:indptr[t + 1]] with precomputed BM25 weights in the same
+slice, so a query is a few array slices plus one bincount over the matching
+postings. Rows are metadata rows (aligned with emb_metadata.jsonl and FAISS).
+
+Files (next to faiss_index.index):
+- faiss_index.bm25.npz         indptr (int64), docs (int32), weights (float32)
+- faiss_index.bm25.json        vocabulary, parameters, source fingerprint
+
+Usage:
+    python bm25_index.py                      # rebuild from emb_metadata.jsonl
+    python bm25_index.py --query "GDP deflator" --k 5
+"""
+
+import argparse
+import json
+import re
+import time
+from array import array
+from pathlib import Path
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT_DIR / "data"
+META_FILE = DATA_DIR / "emb_metadata.jsonl"
+FAISS_INDEX_FILE = DATA_DIR / "faiss_index.index"
+
+K1, B = 1.2, 0.75
+RRF_K = 60  # reciprocal rank fusion constant
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what "
+    "which who why how when where with do does did not no can will".split()
+)
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased alphanumeric tokens without stopwords."""
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+def bm25_paths(index_path: Path = FAISS_INDEX_FILE) -> tuple[Path, Path]:
+    """(postings .npz, vocabulary .json) stored next to a FAISS index file."""
+    index_path = Path(index_path)
+    return index_path.with_name(index_path.stem + ".bm25.npz"), index_path.with_name(index_path.stem + ".bm25.json")
+
+
+def _fingerprint(path: Path):
+    try:
+        st = Path(path).stat()
+        return [st.st_mtime_ns, st.st_size]
+    except FileNotFoundError:
+        return None
+
+
+def build_bm25(records, index_path: Path = FAISS_INDEX_FILE, source=None, k1: float = K1, b: float = B) -> int:
+    """
+    Build and save the BM25 index for `records` (chunk dicts in metadata row order).
+
+    Returns:
+        int: Number of indexed rows.
+    """
+    vocab = {}
+    terms, docs, tfs = array("i"), array("i"), array("i")
+    lengths = array("i")
+    for row, rec in enumerate(records):
+        toks = tokenize(rec.get("text", ""))
+        lengths.append(len(toks))
+        counts = {}
+        for t in toks:
+            tid = vocab.setdefault(t, len(vocab))
+            counts[tid] = counts.get(tid, 0) + 1
+        for tid, c in counts.items():
+            terms.append(tid)
+            docs.append(row)
+            tfs.append(c)
+
+    n = len(lengths)
+    terms_a = np.frombuffer(terms, dtype="int32") if terms else np.zeros(0, "int32")
+    docs_a = np.frombuffer(docs, dtype="int32") if docs else np.zeros(0, "int32")
+    tf = np.frombuffer(tfs, dtype="int32").astype("float32") if tfs else np.zeros(0, "float32")
+    dl = np.frombuffer(lengths, dtype="int32").astype("float32") if n else np.zeros(0, "float32")
+
+    order = np.argsort(terms_a, kind="stable")  # group postings by term, rows stay ascending
+    terms_a, docs_a, tf = terms_a[order], docs_a[order], tf[order]
+    counts = np.bincount(terms_a, minlength=len(vocab))
+    indptr = np.zeros(len(vocab) + 1, dtype="int64")
+    np.cumsum(counts, out=indptr[1:])
+    df = counts.astype("float32")
+    idf = np.log1p((n - df + 0.5) / (df + 0.5))
+    avgdl = float(dl.mean()) if n else 0.0
+    norm = k1 * (1.0 - b + b * dl[docs_a] / max(avgdl, 1e-9))
+    weights = (idf[terms_a] * tf * (k1 + 1.0) / (tf + norm)).astype("float32")
+
+    npz_path, json_path = bm25_paths(index_path)
+    tmp_npz = npz_path.with_name(npz_path.name + ".tmp.npz")
+    np.savez(tmp_npz, indptr=indptr, docs=docs_a.astype("int32"), weights=weights)
+    tmp_json = json_path.with_name(json_path.name + ".tmp")
+    with open(tmp_json, "w", encoding="utf-8") as f:
+        json.dump({"rows": n, "k1": k1, "b": b, "avgdl": avgdl, "source": source, "vocab": list(vocab)}, f)
+    tmp_npz.replace(npz_path)
+    tmp_json.replace(json_path)
+    return n
+
+
+def build_from_jsonl(meta_path: Path = META_FILE, index_path: Path = FAISS_INDEX_FILE) -> int:
+    """Build the BM25 index from an emb_metadata.jsonl file."""
+    def _records():
+        with open(meta_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    return build_bm25(_records(), index_path, _fingerprint(meta_path))
+
+
+def is_current(index_path: Path = FAISS_INDEX_FILE, meta_path: Path = META_FILE) -> bool:
+    """True if a saved BM25 index exists and was built from the current metadata file."""
+    npz_path, json_path = bm25_paths(index_path)
+    if not (npz_path.exists() and json_path.exists()):
+        return False
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            source = json.load(f).get("source")
+    except (OSError, json.JSONDecodeError):
+        return False
+    current = _fingerprint(meta_path)
+    return current is None or source == current
+
+
+class BM25Index:
+    """
+    Loaded BM25 index.
+
+    Args:
+        index_path (Path): FAISS index file the BM25 files sit next to.
+    """
+
+    def __init__(self, index_path: Path = FAISS_INDEX_FILE):
+        npz_path, json_path = bm25_paths(index_path)
+        with open(json_path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+        self.n = int(info["rows"])
+        self.vocab = {t: i for i, t in enumerate(info["vocab"])}
+        arrays = np.load(npz_path)
+        self.indptr, self.docs, self.weights = arrays["indptr"], arrays["docs"], arrays["weights"]
+
+    def search(self, query: str, k: int = 5, allowed: np.ndarray = None):
+        """
+        Top-k rows by BM25 score.
+
+        Args:
+            query (str): Free-text query.
+            k (int): Number of results.
+            allowed (np.ndarray): Optional sorted rows to restrict to (metadata filter).
+
+        Returns:
+            tuple: (scores, rows) 1-D arrays of length <= k, best first.
+        """
+        tids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not tids:
+            return np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+        docs = np.concatenate([self.docs[self.indptr[t]:self.indptr[t + 1]] for t in tids])
+        weights = np.concatenate([self.weights[self.indptr[t]:self.indptr[t + 1]] for t in tids])
+        if allowed is not None:
+            keep = np.isin(docs, allowed, assume_unique=False)
+            docs, weights = docs[keep], weights[keep]
+            if not len(docs):
+                return np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+        rows, inv = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inv, weights=weights).astype("float32")
+        kk = min(k, len(rows))
+        top = np.argpartition(-scores, kk - 1)[:kk]
+        top = top[np.lexsort((rows[top], -scores[top]))]
+        return scores[top], rows[top].astype("int64")
+
+
+def rrf(rankings, k: int = 5, c: int = RRF_K) -> list[int]:
+    """
+    Reciprocal rank fusion of several ranked row lists (best first).
+
+    Returns:
+        list[int]: Top-k fused rows.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            row = int(row)
+            if row >= 0:
+                fused[row] = fused.get(row, 0.0) + 1.0 / (c + rank + 1)
+    return [r for r, _ in sorted(fused.items(), key=lambda x: (-x[1], x[0]))[:k]]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Build or query the BM25 index")
+    ap.add_argument("--meta", default=str(META_FILE))
+    ap.add_argument("--index", default=str(FAISS_INDEX_FILE))
+    ap.add_argument("--query")
+    ap.add_argument("--k", type=int, default=5)
+    args = ap.parse_args()
+
+    if args.query is None:
+        t0 = time.perf_counter()
+        n = build_from_jsonl(Path(args.meta), Path(args.index))
+        print(f"✅ BM25 index over {n} chunks saved next to {args.index} ({time.perf_counter() - t0:.1f}s)")
+    else:
+        bm = BM25Index(Path(args.index))
+        t0 = time.perf_counter()
+        scores, rows = bm.search(args.query, args.k)
+        print(f"{(time.perf_counter() - t0) * 1000:.3f} ms")
+        for s, r in zip(scores, rows):
+            print(f"{s:8.3f}  row {r}")
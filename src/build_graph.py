@@ -1,30 +1,132 @@
 # src/build_graph.py
+"""
+Knowledge Graph Module
+----------------------
+Keyword co-occurrence graph over the embedded chunks.
+
+- Keywords are extracted with YAKE in a process pool (one extractor per
+  worker) and cached by chunk content hash, so reruns only process new or
+  changed chunks.
+- The graph is saved as GraphML (reloadable, with edge weights and the chunk
+  ids each term came from) next to the PNG preview.
+- KnowledgeGraph loads the saved graph for fast term / neighbour lookups
+  (used by the "Knowledge Graph" mode of the app).
+
+Usage:
+    python build_graph.py [--workers 4] [--no-png]
+    python build_graph.py --neighbors "inflation"
+"""
+
+import argparse
+import bisect
+import hashlib
 import json
+import multiprocessing as mp
+import os
 from pathlib import Path
-import yake
 import networkx as nx
-import matplotlib.pyplot as plt
-from collections import defaultdict
 
-DATA_DIR = Path("../data")
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT_DIR / "data"
 META_FILE = DATA_DIR / "emb_metadata.jsonl"
 OUT_GRAPH_PNG = DATA_DIR / "knowledge_graph.png"
+OUT_GRAPHML = DATA_DIR / "knowledge_graph.graphml"
+KEYWORD_CACHE = DATA_DIR / "keyword_cache.json"
+MAX_KW = 3
+PNG_MAX_NODES = 200  # largest terms drawn in the preview image
+
+_extractor = None  # (max_kw, yake.KeywordExtractor) of this process
 
-def extract_keywords(text, max_kw=3):
-    kw_extractor = yake.KeywordExtractor(lan="en", n=2, top=max_kw)
-    kws = kw_extractor.extract_keywords(text)
+
+def _cache_key(text, max_kw):
+    return hashlib.sha1(f"{max_kw}|{text}".encode("utf-8")).hexdigest()
+
+
+def extract_keywords(text, max_kw=MAX_KW):
+    # One extractor per process, created on first use
+    global _extractor
+    if _extractor is None or _extractor[0] != max_kw:
+        import yake
+        _extractor = (max_kw, yake.KeywordExtractor(lan="en", n=2, top=max_kw))
+    kws = _extractor[1].extract_keywords(text)
     return [k for k, score in kws]
 
-def build_graph():
+
+def _extract_many(args):
+    texts, max_kw = args
+    return [extract_keywords(t, max_kw) for t in texts]
+
+
+def load_keyword_cache(path=KEYWORD_CACHE):
+    if not Path(path).exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"[WARN] Ignoring unreadable keyword cache {path}: {e}")
+        return {}
+
+
+def save_keyword_cache(cache, path=KEYWORD_CACHE):
+    tmp = Path(path).with_name(Path(path).name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def keywords_for(texts, max_kw=MAX_KW, workers=1, cache_path=KEYWORD_CACHE, batch_size=64):
+    """
+    Keywords per text, reusing cached results by content hash.
+
+    Args:
+        texts (list[str]): Chunk texts.
+        max_kw (int): Keywords per chunk.
+        workers (int): Extraction processes for uncached texts.
+        cache_path (Path): JSON cache file; None disables caching.
+        batch_size (int): Texts per worker task.
+
+    Returns:
+        tuple: (list of keyword lists, number of texts actually extracted).
+    """
+    cache = load_keyword_cache(cache_path) if cache_path else {}
+    keys = [_cache_key(t, max_kw) for t in texts]
+    todo = list(dict.fromkeys(k for k in keys if k not in cache))
+    if todo:
+        by_key = {k: t for k, t in zip(keys, texts)}
+        batches = [([by_key[k] for k in todo[i:i + batch_size]], max_kw) for i in range(0, len(todo), batch_size)]
+        if workers > 1 and len(batches) > 1:
+            with mp.get_context("spawn").Pool(workers) as pool:
+                results = pool.map(_extract_many, batches)
+        else:
+            results = map(_extract_many, batches)
+        for (batch, _), kws in zip(batches, results):
+            for t, kw in zip(batch, kws):
+                cache[_cache_key(t, max_kw)] = kw
+        if cache_path:
+            # Keep only entries for current chunks so the cache does not grow forever
+            live = set(keys)
+            save_keyword_cache({k: v for k, v in cache.items() if k in live}, cache_path)
+    return [cache[k] for k in keys], len(todo)
+
+
+def build_graph(workers=1, png=True, meta_file=META_FILE, out_graphml=OUT_GRAPHML, out_png=OUT_GRAPH_PNG,
+                cache_path=KEYWORD_CACHE):
     docs = []
-    with open(META_FILE, "r", encoding="utf-8") as f:
+    with open(meta_file, "r", encoding="utf-8") as f:
         for line in f:
             docs.append(json.loads(line))
+    all_kws, n_new = keywords_for([d["text"] for d in docs], MAX_KW, workers, cache_path)
+    print(f"Keywords: {n_new} chunks extracted, {len(docs) - n_new} from cache")
+
     G = nx.Graph()
-    for d in docs:
-        kws = extract_keywords(d["text"], max_kw=3)
+    for d, kws in zip(docs, all_kws):
+        cid = str(d.get("id"))
         for k in kws:
-            G.add_node(k)
+            if k not in G:
+                G.add_node(k, count=0, chunks=[])
+            G.nodes[k]["count"] += 1
+            G.nodes[k]["chunks"].append(cid)
         # connect co-occurring keywords
         for i, a in enumerate(kws):
             for b in kws[i+1:]:
@@ -32,6 +134,27 @@ def build_graph():
                     G[a][b]['weight'] += 1
                 else:
                     G.add_edge(a,b, weight=1)
+
+    # GraphML has no list type: chunk ids are stored as a JSON string
+    H = G.copy()
+    for _, attrs in H.nodes(data=True):
+        attrs["chunks"] = json.dumps(attrs["chunks"], ensure_ascii=False)
+    tmp = Path(out_graphml).with_name(Path(out_graphml).name + ".tmp")
+    nx.write_graphml(H, tmp)
+    os.replace(tmp, out_graphml)
+    print("Saved graph to", out_graphml, f"({G.number_of_nodes()} terms, {G.number_of_edges()} edges)")
+    if png:
+        draw_graph(G, out_png)
+    return G
+
+
+def draw_graph(G, out_png=OUT_GRAPH_PNG, max_nodes=PNG_MAX_NODES):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    if G.number_of_nodes() > max_nodes:
+        top = sorted(G.nodes, key=lambda n: G.degree(n, weight="weight"), reverse=True)[:max_nodes]
+        G = G.subgraph(top)
     plt.figure(figsize=(12,12))
     pos = nx.spring_layout(G, k=0.8)
     nx.draw_networkx_nodes(G, pos, node_size=500)
@@ -40,8 +163,66 @@ def build_graph():
     weights = [G[u][v]['weight'] for u,v in edges]
     nx.draw_networkx_edges(G, pos, width=[1 + w*0.2 for w in weights])
     plt.axis('off')
-    plt.savefig(OUT_GRAPH_PNG, bbox_inches='tight')
-    print("Saved graph to", OUT_GRAPH_PNG)
+    plt.savefig(out_png, bbox_inches='tight')
+    plt.close()
+    print("Saved graph to", out_png)
+
+
+class KnowledgeGraph:
+    """
+    Saved keyword graph with term and neighbour lookups.
+
+    Args:
+        path (Path): GraphML file written by build_graph().
+    """
+
+    def __init__(self, path=OUT_GRAPHML):
+        self.graph = nx.read_graphml(path)
+        self._terms = sorted((n.lower(), n) for n in self.graph.nodes)
+        self._keys = [t for t, _ in self._terms]
+
+    def __contains__(self, term):
+        return term in self.graph
+
+    def find_terms(self, query, limit=20):
+        """Terms starting with `query` (case-insensitive), then terms containing it, most frequent first."""
+        q = query.strip().lower()
+        if not q:
+            return []
+        i = bisect.bisect_left(self._keys, q)
+        prefix = []
+        while i < len(self._keys) and self._keys[i].startswith(q):
+            prefix.append(self._terms[i][1])
+            i += 1
+        seen = set(prefix)
+        contains = [n for k, n in self._terms if q in k and n not in seen] if len(prefix) < limit else []
+        count = lambda n: -int(self.graph.nodes[n].get("count", 0))
+        return (sorted(prefix, key=count) + sorted(contains, key=count))[:limit]
+
+    def neighbors(self, term, top=10):
+        """[(neighbour, co-occurrence weight)] of `term`, strongest first."""
+        if term not in self.graph:
+            return []
+        adj = self.graph[term]
+        return sorted(((n, int(a.get("weight", 1))) for n, a in adj.items()), key=lambda x: -x[1])[:top]
+
+    def chunks(self, term):
+        """Ids of the chunks a term was extracted from."""
+        if term not in self.graph:
+            return []
+        return json.loads(self.graph.nodes[term].get("chunks", "[]"))
+
 
 if __name__ == "__main__":
-    build_graph()
+    ap = argparse.ArgumentParser(description="Build or query the keyword knowledge graph")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    ap.add_argument("--no-png", action="store_true", help="skip the PNG preview")
+    ap.add_argument("--neighbors", metavar="TERM", help="print the neighbours of a term in the saved graph")
+    args = ap.parse_args()
+
+    if args.neighbors:
+        kg = KnowledgeGraph()
+        for term in kg.find_terms(args.neighbors, limit=1):
+            print(term, "->", kg.neighbors(term))
+    else:
+        build_graph(workers=args.workers, png=not args.no_png)
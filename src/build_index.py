@@ -8,22 +8,25 @@ from pathlib import Path
 import numpy as np
 import faiss
 from tqdm import tqdm
-from sentence_transformers import SentenceTransformer
+from models import get_encoder
 from ingest_pdf import load_pdf
+from ann_index import build_ann_index, save_params
+from compact_embeddings import build_compact
 
 # =====================
 # Configuration
 # =====================
 ROOT_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = ROOT_DIR / "data"
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 INDEX_PATH = DATA_DIR / "faiss_index.index"
 EMBEDDINGS_PATH = DATA_DIR / "embeddings.npy"
+INDEX_PARAMS = {"type": "flat"}  # or "ivf_flat", "hnsw", "ivf_pq" (see ann_index.py)
+EMB_DTYPE = "fp32"  # or "fp16" / "int8": compact memory-mapped copy for retrieval (see compact_embeddings.py)
 
 # =====================
 # Load Model
 # =====================
-model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+model = get_encoder()  # shared registry instance (all-MiniLM-L6-v2)
 
 # =====================
 # Collect PDFs
@@ -44,20 +47,20 @@ for pdf_file in tqdm(pdf_files, desc="Loading PDFs"):
 # Compute Embeddings
 # =====================
 print("Computing embeddings...")
-embeddings = model.encode(documents, show_progress_bar=True)
+embeddings = model.encode(documents, show_progress_bar=True, normalize_embeddings=True)
 embeddings = np.array(embeddings).astype("float32")
 
 # Save embeddings for future use
 np.save(EMBEDDINGS_PATH, embeddings)
+build_compact(EMBEDDINGS_PATH, EMB_DTYPE)
 
 # =====================
 # Build FAISS Index
 # =====================
-dimension = embeddings.shape[1]
-index = faiss.IndexFlatL2(dimension)
-index.add(embeddings)
+index, params = build_ann_index(embeddings, params=INDEX_PARAMS)
 faiss.write_index(index, str(INDEX_PATH))
+save_params(INDEX_PATH, params)
 
-print(f"FAISS index built successfully with {len(documents)} documents.")
+print(f"FAISS {params['type']} index built successfully with {len(documents)} documents.")
 print(f"Index saved to: {INDEX_PATH}")
 print(f"Embeddings saved to: {EMBEDDINGS_PATH}")
@@ -0,0 +1,224 @@
+# src/chunk_store.py
+"""
+Chunk Store Module
+------------------
+Compact, memory-mapped, random-access storage for chunk metadata, so mapping
+FAISS results back to chunks costs O(k) instead of parsing every line of
+emb_metadata.jsonl (or unpickling a full list).
+
+Layout of data/chunk_store/:
+- text.bin + text.offsets.npy     UTF-8 chunk texts in one blob, int64 offsets (n + 1)
+- id.bin + id.offsets.npy         chunk ids, same scheme
+- extra.bin + extra.offsets.npy   remaining fields per row as JSON (often empty)
+- page.npy, faiss_id.npy          typed columns (page -1 = unknown)
+- subject/topic/difficulty.npy    int32 dictionary codes (-1 = None)
+- manifest.json                   row count, dictionaries, source fingerprint
+
+Rows are in the same order as emb_metadata.jsonl / embeddings.npy.
+
+Usage:
+    python make_store.py
+    store = ChunkStore(STORE_DIR); store[42]["text"]; store.column("topic")
+"""
+
+import json
+import mmap
+import os
+import shutil
+from array import array
+from pathlib import Path
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT_DIR / "data"
+META_FILE = DATA_DIR / "emb_metadata.jsonl"
+STORE_DIR = DATA_DIR / "chunk_store"
+MANIFEST_NAME = "manifest.json"
+
+BLOB_FIELDS = ("text", "id", "extra")
+CODED_FIELDS = ("subject", "topic", "difficulty")  # dictionary-encoded strings
+STORE_VERSION = 1
+
+
+def source_fingerprint(path: Path):
+    """(mtime_ns, size) of the metadata file the store was built from."""
+    try:
+        st = Path(path).stat()
+        return [st.st_mtime_ns, st.st_size]
+    except FileNotFoundError:
+        return None
+
+
+def build_chunk_store(records, out_dir: Path = STORE_DIR, source=None) -> int:
+    """
+    Write records (an iterable of chunk dicts) into a chunk store, streaming.
+
+    The store is built next to `out_dir` and swapped in when complete.
+
+    Args:
+        records (iterable): Chunk dicts in FAISS row order.
+        out_dir (Path): Store directory.
+        source (list): Fingerprint of the metadata file the records came from.
+
+    Returns:
+        int: Number of rows written.
+    """
+    out_dir = Path(out_dir)
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    blobs = {f: open(tmp / f"{f}.bin", "wb") for f in BLOB_FIELDS}
+    offsets = {f: array("q", [0]) for f in BLOB_FIELDS}
+    codes = {f: array("i") for f in CODED_FIELDS}
+    vocab = {f: {} for f in CODED_FIELDS}
+    pages, faiss_ids = array("i"), array("q")
+    n = 0
+    try:
+        for row, rec in enumerate(records):
+            rec = dict(rec)
+            extra = {k: v for k, v in rec.items()
+                     if k not in ("text", "id", "page", "faiss_id") + CODED_FIELDS}
+            values = {
+                "text": rec.get("text") or "",
+                "id": "" if rec.get("id") is None else str(rec["id"]),
+                "extra": json.dumps(extra, ensure_ascii=False) if extra else "",
+            }
+            for f in BLOB_FIELDS:
+                data = values[f].encode("utf-8")
+                blobs[f].write(data)
+                offsets[f].append(offsets[f][-1] + len(data))
+            for f in CODED_FIELDS:
+                v = rec.get(f)
+                codes[f].append(-1 if v is None else vocab[f].setdefault(v, len(vocab[f])))
+            page = rec.get("page")
+            pages.append(page if isinstance(page, int) else -1)
+            faiss_ids.append(int(rec.get("faiss_id", row)))
+            n += 1
+    finally:
+        for fh in blobs.values():
+            fh.close()
+
+    for f in BLOB_FIELDS:
+        np.save(tmp / f"{f}.offsets.npy", np.frombuffer(offsets[f], dtype="int64"))
+    for f in CODED_FIELDS:
+        np.save(tmp / f"{f}.npy", np.frombuffer(codes[f], dtype="int32") if n else np.zeros(0, "int32"))
+    np.save(tmp / "page.npy", np.frombuffer(pages, dtype="int32") if n else np.zeros(0, "int32"))
+    np.save(tmp / "faiss_id.npy", np.frombuffer(faiss_ids, dtype="int64") if n else np.zeros(0, "int64"))
+    manifest = {
+        "version": STORE_VERSION,
+        "rows": n,
+        "vocab": {f: list(vocab[f]) for f in CODED_FIELDS},
+        "source": source,
+    }
+    with open(tmp / MANIFEST_NAME, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False)
+
+    old = out_dir.with_name(out_dir.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if out_dir.exists():
+        os.replace(out_dir, old)
+    os.replace(tmp, out_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    return n
+
+
+def _iter_jsonl(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def build_from_jsonl(meta_path: Path = META_FILE, out_dir: Path = STORE_DIR) -> int:
+    """Build the chunk store from an emb_metadata.jsonl file."""
+    source = source_fingerprint(meta_path)
+    return build_chunk_store(_iter_jsonl(meta_path), out_dir, source)
+
+
+def is_current(store_dir: Path = STORE_DIR, meta_path: Path = META_FILE) -> bool:
+    """
+    True if a store exists and was built from the current metadata file
+    (or the metadata file is gone and the store is all there is).
+    """
+    manifest = Path(store_dir) / MANIFEST_NAME
+    if not manifest.exists():
+        return False
+    try:
+        with open(manifest, "r", encoding="utf-8") as f:
+            m = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return False
+    current = source_fingerprint(meta_path)
+    return m.get("version") == STORE_VERSION and (current is None or m.get("source") == current)
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped chunk store; behaves like a list of metadata dicts.
+
+    Args:
+        path (Path): Store directory written by build_chunk_store().
+    """
+
+    def __init__(self, path: Path = STORE_DIR):
+        self.path = Path(path)
+        with open(self.path / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self._rows = int(self.manifest["rows"])
+        self._vocab = self.manifest["vocab"]
+        self._offsets = {f: np.load(self.path / f"{f}.offsets.npy", mmap_mode="r") for f in BLOB_FIELDS}
+        self._blobs = {f: self._map(self.path / f"{f}.bin") for f in BLOB_FIELDS}
+        self._columns = {f: np.load(self.path / f"{f}.npy", mmap_mode="r")
+                         for f in CODED_FIELDS + ("page", "faiss_id")}
+
+    @staticmethod
+    def _map(path: Path):
+        if path.stat().st_size == 0:
+            return b""
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _blob(self, field: str, row: int) -> str:
+        off = self._offsets[field]
+        return self._blobs[field][int(off[row]):int(off[row + 1])].decode("utf-8")
+
+    def text(self, row: int) -> str:
+        return self._blob("text", row)
+
+    def column(self, name: str) -> np.ndarray:
+        """Memory-mapped column: dictionary codes for subject/topic/difficulty, else values."""
+        return self._columns[name]
+
+    def vocab(self, name: str) -> list:
+        """Dictionary of a coded column (code -> value)."""
+        return self._vocab[name]
+
+    def __getitem__(self, row: int) -> dict:
+        row = int(row)
+        if row < 0:
+            row += self._rows
+        if not 0 <= row < self._rows:
+            raise IndexError(row)
+        rec = {"id": self._blob("id", row)}
+        for f in CODED_FIELDS:
+            code = int(self._columns[f][row])
+            rec[f] = None if code < 0 else self._vocab[f][code]
+        page = int(self._columns["page"][row])
+        rec["page"] = None if page < 0 else page
+        rec["text"] = self._blob("text", row)
+        extra = self._blob("extra", row)
+        if extra:
+            rec.update(json.loads(extra))
+        rec["faiss_id"] = int(self._columns["faiss_id"][row])
+        return rec
+
+    def __iter__(self):
+        return (self[i] for i in range(self._rows))
+
+    def rows(self, rows) -> list[dict]:
+        """Records for several rows (O(len(rows)))."""
+        return [self[r] for r in rows]
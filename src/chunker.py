@@ -6,6 +6,7 @@ from tqdm import tqdm
 DATA_DIR = Path("../data")
 IN_JSONL = DATA_DIR / "chunks.jsonl"
 OUT_CHUNKS = DATA_DIR / "emb_chunks.jsonl"
+DEDUP_THRESHOLD = 0.85  # estimated Jaccard of word 5-grams; 1.0 merges only (near-)identical chunks
 
 def simple_chunk(text, chunk_size=800, overlap=200):
     tokens = text.split()
@@ -27,28 +28,95 @@ def heuristic_topic(text):
     # fallback
     return None
 
-def run():
-    out = []
-    with open(IN_JSONL, "r", encoding="utf-8") as f:
+def chunk_records(pages):
+    """Yield chunk records for an iterable of page records, one page at a time."""
+    for obj in pages:
+        chunks = simple_chunk(obj["text"], chunk_size=300, overlap=50)  # smaller for better retrieval
+        topic = heuristic_topic(obj["text"])
+        for i, c in enumerate(chunks):
+            rec = {
+                "id": f"{obj['id']}_chunk_{i}",
+                "subject": obj.get("subject", "Economics"),
+                "topic": topic or "General",
+                "subtopic": None,
+                "difficulty": "medium",  # default; you can refine with heuristics
+                "page": obj["page"],
+                "text": c
+            }
+            if obj.get("source"):
+                rec["source"] = obj["source"]  # book the page came from (shard key)
+            yield rec
+
+def read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
         for line in f:
-            obj = json.loads(line)
-            chunks = simple_chunk(obj["text"], chunk_size=300, overlap=50)  # smaller for better retrieval
-            topic = heuristic_topic(obj["text"])
-            for i, c in enumerate(chunks):
-                rec = {
-                    "id": f"{obj['id']}_chunk_{i}",
-                    "subject": obj.get("subject", "Economics"),
-                    "topic": topic or "General",
-                    "subtopic": None,
-                    "difficulty": "medium",  # default; you can refine with heuristics
-                    "page": obj["page"],
-                    "text": c
-                }
-                out.append(rec)
-    with open(OUT_CHUNKS, "w", encoding="utf-8") as f:
-        for r in out:
+            yield json.loads(line)
+
+def find_duplicates(records, threshold=DEDUP_THRESHOLD):
+    """
+    First pass of dedup: cluster near-duplicate chunks.
+    Returns ({dropped chunk id: representative id}, {representative id: [pages]}, total count).
+    """
+    from dedup import NearDuplicateIndex
+    index = NearDuplicateIndex(threshold=threshold)
+    rep_ids, dropped, pages = [], {}, {}
+    n = 0
+    for r in tqdm(records, desc="Dedup", unit="chunk"):
+        n += 1
+        rep = index.add(r["text"])
+        if rep is None:
+            rep_ids.append(r["id"])
+            pages[r["id"]] = [r["page"]]
+        else:
+            dropped[r["id"]] = rep_ids[rep]
+            if r["page"] not in pages[rep_ids[rep]]:
+                pages[rep_ids[rep]].append(r["page"])
+    return dropped, pages, n
+
+def _encode_seconds_per_chunk(texts):
+    # Time the real encoder on a sample to turn dropped chunks into seconds saved
+    import time
+    from models import get_encoder
+    model = get_encoder()
+    model.encode(texts[:2])
+    t0 = time.perf_counter()
+    model.encode(texts, batch_size=64)
+    return (time.perf_counter() - t0) / max(1, len(texts))
+
+def run(dedup=True, threshold=DEDUP_THRESHOLD, measure=False, in_path=IN_JSONL, out_path=OUT_CHUNKS):
+    dropped, pages, total = ({}, {}, None)
+    if dedup:
+        # Two streaming passes: cluster, then write representatives with their page lists
+        dropped, pages, total = find_duplicates(chunk_records(read_jsonl(in_path)), threshold)
+    members = {}
+    for cid, rep in dropped.items():
+        members.setdefault(rep, []).append(cid)
+    n = 0
+    sample = []
+    with open(out_path, "w", encoding="utf-8") as f:
+        for r in chunk_records(read_jsonl(in_path)):
+            if r["id"] in dropped:
+                if len(sample) < 64:
+                    sample.append(r["text"])
+                continue
+            if dedup:
+                r["pages"] = sorted(pages[r["id"]], key=lambda p: (p is None, p))
+                r["duplicates"] = members.get(r["id"], [])
             f.write(json.dumps(r, ensure_ascii=False) + "\n")
-    print("Wrote", len(out), "chunks to", OUT_CHUNKS)
+            n += 1
+    print("Wrote", n, "chunks to", out_path)
+    if dedup and total:
+        msg = f"Dedup (threshold {threshold}): dropped {len(dropped)} of {total} chunks ({100.0 * len(dropped) / total:.1f}%)"
+        if measure and sample:
+            msg += f", saving ~{len(dropped) * _encode_seconds_per_chunk(sample):.1f}s of embedding time"
+        print(msg)
+    return {"chunks": n, "dropped": len(dropped), "total": total if dedup else n}
 
 if __name__ == "__main__":
-    run()
+    import argparse
+    ap = argparse.ArgumentParser(description="Chunk page records and drop near-duplicate chunks")
+    ap.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD, help="near-duplicate similarity (0..1)")
+    ap.add_argument("--no-dedup", action="store_true")
+    ap.add_argument("--measure", action="store_true", help="time the encoder to report embedding time saved")
+    args = ap.parse_args()
+    run(dedup=not args.no_dedup, threshold=args.threshold, measure=args.measure)
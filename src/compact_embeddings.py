@@ -0,0 +1,323 @@
+# src/compact_embeddings.py
+"""
+Compact Embeddings Module
+-------------------------
+fp16 or int8 copy of embeddings.npy for retrieval-time use: half or a quarter
+of the bytes, memory-mapped so every Streamlit / grading worker process
+shares the same pages through the OS cache instead of holding its own copy.
+
+- fp16: vectors stored as float16.
+- int8: per-dimension scalar quantization. Dimension d is mapped linearly
+  from [min_d, max_d] onto the 256 int8 codes; x ~= code * scale + offset.
+- Dot products run on the codes: q . x ~= codes . (q * scale) + q . offset,
+  so scoring only casts the rows it reads to float32 (in blocks) and never
+  builds a dequantized copy of the matrix.
+- embeddings.npy (fp32) stays the source of truth for incremental builds and
+  index rebuilds; the compact store records its fingerprint and is ignored
+  by the Retriever once embeddings.npy changes.
+
+Layout of data/emb_compact/:
+- vectors.npy          (n, dim) float16 or int8
+- scale.npy, offset.npy  (dim,) float32 (int8 only)
+- manifest.json        dtype, rows, dim, source fingerprint
+
+Usage:
+    python compact_embeddings.py build --dtype int8
+    python compact_embeddings.py report --k 10        # memory saved, ranking vs fp32
+    store = CompactEmbeddings(COMPACT_DIR); store.dot(q, rows); store[rows]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+import numpy as np
+from chunk_store import source_fingerprint
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT_DIR / "data"
+EMB_FILE = DATA_DIR / "embeddings.npy"
+COMPACT_DIR = DATA_DIR / "emb_compact"
+MANIFEST_NAME = "manifest.json"
+
+DTYPES = ("fp32", "fp16", "int8")  # "fp32" = no compact store
+STORE_VERSION = 1
+BLOCK_ROWS = 16384  # rows cast to float32 at a time while encoding / scanning
+_NP_DTYPES = {"fp16": np.float16, "int8": np.int8}
+
+
+def compact_path(emb_path: Path) -> Path:
+    """Compact store directory that belongs to an embeddings.npy file."""
+    return Path(emb_path).with_name(COMPACT_DIR.name)
+
+
+def read_manifest(store_dir: Path = COMPACT_DIR):
+    path = Path(store_dir) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def stored_dtype(store_dir: Path = COMPACT_DIR) -> str:
+    """dtype of an existing compact store, "fp32" if there is none."""
+    m = read_manifest(store_dir)
+    return m["dtype"] if m and m.get("version") == STORE_VERSION else "fp32"
+
+
+def is_current(store_dir: Path = COMPACT_DIR, emb_path: Path = EMB_FILE) -> bool:
+    """
+    True if a compact store exists and was built from the current embeddings
+    file (or that file is gone and the store is all there is).
+    """
+    m = read_manifest(store_dir)
+    if not m or m.get("version") != STORE_VERSION:
+        return False
+    current = source_fingerprint(emb_path)
+    return current is None or m.get("source") == current
+
+
+def int8_params(emb: np.ndarray, block: int = BLOCK_ROWS):
+    """
+    Per-dimension scale and offset mapping [min_d, max_d] onto int8 codes,
+    computed in one blocked pass (works on a memory-mapped array).
+
+    Returns:
+        tuple: (scale, offset) float32 arrays of shape (dim,).
+    """
+    lo = np.full(emb.shape[1], np.inf, dtype="float32")
+    hi = np.full(emb.shape[1], -np.inf, dtype="float32")
+    for s in range(0, len(emb), block):
+        b = np.asarray(emb[s:s + block], dtype="float32")
+        np.minimum(lo, b.min(axis=0), out=lo)
+        np.maximum(hi, b.max(axis=0), out=hi)
+    if not len(emb):
+        lo[:], hi[:] = 0.0, 0.0
+    scale = (hi - lo) / 255.0
+    scale[scale <= 0] = 1.0  # constant dimension: every code decodes to its value
+    offset = lo + 128.0 * scale  # code -128 -> min_d, code 127 -> max_d
+    return scale.astype("float32"), offset.astype("float32")
+
+
+def quantize_int8(x: np.ndarray, scale: np.ndarray, offset: np.ndarray) -> np.ndarray:
+    """int8 codes of float vectors for the given per-dimension scale / offset."""
+    codes = np.rint((np.asarray(x, dtype="float32") - offset) / scale)
+    return np.clip(codes, -128, 127).astype(np.int8)
+
+
+def build_compact(emb_path: Path = EMB_FILE, dtype: str = "int8", out_dir: Path = None,
+                  block: int = BLOCK_ROWS) -> dict:
+    """
+    Write the compact store for an embeddings.npy file, streaming in blocks.
+
+    The store is built next to `out_dir` and swapped in when complete;
+    dtype "fp32" removes an existing store instead.
+
+    Args:
+        emb_path (Path): fp32 embeddings (n, dim).
+        dtype (str): "fp16" or "int8" ("fp32" deletes the compact store).
+        out_dir (Path): Store directory; defaults to emb_compact/ next to emb_path.
+        block (int): Rows converted at a time.
+
+    Returns:
+        dict: The store manifest (None for "fp32").
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown embedding dtype {dtype!r}; choose from {DTYPES}")
+    out_dir = Path(out_dir) if out_dir else compact_path(emb_path)
+    if dtype == "fp32":
+        if out_dir.exists():
+            shutil.rmtree(out_dir)
+        return None
+    emb = np.load(emb_path, mmap_mode="r")
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+    vectors = np.lib.format.open_memmap(tmp / "vectors.npy", mode="w+", dtype=_NP_DTYPES[dtype], shape=emb.shape)
+    if dtype == "int8":
+        scale, offset = int8_params(emb, block)
+        np.save(tmp / "scale.npy", scale)
+        np.save(tmp / "offset.npy", offset)
+    for s in range(0, len(emb), block):
+        b = np.asarray(emb[s:s + block], dtype="float32")
+        vectors[s:s + len(b)] = quantize_int8(b, scale, offset) if dtype == "int8" else b
+    vectors.flush()
+    del vectors
+    manifest = {"version": STORE_VERSION, "dtype": dtype, "rows": int(emb.shape[0]), "dim": int(emb.shape[1]),
+                "source": source_fingerprint(emb_path)}
+    with open(tmp / MANIFEST_NAME, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    os.replace(tmp, out_dir)
+    return manifest
+
+
+class CompactEmbeddings:
+    """
+    Read-only, memory-mapped fp16 / int8 embeddings with scoring kernels.
+
+    Indexing (store[rows]) returns dequantized float32 rows, so it can stand
+    in for the fp32 array; dot() and row_dot() score on the stored codes.
+
+    Args:
+        path (Path): Store directory written by build_compact().
+    """
+
+    def __init__(self, path: Path = COMPACT_DIR):
+        self.path = Path(path)
+        with open(self.path / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.dtype = self.manifest["dtype"]
+        self.codes = np.load(self.path / "vectors.npy", mmap_mode="r")
+        if self.dtype == "int8":
+            self.scale = np.load(self.path / "scale.npy")
+            self.offset = np.load(self.path / "offset.npy")
+        else:
+            self.scale = self.offset = None
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def shape(self) -> tuple:
+        return self.codes.shape
+
+    @property
+    def ndim(self) -> int:
+        return 2
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes on disk / in the page cache (vectors plus scale parameters)."""
+        extra = 0 if self.scale is None else self.scale.nbytes + self.offset.nbytes
+        return int(self.codes.nbytes) + extra
+
+    def __getitem__(self, rows) -> np.ndarray:
+        x = np.asarray(self.codes[rows], dtype="float32")
+        if self.dtype == "int8":
+            x *= self.scale
+            x += self.offset
+        return x
+
+    def _fold(self, q: np.ndarray):
+        # (weights applied to the codes, constant term) per query
+        if self.dtype == "int8":
+            return q * self.scale, q @ self.offset
+        return q, None
+
+    def dot(self, q: np.ndarray, rows=None, block: int = BLOCK_ROWS) -> np.ndarray:
+        """
+        Scores of queries against stored vectors.
+
+        Args:
+            q (np.ndarray): (n, dim) float32 queries.
+            rows (np.ndarray): Rows to score; None scans the whole store.
+            block (int): Rows cast to float32 at a time.
+
+        Returns:
+            np.ndarray: (n, len(rows)) float32 dot products.
+        """
+        q = np.atleast_2d(np.asarray(q, dtype="float32"))
+        w, const = self._fold(q)
+        n = len(self) if rows is None else len(rows)
+        out = np.empty((len(q), n), dtype="float32")
+        for s in range(0, n, block):
+            sel = slice(s, s + block) if rows is None else rows[s:s + block]
+            out[:, s:s + block] = w @ np.asarray(self.codes[sel], dtype="float32").T
+        if const is not None:
+            out += const[:, None]
+        return out
+
+    def row_dot(self, rows: np.ndarray, q: np.ndarray) -> np.ndarray:
+        """
+        Each query scored against its own rows: rows (n, k), q (n, dim) -> (n, k).
+        """
+        rows = np.asarray(rows, dtype="int64")
+        q = np.asarray(q, dtype="float32")
+        w, const = self._fold(q)
+        codes = np.asarray(self.codes[rows.ravel()], dtype="float32").reshape(*rows.shape, -1)
+        out = np.einsum("nkd,nd->nk", codes, w)
+        if const is not None:
+            out += const[:, None]
+        return out
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, 1), axis=1), 1)
+
+
+def compare(emb_path: Path = EMB_FILE, store_dir: Path = None, k: int = 10, n_queries: int = 200,
+            noise: float = 0.05, seed: int = 0) -> dict:
+    """
+    Memory and ranking effect of the compact store against fp32.
+
+    Queries are stored vectors plus Gaussian noise (renormalized), so no
+    encoder is needed; both stores are scanned exactly.
+
+    Returns:
+        dict: Sizes, recall@k of the fp32 top-k, top-1 agreement, score error
+        and full-scan time per query for both.
+    """
+    store = CompactEmbeddings(store_dir or compact_path(emb_path))
+    emb = np.load(emb_path, mmap_mode="r")
+    rng = np.random.default_rng(seed)
+    k = min(k, len(emb))
+    q = np.asarray(emb[np.sort(rng.choice(len(emb), min(n_queries, len(emb)), replace=False))], dtype="float32")
+    q = q + rng.normal(0, noise, q.shape).astype("float32")
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+
+    t0 = time.perf_counter()
+    exact = np.concatenate([q @ np.asarray(emb[s:s + BLOCK_ROWS], dtype="float32").T
+                            for s in range(0, len(emb), BLOCK_ROWS)], axis=1)
+    t_fp32 = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    approx = store.dot(q)
+    t_compact = time.perf_counter() - t0
+
+    truth, got = _top_k(exact, k), _top_k(approx, k)
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(truth, got)])
+    err = np.abs(np.take_along_axis(approx, truth, 1) - np.take_along_axis(exact, truth, 1))
+    fp32_bytes = int(emb.nbytes)
+    return {
+        "dtype": store.dtype, "rows": int(len(emb)), "dim": int(emb.shape[1]),
+        "fp32_mb": round(fp32_bytes / 2**20, 2), "compact_mb": round(store.nbytes / 2**20, 2),
+        "saved_pct": round(100 * (1 - store.nbytes / max(fp32_bytes, 1)), 1),
+        "k": k, "queries": len(q), f"recall@{k}": round(float(recall), 4),
+        "top1_agreement": round(float(np.mean(truth[:, 0] == got[:, 0])), 4),
+        "mean_abs_score_err": float(f"{err.mean():.2e}"), "max_abs_score_err": float(f"{err.max():.2e}"),
+        "scan_ms_per_query_fp32": round(1000 * t_fp32 / len(q), 3),
+        "scan_ms_per_query_compact": round(1000 * t_compact / len(q), 3),
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Build / evaluate the fp16 / int8 compact embedding store")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="write data/emb_compact/ from embeddings.npy")
+    b.add_argument("--dtype", choices=DTYPES, default="int8", help="fp32 removes the compact store")
+    b.add_argument("--emb", default=str(EMB_FILE))
+    r = sub.add_parser("report", help="memory saved and ranking effect vs fp32")
+    r.add_argument("--emb", default=str(EMB_FILE))
+    r.add_argument("--k", type=int, default=10)
+    r.add_argument("--queries", type=int, default=200)
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        m = build_compact(args.emb, args.dtype)
+        if m is None:
+            print(f"✅ Compact store removed ({args.emb} is used as is)")
+            raise SystemExit(0)
+        print(f"✅ Wrote {compact_path(args.emb)} ({m['rows']} x {m['dim']} {m['dtype']})")
+        print(json.dumps(compare(args.emb), indent=2))
+    else:
+        if not is_current(compact_path(args.emb), args.emb):
+            raise SystemExit(f"No up-to-date compact store for {args.emb}; run `compact_embeddings.py build` first.")
+        print(json.dumps(compare(args.emb, k=args.k, n_queries=args.queries), indent=2))
@@ -0,0 +1,148 @@
+# src/context_packer.py
+"""
+Context Packer Module
+---------------------
+Turns retrieved chunks into a prompt that fits the generator's input window
+exactly, instead of concatenating every chunk and letting the tokenizer
+silently truncate the tail.
+
+Steps:
+1. Split chunks into sentences (in retrieval order).
+2. Drop repeats: exact duplicates after normalization, fragments contained in
+   another sentence (chunk overlap cuts sentences at the boundaries) and
+   near-duplicates by embedding cosine.
+3. Rank sentences by similarity to the query embedding already computed by
+   retrieval (sentences are encoded in one batch). Lexical-only retrieval has
+   no embedding; sentences are then ranked by query-term overlap without
+   loading the encoder.
+4. Greedily pack the best sentences into the token budget, measured with the
+   flan-t5 tokenizer, then restore source order for readability.
+
+Usage:
+    from context_packer import pack_prompt
+    prompt, info = pack_prompt(query, results, q_emb)
+"""
+
+import re
+import numpy as np
+from models import get_encoder, get_generator
+
+PROMPT_TEMPLATE = (
+    "Use the context below to answer the question.\n\n"
+    "Context:\n{context}\n\n"
+    "Question: {query}\nAnswer in concise points."
+)
+MAX_INPUT_TOKENS = 512    # flan-t5 was trained with 512-token inputs
+NEAR_DUP_COSINE = 0.95    # sentences this similar to a better-ranked one are dropped
+MIN_SENTENCE_WORDS = 4    # shorter pieces (headings, page numbers) carry no context
+
+_SENT_RE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+def split_sentences(text: str) -> list[str]:
+    """Split text on sentence-final punctuation followed by a capitalized start."""
+    text = re.sub(r"\s+", " ", text or "").strip()
+    return [s for s in _SENT_RE.split(text) if s]
+
+
+def _norm(sentence: str) -> str:
+    return re.sub(r"[^a-z0-9 ]+", "", sentence.lower()).strip()
+
+
+def _unique_sentences(results: list[dict]) -> list[dict]:
+    """
+    Sentences of all results in source order, without exact repeats or
+    fragments contained in a longer sentence.
+    """
+    seen, out = set(), []
+    for ri, r in enumerate(results):
+        for s in split_sentences(r.get("text", "")):
+            key = _norm(s)
+            if len(key.split()) < MIN_SENTENCE_WORDS or key in seen:
+                continue
+            seen.add(key)
+            out.append({"text": s, "key": key, "result": ri, "page": r.get("page")})
+    keys = [s["key"] for s in out]
+    return [s for s in out
+            if not any(len(other) > len(s["key"]) and s["key"] in other for other in keys)]
+
+
+def _term_overlap(sents: list[dict], query: str) -> np.ndarray:
+    from bm25_index import tokenize
+    terms = set(tokenize(query))
+    return np.array([len(terms.intersection(tokenize(s["text"]))) for s in sents], dtype="float32")
+
+
+def pack_context(results: list[dict], q_emb: np.ndarray, budget: int, tokenizer=None,
+                 query: str = "") -> tuple[str, dict]:
+    """
+    Pick the sentences most similar to the query that fit in `budget` tokens.
+
+    Args:
+        results (list[dict]): Retrieved chunk records with "text".
+        q_emb (np.ndarray): Normalized query embedding from retrieval, or None
+            to rank by query-term overlap instead.
+        budget (int): Max tokens for the context (without special tokens).
+        tokenizer: Generator tokenizer; defaults to the shared flan-t5 one.
+        query (str): Query text, used when q_emb is None.
+
+    Returns:
+        tuple: (context text, stats dict).
+    """
+    tokenizer = tokenizer or get_generator()[0]
+    sents = _unique_sentences(results)
+    n_raw = sum(len(split_sentences(r.get("text", ""))) for r in results)
+    info = {"sentences": n_raw, "unique": len(sents), "kept": 0, "tokens": 0, "budget": budget}
+    if not sents or budget <= 0:
+        return "", info
+
+    if q_emb is not None:
+        emb = np.asarray(get_encoder().encode([s["text"] for s in sents], normalize_embeddings=True), dtype="float32")
+        scores = emb @ np.asarray(q_emb, dtype="float32")
+    else:
+        emb, scores = None, _term_overlap(sents, query)
+    order = np.argsort(-scores, kind="stable")
+    lengths = [len(ids) for ids in tokenizer([s["text"] for s in sents], add_special_tokens=False)["input_ids"]]
+
+    chosen, used = [], 0
+    for i in order:
+        if emb is not None and chosen and float((emb[chosen] @ emb[i]).max()) >= NEAR_DUP_COSINE:
+            continue
+        if used + lengths[i] + 1 > budget:  # +1 for the joining space
+            continue
+        chosen.append(int(i))
+        used += lengths[i] + 1
+
+    # Token counts of the joined text can differ slightly from the sum of the parts
+    def _join(idx):
+        return " ".join(sents[i]["text"] for i in sorted(idx))
+
+    context = _join(chosen)
+    n_tokens = len(tokenizer(context, add_special_tokens=False)["input_ids"])
+    while chosen and n_tokens > budget:
+        chosen.pop()  # lowest-ranked pick
+        context = _join(chosen)
+        n_tokens = len(tokenizer(context, add_special_tokens=False)["input_ids"])
+    info.update(kept=len(chosen), tokens=n_tokens if chosen else 0)
+    return context, info
+
+
+def pack_prompt(query: str, results: list[dict], q_emb: np.ndarray,
+                max_tokens: int = MAX_INPUT_TOKENS, template: str = PROMPT_TEMPLATE) -> tuple[str, dict]:
+    """
+    Full generator prompt whose tokenized length (with special tokens) is at most `max_tokens`.
+
+    Returns:
+        tuple: (prompt, stats dict with "prompt_tokens").
+    """
+    tokenizer = get_generator()[0]
+    overhead = len(tokenizer(template.format(context="", query=query))["input_ids"])
+    budget = max_tokens - overhead
+    while True:
+        context, info = pack_context(results, q_emb, budget, tokenizer, query)
+        prompt = template.format(context=context, query=query)
+        info["prompt_tokens"] = len(tokenizer(prompt)["input_ids"])
+        # Tokens can merge across the template/context boundary; shrink and repack if so
+        if info["prompt_tokens"] <= max_tokens or not context:
+            return prompt, info
+        budget -= info["prompt_tokens"] - max_tokens
@@ -0,0 +1,98 @@
+# src/dedup.py
+"""
+Near-Duplicate Detection Module
+-------------------------------
+MinHash signatures over word shingles plus LSH banding, used to cluster
+near-identical chunks (repeated headers/footers, boxed definitions,
+end-of-chapter summaries) before they are embedded.
+
+Two chunks are near-duplicates when the MinHash estimate of the Jaccard
+similarity of their word 5-gram sets reaches `threshold`. LSH bands are
+sized from the threshold so only likely pairs are ever compared.
+
+Usage:
+    dd = NearDuplicateIndex(threshold=0.85)
+    rep = dd.add(text)   # index of the earlier representative, or None if new
+"""
+
+import zlib
+import numpy as np
+
+NUM_PERM = 128
+SHINGLE_WORDS = 5
+# Universal hashing h(x) = (a*x + b) mod p over the 32-bit crc32 shingle hashes, with p the
+# first prime above 2^32. a is split into 16-bit halves so every product fits in uint64.
+_PRIME = (1 << 32) + 15
+
+
+def shingles(text: str, k: int = SHINGLE_WORDS) -> set[int]:
+    """Hashed word k-grams of the lowercased text (the whole text if shorter than k)."""
+    words = text.lower().split()
+    if len(words) < k:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+    return {zlib.crc32(" ".join(words[i:i + k]).encode("utf-8")) for i in range(len(words) - k + 1)}
+
+
+def lsh_bands(threshold: float, num_perm: int = NUM_PERM) -> tuple[int, int]:
+    """(bands, rows) with bands * rows <= num_perm whose S-curve midpoint is closest to threshold."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        err = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or err < best[0]:
+            best = (err, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateIndex:
+    """
+    Incremental MinHash-LSH index; each added text either joins an existing
+    cluster or becomes a new representative.
+
+    Args:
+        threshold (float): Estimated Jaccard similarity needed to merge (0..1).
+        num_perm (int): MinHash permutations (signature length).
+        seed (int): Seed for the hash permutations (keeps runs reproducible).
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.threshold = threshold
+        a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._a_hi, self._a_lo = a >> np.uint64(16), a & np.uint64(0xFFFF)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        self._buckets = {}      # (band, band bytes) -> representative numbers
+        self._signatures = []   # one per representative
+
+    def signature(self, text: str) -> np.ndarray:
+        x = np.fromiter(shingles(text), dtype=np.uint64)[:, None]
+        p = np.uint64(_PRIME)
+        # a*x = (a_hi*x << 16) + a_lo*x; a_hi*x < 2^49 and a_lo*x < 2^48, reduced before the shift
+        h = ((((x * self._a_hi) % p) << np.uint64(16)) + x * self._a_lo + self._b) % p  # (n shingles, num_perm)
+        return h.min(axis=0)
+
+    def add(self, text: str):
+        """
+        Returns:
+            int | None: Number of the representative `text` duplicates, or None
+            if it starts a new cluster (it then gets the next number).
+        """
+        sig = self.signature(text)
+        keys = [(b, sig[b * self.rows:(b + 1) * self.rows].tobytes()) for b in range(self.bands)]
+        candidates = {c for key in keys for c in self._buckets.get(key, ())}
+        best, best_sim = None, self.threshold
+        for c in sorted(candidates):
+            sim = float(np.mean(self._signatures[c] == sig))
+            if sim >= best_sim:
+                best, best_sim = c, sim
+        if best is not None:
+            return best
+        rep = len(self._signatures)
+        self._signatures.append(sig)
+        for key in keys:
+            self._buckets.setdefault(key, []).append(rep)
+        return None
+
+    def __len__(self) -> int:
+        return len(self._signatures)
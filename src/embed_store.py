@@ -5,17 +5,36 @@ Embed Store Module
 This module handles the creation of embeddings from PDF/text chunks
 and builds a FAISS index for semantic search.
 
+Builds are incremental by default: a manifest stores a content hash and a
+FAISS id per chunk id, so only new or changed chunks are encoded and deleted
+chunks are dropped from the index with `remove_ids`. Embeddings, index and
+metadata are always rewritten together so their rows stay aligned.
+embeddings.npy is always fp32; `emb_dtype` "fp16" / "int8" also writes the
+compact, memory-mapped copy the Retriever scores on (compact_embeddings.py).
+
 Functions:
 - load_chunks(path): Load preprocessed text chunks from JSONL file.
-- build_index(chunks): Encode chunks, save embeddings, metadata, and FAISS index.
-- build_embed_store(): Wrapper to load chunks and build the full embed store.
+- build_index(chunks, incremental): Encode chunks, save embeddings, metadata, and FAISS index.
+- build_embed_store(incremental): Wrapper to load chunks and build the full embed store.
+- is_stale(): True if the chunks file changed since the last build.
+- build_shards(chunks, shard_by): one independent store per subject / book under
+  data/shards/<name>/, built in parallel (searched by sharded_retriever.py).
+- use_shards(): True if retrieval should go to the sharded store.
+- BackgroundBuild: runs build_embed_store in a worker thread with progress, one build at a time.
 """
 
+import hashlib
 import json
+import os
+import re
+import shutil
+import threading
+import time
 from pathlib import Path
 import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
+
+# faiss and the encoder are imported on demand, so `is_stale()` stays cheap
+# for callers like the Streamlit app.
 
 # Project root-aware paths
 ROOT_DIR = Path(__file__).resolve().parent.parent
@@ -28,9 +47,40 @@ CHUNKS_FILE = DATA_DIR / "chunks.jsonl"
 EMB_OUT = DATA_DIR / "embeddings.npy"
 META_OUT = DATA_DIR / "emb_metadata.jsonl"
 FAISS_INDEX_FILE = DATA_DIR / "faiss_index.index"
+MANIFEST_FILE = DATA_DIR / "emb_manifest.json"
+CHUNK_STORE_DIR = DATA_DIR / "chunk_store"
+
+# Sharded stores: data/shards/<shard name>/ with the same file layout as above
+SHARDS_DIR = DATA_DIR / "shards"
+SHARDS_MANIFEST = "shards.json"
+SHARD_FIELDS = ("subject", "source")  # chunk fields a store can be sharded by
 
 # SentenceTransformer model
-MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"  # same as models.ENCODER_NAME
+ENCODE_BATCH_SIZE = 64
+
+
+def store_paths(data_dir: Path = None) -> dict:
+    """
+    Output file locations for an embed store rooted at `data_dir`.
+
+    Args:
+        data_dir (Path): Directory holding the store; defaults to DATA_DIR.
+
+    Returns:
+        dict: Paths keyed by "embeddings", "meta", "index", "manifest" and "chunk_store".
+    """
+    if data_dir is None:
+        return {"embeddings": EMB_OUT, "meta": META_OUT, "index": FAISS_INDEX_FILE, "manifest": MANIFEST_FILE,
+                "chunk_store": CHUNK_STORE_DIR}
+    data_dir = Path(data_dir)
+    return {
+        "embeddings": data_dir / EMB_OUT.name,
+        "meta": data_dir / META_OUT.name,
+        "index": data_dir / FAISS_INDEX_FILE.name,
+        "manifest": data_dir / MANIFEST_FILE.name,
+        "chunk_store": data_dir / CHUNK_STORE_DIR.name,
+    }
 
 
 def load_chunks(path: Path) -> list[dict]:
@@ -54,53 +104,435 @@ def load_chunks(path: Path) -> list[dict]:
     return rows
 
 
-def build_index(chunks: list[dict]) -> None:
+def content_hash(text: str) -> str:
+    """Stable hash of the text that gets embedded."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _encode(texts: list[str], batch_size: int = ENCODE_BATCH_SIZE, progress=None) -> np.ndarray:
+    from models import get_encoder
+
+    model = get_encoder()
+    print(f"Encoding {len(texts)} chunks...")
+    if progress is None:
+        embeddings = model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=True,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        return np.asarray(embeddings, dtype="float32")
+
+    # Encode in slices so a caller (e.g. the app) can show progress
+    step = batch_size * 8
+    parts = []
+    for start in range(0, len(texts), step):
+        parts.append(model.encode(texts[start:start + step], batch_size=batch_size,
+                                  convert_to_numpy=True, normalize_embeddings=True))
+        done = min(start + step, len(texts))
+        progress(done / max(1, len(texts)), f"Encoded {done}/{len(texts)} chunks")
+    return np.asarray(np.concatenate(parts), dtype="float32")
+
+
+def _chunk_keys(chunks: list[dict]) -> list[str]:
+    # Manifest key per chunk: its id, with a "#n" suffix for repeated ids
+    keys, seen = [], {}
+    for i, c in enumerate(chunks):
+        key = str(c.get("id", i))
+        seen[key] = seen.get(key, 0) + 1
+        keys.append(key if seen[key] == 1 else f"{key}#{seen[key]}")
+    return keys
+
+
+def _new_index(embeddings: np.ndarray, ids: np.ndarray, params: dict):
+    # FAISS index (cosine similarity via normalized vectors), addressed by stable ids.
+    # Returns (index, params actually used), see ann_index.build_ann_index.
+    from ann_index import build_ann_index
+    return build_ann_index(embeddings, ids, params)
+
+
+def _load_previous(paths: dict):
+    """Previous manifest, metadata and embeddings if they are present and consistent."""
+    import faiss
+    if not all(paths[k].exists() for k in ("embeddings", "meta", "index", "manifest")):
+        return None
+    try:
+        with open(paths["manifest"], "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        old_meta = load_chunks(paths["meta"])
+        old_emb = np.load(paths["embeddings"], mmap_mode="r")
+        index = faiss.read_index(str(paths["index"]))
+    except Exception as e:
+        print(f"⚠️ Could not read previous embed store ({e}); rebuilding from scratch.")
+        return None
+    if manifest.get("model") != MODEL_NAME or not (
+        len(old_meta) == old_emb.shape[0] == index.ntotal == len(manifest.get("chunks", {}))
+    ):
+        print("⚠️ Previous embed store is inconsistent or from another model; rebuilding from scratch.")
+        return None
+    return manifest, old_meta, old_emb, index
+
+
+def _write_store(paths: dict, index, embeddings: np.ndarray, chunks: list[dict], manifest: dict,
+                 params: dict, emb_dtype: str = "fp32") -> None:
+    # Write to temp files first; the manifest goes last and marks a consistent store.
+    import faiss
+    from ann_index import save_params, replace_index
+    from chunk_store import build_chunk_store, source_fingerprint
+    from bm25_index import build_bm25
+    from compact_embeddings import build_compact
+    tmp = {k: p.with_name(p.name + ".tmp") for k, p in paths.items()}
+    faiss.write_index(index, str(tmp["index"]))
+    save_params(tmp["index"], params)
+    with open(tmp["embeddings"], "wb") as f:
+        np.save(f, embeddings)
+    with open(tmp["meta"], "w", encoding="utf-8") as f:
+        for c in chunks:
+            f.write(json.dumps(c, ensure_ascii=False) + "\n")
+    with open(tmp["manifest"], "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    replace_index(tmp["index"], paths["index"])  # index, then its params
+    for key in ("embeddings", "meta", "manifest"):
+        os.replace(tmp[key], paths[key])
+    # Memory-mapped chunk store for O(k) lookups; tied to the metadata file it mirrors
+    build_chunk_store(chunks, paths["chunk_store"], source_fingerprint(paths["meta"]))
+    # Lexical (BM25) postings for keyword / hybrid retrieval, next to the FAISS index
+    build_bm25(chunks, paths["index"], source_fingerprint(paths["meta"]))
+    # fp16 / int8 copy of the embeddings for retrieval ("fp32" removes a stale one)
+    build_compact(paths["embeddings"], emb_dtype)
+
+
+def build_index(chunks: list[dict], incremental: bool = True, data_dir: Path = None,
+                index_params: dict = None, progress=None, emb_dtype: str = None) -> None:
     """
     Build embeddings and a FAISS index from chunks and save them to disk.
 
     Args:
-        chunks (List[dict]): List of chunk dictionaries with 'text' keys.
+        chunks (List[dict]): List of chunk dictionaries with 'id' and 'text' keys.
+        incremental (bool): Reuse embeddings of unchanged chunks from the previous build.
+        data_dir (Path): Output directory; defaults to DATA_DIR.
+        index_params (dict): Index type/parameters (see ann_index); defaults to the
+            ones saved with the previous index, else a flat index.
+        progress (callable): Optional progress(fraction, message) callback.
+        emb_dtype (str): "fp32", "fp16" or "int8" retrieval copy of the embeddings;
+            defaults to the dtype of the previous build.
     """
     if not chunks:
         print("⚠️ No chunks to embed! Did you run ingest_pdf.py?")
         return
 
-    model = SentenceTransformer(MODEL_NAME)
-    texts = [c["text"] for c in chunks]
-    print(f"Encoding {len(texts)} chunks...")
+    from ann_index import index_type, load_params
+    from compact_embeddings import compact_path, stored_dtype
 
-    embeddings = model.encode(
-        texts,
-        show_progress_bar=True,
-        convert_to_numpy=True,
-        normalize_embeddings=True
-    )
+    paths = store_paths(data_dir)
+    emb_dtype = emb_dtype or stored_dtype(compact_path(paths["embeddings"]))
+    saved_params = load_params(paths["index"])
+    params = {**saved_params, **index_params} if index_params and index_params.get("type") == saved_params["type"] \
+        else (index_params or saved_params)
+    t0 = time.perf_counter()
+    keys = _chunk_keys(chunks)
+    hashes = [content_hash(c["text"]) for c in chunks]
 
-    # FAISS index (cosine similarity via normalized vectors)
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings)
-    faiss.write_index(index, str(FAISS_INDEX_FILE))
+    previous = _load_previous(paths) if incremental else None
+    if previous is None:
+        ids = np.arange(len(chunks), dtype="int64")
+        embeddings = _encode([c["text"] for c in chunks], progress=progress)
+        index, params = _new_index(embeddings, ids, params)
+        n_encoded, n_removed, next_id = len(chunks), 0, len(chunks)
+    else:
+        manifest, old_meta, old_emb, index = previous
+        old_entries = manifest["chunks"]
+        old_rows = {str(m.get("_key", m.get("id", i))): i for i, m in enumerate(old_meta)}
+        next_id = int(manifest.get("next_id", len(old_entries)))
 
-    # Save embeddings
-    np.save(EMB_OUT, embeddings)
+        ids = np.empty(len(chunks), dtype="int64")
+        embeddings = np.empty((len(chunks), old_emb.shape[1]), dtype="float32")
+        to_encode, stale_ids, reuse_dst, reuse_src = [], [], [], []
+        for row, (key, h) in enumerate(zip(keys, hashes)):
+            entry = old_entries.get(key)
+            if entry is not None and entry["hash"] == h and key in old_rows:
+                ids[row] = entry["faiss_id"]
+                reuse_dst.append(row)
+                reuse_src.append(old_rows[key])
+                continue
+            if entry is not None:
+                ids[row] = entry["faiss_id"]  # changed: keep its id, replace the vector
+                stale_ids.append(entry["faiss_id"])
+            else:
+                ids[row] = next_id
+                next_id += 1
+            to_encode.append(row)
+        current = set(keys)
+        removed = [k for k in old_entries if k not in current]
+        stale_ids += [old_entries[k]["faiss_id"] for k in removed]
+        n_removed = len(removed)
 
-    # Save metadata
-    with open(META_OUT, "w", encoding="utf-8") as f:
-        for c in chunks:
-            f.write(json.dumps(c, ensure_ascii=False) + "\n")
+        if reuse_dst:
+            embeddings[reuse_dst] = old_emb[np.array(reuse_src)]
+
+        if to_encode:
+            new_embs = _encode([chunks[r]["text"] for r in to_encode], progress=progress)
+            embeddings[to_encode] = new_embs
+        n_encoded = len(to_encode)
+
+        if index_type(index) != params["type"] or params != saved_params:
+            index = None  # index type/parameters changed: rebuild from stored vectors
+        if index is not None and stale_ids:
+            try:
+                index.remove_ids(np.array(stale_ids, dtype="int64"))
+            except RuntimeError:
+                index = None  # index type without remove_ids: rebuild from stored vectors
+        if index is not None and to_encode:
+            index.add_with_ids(embeddings[to_encode], ids[to_encode])
+        if index is None:
+            index, params = _new_index(embeddings, ids, params)
+
+    metadata = []
+    for c, k, fid in zip(chunks, keys, ids):
+        m = dict(c, faiss_id=int(fid))
+        if k != str(c.get("id")):
+            m["_key"] = k
+        metadata.append(m)
+    manifest = {
+        "model": MODEL_NAME,
+        "dim": int(embeddings.shape[1]),
+        "next_id": int(next_id),
+        "chunks": {k: {"hash": h, "faiss_id": int(fid)} for k, h, fid in zip(keys, hashes, ids)},
+    }
+    if progress:
+        progress(1.0, "Writing index, embeddings and metadata")
+    _write_store(paths, index, embeddings, metadata, manifest, params, emb_dtype)
+
+    print(f"✅ FAISS index, embeddings, and metadata saved "
+          f"({n_encoded} encoded, {len(chunks) - n_encoded} reused, {n_removed} removed, "
+          f"{time.perf_counter() - t0:.1f}s).")
+
+
+def is_stale(data_dir: Path = None, chunks_file: Path = CHUNKS_FILE) -> bool:
+    """
+    True if the store is missing or the chunks file is newer than the last build.
+    """
+    manifest = store_paths(data_dir)["manifest"]
+    if not manifest.exists() or not store_paths(data_dir)["index"].exists():
+        return True
+    return chunks_file.exists() and chunks_file.stat().st_mtime > manifest.stat().st_mtime
+
+
+def shard_name(value) -> str:
+    """Directory-safe shard name for a subject / book value."""
+    name = re.sub(r"[^A-Za-z0-9_-]+", "_", str(value)).strip("_")
+    return name or "unassigned"
+
+
+def _shard_is_current(shard_dir: Path, chunks: list[dict], emb_dtype: str = None) -> bool:
+    # Unchanged shard: same model, compact dtype and exactly the same chunk keys and content hashes
+    from compact_embeddings import compact_path, stored_dtype
+    paths = store_paths(shard_dir)
+    if emb_dtype is not None and stored_dtype(compact_path(paths["embeddings"])) != emb_dtype:
+        return False
+    if not (paths["manifest"].exists() and paths["index"].exists()):
+        return False
+    try:
+        with open(paths["manifest"], "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return False
+    old = {k: e["hash"] for k, e in manifest.get("chunks", {}).items()}
+    new = dict(zip(_chunk_keys(chunks), (content_hash(c["text"]) for c in chunks)))
+    return manifest.get("model") == MODEL_NAME and old == new
+
+
+def _shard_summary(chunks: list[dict], value) -> dict:
+    # Filter values and page range of a shard, so filter controls need not load it
+    from metadata_filter import FILTER_FIELDS
+    pages = [c["page"] for c in chunks if isinstance(c.get("page"), int)]
+    return {
+        "value": value,
+        "rows": len(chunks),
+        "values": {f: sorted({c[f] for c in chunks if c.get(f) is not None}, key=str) for f in FILTER_FIELDS},
+        "pages": [min(pages), max(pages)] if pages else None,
+    }
+
+
+def _init_shard_worker(threads):
+    import torch
+    torch.set_num_threads(threads)
+
+
+def _build_shard(args):
+    name, chunks, incremental, data_dir, index_params, emb_dtype = args
+    Path(data_dir).mkdir(parents=True, exist_ok=True)
+    build_index(chunks, incremental=incremental, data_dir=data_dir, index_params=index_params, emb_dtype=emb_dtype)
+    return name
+
+
+def build_shards(chunks: list[dict], shard_by: str = "subject", shards_dir: Path = SHARDS_DIR,
+                 workers: int = None, incremental: bool = True, index_params: dict = None,
+                 emb_dtype: str = None) -> dict:
+    """
+    Split chunks by a metadata field and build one embed store per value.
+
+    Each shard lives in shards_dir/<name>/ with its own index, embeddings,
+    metadata, chunk store and BM25 files. Shards whose chunks did not change
+    are skipped; the others are built in parallel worker processes. Shards
+    whose value disappeared are deleted. shards.json (written last) lists
+    the shards with their row counts and filter values.
+
+    Args:
+        chunks (List[dict]): All chunks.
+        shard_by (str): Chunk field to shard by ("subject" or "source").
+        shards_dir (Path): Root directory of the shards.
+        workers (int): Build processes (default: one per changed shard, at most the CPU count).
+        incremental (bool): Reuse embeddings of unchanged chunks within a shard.
+        index_params (dict): Index type/parameters for every shard.
+        emb_dtype (str): Compact embedding dtype for every shard (see build_index).
+
+    Returns:
+        dict: The shards manifest.
+    """
+    if shard_by not in SHARD_FIELDS:
+        raise ValueError(f"Cannot shard by {shard_by!r}; choose from {SHARD_FIELDS}")
+    shards_dir = Path(shards_dir)
+    t0 = time.perf_counter()
+    groups, values = {}, {}
+    for c in chunks:
+        value = c.get(shard_by)
+        name = shard_name(value)
+        if values.setdefault(name, value) != value:
+            name = f"{name}-{hashlib.sha1(str(value).encode('utf-8')).hexdigest()[:6]}"
+            values.setdefault(name, value)
+        groups.setdefault(name, []).append(c)
+
+    todo = [n for n in sorted(groups)
+            if not (incremental and _shard_is_current(shards_dir / n, groups[n], emb_dtype))]
+    print(f"Shards by {shard_by}: {len(groups)} ({len(todo)} to build, {len(groups) - len(todo)} unchanged)")
+    shards_dir.mkdir(parents=True, exist_ok=True)
+    jobs = [(n, groups[n], incremental, shards_dir / n, index_params, emb_dtype) for n in todo]
+    workers = min(len(jobs), workers or os.cpu_count() or 1)
+    if workers > 1:
+        import multiprocessing as mp
+        from concurrent.futures import ProcessPoolExecutor
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn"),
+                                 initializer=_init_shard_worker, initargs=(threads,)) as pool:
+            for name in pool.map(_build_shard, jobs):
+                print(f"✅ Shard {name} built")
+    else:
+        for job in jobs:
+            _build_shard(job)
+
+    for old in shards_dir.iterdir():
+        if old.is_dir() and old.name not in groups:
+            print(f"Removing shard {old.name} (no chunks left)")
+            shutil.rmtree(old)
+    manifest = {
+        "shard_by": shard_by,
+        "model": MODEL_NAME,
+        "shards": {n: _shard_summary(groups[n], values[n]) for n in sorted(groups)},
+    }
+    tmp = shards_dir / (SHARDS_MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, shards_dir / SHARDS_MANIFEST)
+    print(f"✅ {len(groups)} shards ready in {shards_dir} ({time.perf_counter() - t0:.1f}s)")
+    return manifest
 
-    print("✅ FAISS index, embeddings, and metadata saved.")
+
+def use_shards() -> bool:
+    """
+    True if retrieval should use the sharded store: RAG_SHARDS=1, or shards
+    exist and there is no single index.
+    """
+    if os.environ.get("RAG_SHARDS") == "1":
+        return True
+    return (SHARDS_DIR / SHARDS_MANIFEST).exists() and not FAISS_INDEX_FILE.exists()
 
 
-def build_embed_store() -> None:
+def build_embed_store(incremental: bool = True, index_params: dict = None, progress=None,
+                      emb_dtype: str = None) -> None:
     """
     Load chunks and build the full embed store.
     This is the main recruiter-facing entry point.
+
+    Args:
+        incremental (bool): Only encode new or changed chunks (default).
+        index_params (dict): Optional index type/parameters, e.g. {"type": "hnsw"}.
+        progress (callable): Optional progress(fraction, message) callback.
+        emb_dtype (str): "fp32", "fp16" or "int8" retrieval copy (default: keep the current one).
     """
     chunks = load_chunks(CHUNKS_FILE)
-    build_index(chunks)
+    build_index(chunks, incremental=incremental, index_params=index_params, progress=progress,
+                emb_dtype=emb_dtype)
+
+
+class BackgroundBuild:
+    """
+    Runs build_embed_store() in a daemon thread; only one build runs at a time.
+
+    Attributes:
+        state (str): "idle", "running", "done" or "failed".
+        progress (float): 0..1 fraction of chunks encoded.
+        message (str): Human-readable status line.
+        error (str): Error message of the last failed build.
+    """
+
+    def __init__(self):
+        self.state = "idle"
+        self.progress = 0.0
+        self.message = ""
+        self.error = None
+        self.chunks_mtime = None
+        self._lock = threading.Lock()
+
+    def _on_progress(self, fraction: float, message: str) -> None:
+        self.progress, self.message = fraction, message
+
+    def start(self, **kwargs) -> bool:
+        """Start a build unless one is already running. Returns True if started."""
+        with self._lock:
+            if self.state == "running":
+                return False
+            self.state, self.progress, self.message, self.error = "running", 0.0, "Starting build...", None
+            self.chunks_mtime = CHUNKS_FILE.stat().st_mtime if CHUNKS_FILE.exists() else None
+        threading.Thread(target=self._run, kwargs=kwargs, name="embed-build", daemon=True).start()
+        return True
+
+    def _run(self, **kwargs) -> None:
+        try:
+            build_embed_store(progress=self._on_progress, **kwargs)
+            self.state, self.progress, self.message = "done", 1.0, "Embed index is up to date."
+        except Exception as e:
+            self.state, self.error = "failed", str(e)
+            print(f"[ERROR] Embed build failed: {e}")
+
+    def needs_start(self) -> bool:
+        """
+        True if the store is stale and no build was attempted for the current
+        chunks file; a failed build is not retried automatically.
+        """
+        if self.state in ("running", "failed") or not is_stale():
+            return False
+        mtime = CHUNKS_FILE.stat().st_mtime if CHUNKS_FILE.exists() else None
+        return self.state == "idle" or mtime != self.chunks_mtime
 
 
 if __name__ == "__main__":
-    build_embed_store()
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Build embeddings + FAISS index from chunks.jsonl")
+    ap.add_argument("--full", action="store_true", help="re-encode every chunk instead of an incremental build")
+    ap.add_argument("--index-type", choices=["flat", "ivf_flat", "hnsw", "ivf_pq"],
+                    help="FAISS index type (default: keep the current one)")
+    ap.add_argument("--shard-by", choices=SHARD_FIELDS,
+                    help="build one store per subject / book under data/shards/ instead of one index")
+    ap.add_argument("--workers", type=int, help="parallel shard builds (with --shard-by)")
+    ap.add_argument("--emb-dtype", choices=["fp32", "fp16", "int8"],
+                    help="compact memory-mapped embeddings for retrieval (default: keep the current one)")
+    args = ap.parse_args()
+    index_params = {"type": args.index_type} if args.index_type else None
+    if args.shard_by:
+        build_shards(load_chunks(CHUNKS_FILE), args.shard_by, workers=args.workers,
+                     incremental=not args.full, index_params=index_params, emb_dtype=args.emb_dtype)
+    else:
+        build_embed_store(incremental=not args.full, index_params=index_params, emb_dtype=args.emb_dtype)
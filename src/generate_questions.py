@@ -1,27 +1,241 @@
 # src/generate_questions.py
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-import torch
+import hashlib
+import queue
+import threading
+from collections import OrderedDict
+from models import get_generator, GENERATOR_NAME as MODEL, DEVICE
 
-MODEL = "google/flan-t5-small"  # small, free
-DEVICE = "cpu"  # colab with GPU can use "cuda"
+# Decoding strategies selectable per call
+DECODING = {
+    "greedy": {"num_beams": 1, "do_sample": False},
+    "beam": {"num_beams": 4, "do_sample": False},
+    "sample": {"num_beams": 1, "do_sample": True, "top_p": 0.9, "temperature": 0.7},
+}
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL)
-model = AutoModelForSeq2SeqLM.from_pretrained(MODEL).to(DEVICE)
+# Seconds generate_stream waits for the next decoded piece before giving up
+STREAM_TIMEOUT = 120.0
 
-def generate(prompt, max_length=256):
+# Prompt-hash keyed LRU of decoded answers (sampled outputs are not cached)
+CACHE_SIZE = 256
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_key(prompt, strategy, max_new_tokens):
+    return hashlib.sha256(f"{strategy}|{max_new_tokens}|{prompt}".encode("utf-8")).hexdigest()
+
+
+def _cache_get(key):
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    return None
+
+
+def _cache_put(key, text):
+    with _cache_lock:
+        _cache[key] = text
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _prepare(prompt, strategy, max_new_tokens):
+    if strategy not in DECODING:
+        raise ValueError(f"Unknown decoding strategy {strategy!r}; choose from {list(DECODING)}")
+    tokenizer, model = get_generator()  # loaded on first call, shared per process
     inputs = tokenizer(prompt, return_tensors="pt", truncation=True).to(DEVICE)
-    out = model.generate(**inputs, max_length=max_length, num_beams=4)
-    return tokenizer.decode(out[0], skip_special_tokens=True)
+    kwargs = dict(DECODING[strategy], max_new_tokens=max_new_tokens)
+    return tokenizer, model, inputs, kwargs
 
-def generate_questions_for_text(text):
-    # 5 MCQs
-    mcq_prompt = (
+
+def generate(prompt, max_length=256, strategy="beam", max_new_tokens=None):
+    """
+    Decode an answer for `prompt`; identical prompts are served from the LRU cache.
+
+    Args:
+        prompt (str): Full model input.
+        max_length (int): Kept for compatibility; used when max_new_tokens is None.
+        strategy (str): "greedy", "beam" or "sample".
+        max_new_tokens (int): Upper bound on generated tokens.
+    """
+    import torch
+
+    max_new_tokens = max_new_tokens or max_length
+    key = _cache_key(prompt, strategy, max_new_tokens)
+    cached = _cache_get(key) if strategy != "sample" else None
+    if cached is not None:
+        return cached
+    tokenizer, model, inputs, kwargs = _prepare(prompt, strategy, max_new_tokens)
+    with torch.inference_mode():
+        out = model.generate(**inputs, **kwargs)
+    text = tokenizer.decode(out[0], skip_special_tokens=True)
+    if strategy != "sample":
+        _cache_put(key, text)
+    return text
+
+
+def generate_stream(prompt, strategy="greedy", max_new_tokens=256):
+    """
+    Yield the answer piece by piece as it is decoded (for progressive display).
+
+    Beam search cannot emit tokens before the search finishes, so "beam" yields
+    the whole answer at once. Cached answers are yielded immediately.
+    """
+    import torch
+    from transformers import TextIteratorStreamer
+
+    key = _cache_key(prompt, strategy, max_new_tokens)
+    cached = _cache_get(key) if strategy != "sample" else None
+    if cached is not None:
+        yield cached
+        return
+    if strategy == "beam":
+        yield generate(prompt, strategy=strategy, max_new_tokens=max_new_tokens)
+        return
+
+    tokenizer, model, inputs, kwargs = _prepare(prompt, strategy, max_new_tokens)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_TIMEOUT)
+    error = []
+
+    def _run():
+        try:
+            with torch.inference_mode():
+                model.generate(**inputs, **kwargs, streamer=streamer)
+        except Exception as e:
+            error.append(e)
+        finally:
+            streamer.end()  # unblocks the consumer even when generate() failed
+
+    worker = threading.Thread(target=_run, daemon=True)
+    worker.start()
+    pieces = []
+    try:
+        for piece in streamer:
+            pieces.append(piece)
+            yield piece
+    except queue.Empty:
+        raise TimeoutError(f"No output from the generator for {STREAM_TIMEOUT:.0f}s") from None
+    worker.join()
+    if error:
+        raise error[0]
+    if strategy != "sample":
+        _cache_put(key, "".join(pieces))
+
+# Padded input tokens per batched generate() call, prompts per call, and the
+# share of padding a batch may have before it is cut
+MAX_BATCH_TOKENS = 8192
+MAX_BATCH_SIZE = 16
+MAX_PADDING = 0.25
+
+
+def length_batches(lengths, max_tokens=MAX_BATCH_TOKENS, max_size=MAX_BATCH_SIZE, max_padding=MAX_PADDING):
+    """
+    Group items into batches of similar token length so padding stays small.
+
+    Items are sorted by length and cut into batches whose padded size
+    (batch size x longest item) stays within max_tokens and whose padding
+    stays within max_padding of the padded size.
+
+    Returns:
+        list[list[int]]: Item indices per batch.
+    """
+    batches, cur, total = [], [], 0
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        n = lengths[i]  # longest so far (ascending order)
+        padded = (len(cur) + 1) * n
+        if cur and (len(cur) >= max_size or padded > max_tokens or 1 - (total + n) / padded > max_padding):
+            batches.append(cur)
+            cur, total = [], 0
+        cur.append(i)
+        total += n
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+def generate_batch(prompts, max_new_tokens=256, strategy="beam", max_batch_tokens=MAX_BATCH_TOKENS,
+                   max_batch_size=MAX_BATCH_SIZE, max_padding=MAX_PADDING, stats=None):
+    """
+    Decode many prompts with padded, length-bucketed model.generate calls.
+
+    Cached prompts are served from the LRU cache and results are cached the
+    same way as generate(), so both paths share answers.
+
+    Args:
+        prompts (list[str]): Full model inputs.
+        max_new_tokens (int): Upper bound on generated tokens (one value per call).
+        strategy (str): "greedy", "beam" or "sample".
+        max_batch_tokens (int): Padded input tokens per generate() call.
+        max_batch_size (int): Prompts per generate() call.
+        max_padding (float): Largest share of padding tokens in a call.
+        stats (dict): Optional; receives calls, tokens and padded_tokens counts.
+
+    Returns:
+        list[str]: Decoded answers in prompt order.
+    """
+    import torch
+
+    if strategy not in DECODING:
+        raise ValueError(f"Unknown decoding strategy {strategy!r}; choose from {list(DECODING)}")
+    out = [None] * len(prompts)
+    keys = [_cache_key(p, strategy, max_new_tokens) for p in prompts]
+    todo = []
+    for i, key in enumerate(keys):
+        cached = _cache_get(key) if strategy != "sample" else None
+        if cached is not None:
+            out[i] = cached
+        else:
+            todo.append(i)
+    if not todo:
+        return out
+
+    tokenizer, model = get_generator()
+    encoded = tokenizer([prompts[i] for i in todo], truncation=True)["input_ids"]
+    lengths = [len(ids) for ids in encoded]
+    kwargs = dict(DECODING[strategy], max_new_tokens=max_new_tokens)
+    for batch in length_batches(lengths, max_batch_tokens, max_batch_size, max_padding):
+        inputs = tokenizer.pad([{"input_ids": encoded[j]} for j in batch], return_tensors="pt").to(DEVICE)
+        with torch.inference_mode():
+            gen = model.generate(**inputs, **kwargs)
+        for j, text in zip(batch, tokenizer.batch_decode(gen, skip_special_tokens=True)):
+            i = todo[j]
+            out[i] = text
+            if strategy != "sample":
+                _cache_put(keys[i], text)
+        if stats is not None:
+            stats["calls"] = stats.get("calls", 0) + 1
+            stats["tokens"] = stats.get("tokens", 0) + sum(lengths[j] for j in batch)
+            stats["padded_tokens"] = stats.get("padded_tokens", 0) + len(batch) * max(lengths[j] for j in batch)
+    return out
+
+
+def mcq_prompt(text):
+    return (
         "Read the following passage and generate 5 multiple choice questions (each with 4 options A-D and indicate the correct letter). "
         "Make them balanced in difficulty. Passage:\n\n" + text[:4000]
     )
-    mcq_out = generate(mcq_prompt, max_length=512)
+
+
+def essay_prompt(text):
+    return "Read the passage and generate 1 exam-style essay question that tests deep understanding:\n\n" + text[:3000]
+
+
+def generate_questions_for_text(text):
+    # 5 MCQs
+    mcq_out = generate(mcq_prompt(text), max_length=512)
     # 1 essay
-    essay_prompt = "Read the passage and generate 1 exam-style essay question that tests deep understanding:\n\n" + text[:3000]
-    essay_out = generate(essay_prompt, max_length=200)
+    essay_out = generate(essay_prompt(text), max_length=200)
     # Parse raw output? We'll return as strings
-    return mcq_out.strip(), essay_out.strip()
\ No newline at end of file
+    return mcq_out.strip(), essay_out.strip()
+
+
+def generate_questions_for_texts(texts, stats=None, **batch_kwargs):
+    """
+    (mcqs, essay) for many passages: all MCQ prompts, then all essay prompts,
+    each decoded in length-bucketed batches (see generate_batch).
+    """
+    mcqs = generate_batch([mcq_prompt(t) for t in texts], max_new_tokens=512, stats=stats, **batch_kwargs)
+    essays = generate_batch([essay_prompt(t) for t in texts], max_new_tokens=200, stats=stats, **batch_kwargs)
+    return [(m.strip(), e.strip()) for m, e in zip(mcqs, essays)]
@@ -0,0 +1,218 @@
+# src/highlights.py
+"""
+Highlight Engine Module
+-----------------------
+Scores transcript segments by the key terms they mention and picks the
+top-N timestamped highlights.
+
+- The whole transcript is tokenized once and mapped to key-term word ids;
+  every term (multi-word terms like "money supply" included) is then matched
+  over the id array with vectorized NumPy comparisons, giving a
+  segments x terms hit matrix in one pass instead of lowercasing every
+  segment once per keyword.
+- A segment (or window) scores the number of distinct terms it mentions;
+  matching is case-insensitive on whole words.
+- Adjacent segments can be merged into sentence windows (caption lines are
+  often sentence fragments) before scoring.
+- The top-N are selected with a heap instead of sorting every segment.
+
+Usage:
+    hl = top_highlights(transcript, keyterms, top_n=8, window=True)
+    python highlights.py --segments 10000        # benchmark vs. the old loop
+"""
+
+import argparse
+import heapq
+import random
+import string
+import time
+from itertools import repeat
+import numpy as np
+
+TOP_N = 8
+WINDOW_MAX_SEGMENTS = 4     # caption lines merged into one sentence window at most
+WINDOW_MAX_SECONDS = 30.0
+# Punctuation -> space, then str.split(): much faster than a regex tokenizer on long transcripts
+_PUNCT = str.maketrans({c: " " for c in string.punctuation + "‘’“”—–…"})
+_BOUNDARY = "\x00"  # token separating texts in the joined transcript
+_SENTENCE_END = (".", "?", "!")
+
+
+def words(text: str) -> list[str]:
+    return text.lower().translate(_PUNCT).split()
+
+
+class KeywordMatcher:
+    """
+    Vectorized whole-word matcher for a list of key terms.
+
+    Args:
+        keywords (list[str]): Terms to match (case-insensitive, whole words).
+    """
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        self._vocab = {_BOUNDARY: 0}  # word -> id; 0 marks text boundaries, -1 any other word
+        self._terms = [tuple(self._vocab.setdefault(w, len(self._vocab)) for w in words(kw))
+                       for kw in self.keywords]
+
+    def hits(self, texts) -> np.ndarray:
+        """
+        Boolean (len(texts), len(keywords)) matrix: term j occurs in text i.
+        Matches do not cross texts.
+        """
+        texts = list(texts)
+        out = np.zeros((len(texts), len(self._terms)), dtype=bool)
+        tokens = words(f" {_BOUNDARY} ".join(texts))
+        if not tokens:
+            return out
+        ids = np.fromiter(map(self._vocab.get, tokens, repeat(-1)), dtype=np.int32, count=len(tokens))
+        text_of = np.cumsum(ids == 0)  # text number of every token
+        n = len(ids)
+        for j, term in enumerate(self._terms):
+            if not term or len(term) > n:
+                continue
+            match = ids[:n - len(term) + 1] == term[0]
+            for k in range(1, len(term)):
+                match &= ids[k:n - len(term) + 1 + k] == term[k]
+            out[text_of[np.flatnonzero(match)], j] = True
+        return out
+
+
+def sentence_windows(transcript, max_segments=WINDOW_MAX_SEGMENTS, max_seconds=WINDOW_MAX_SECONDS):
+    """
+    Group adjacent segments into windows that end at a sentence boundary (or
+    when max_segments / max_seconds is reached).
+
+    Returns:
+        list[int]: Index of the first segment of each window.
+    """
+    starts, first = [], 0
+    for i, seg in enumerate(transcript):
+        span = seg["start"] + seg.get("duration", 0) - transcript[first]["start"]
+        if (seg["text"].rstrip().endswith(_SENTENCE_END) or i - first + 1 >= max_segments
+                or span >= max_seconds):
+            starts.append(first)
+            first = i + 1
+    if first < len(transcript):
+        starts.append(first)
+    return starts
+
+
+def _merge(segs):
+    end = segs[-1]["start"] + segs[-1].get("duration", 0)
+    return {"start": segs[0]["start"], "duration": end - segs[0]["start"], "text": " ".join(t["text"] for t in segs)}
+
+
+def top_highlights(transcript, keywords, top_n=TOP_N, window=False, matcher=None):
+    """
+    Top-N highlights with unique (whole-second) start times.
+
+    Args:
+        transcript (list[dict]): Segments with text, start, duration.
+        keywords (list[str]): Key terms (e.g. the video's YAKE keyterms).
+        top_n (int): Number of highlights.
+        window (bool): Score sentence windows instead of single segments.
+        matcher (KeywordMatcher): Prebuilt matcher for `keywords` (optional).
+
+    Returns:
+        list[dict]: {"start", "duration", "text"}, best first (ties: earlier first).
+    """
+    if not transcript:
+        return []
+    matcher = matcher or KeywordMatcher(keywords)
+    hits = matcher.hits(t["text"] for t in transcript)
+    if window:
+        bounds = sentence_windows(transcript)
+        scores = np.logical_or.reduceat(hits, bounds, axis=0).sum(axis=1) if hits.shape[1] else np.zeros(len(bounds))
+        ends = bounds[1:] + [len(transcript)]
+        items = [(a, b) for a, b in zip(bounds, ends)]
+    else:
+        scores = hits.sum(axis=1)
+        items = [(i, i + 1) for i in range(len(transcript))]
+    # Best item per whole-second start (earliest wins ties)
+    best = {}
+    for pos, (score, (a, _)) in enumerate(zip(scores.tolist(), items)):
+        key = int(transcript[a]["start"])
+        prev = best.get(key)
+        if prev is None or score > prev[0]:
+            best[key] = (score, -pos)
+    top = heapq.nlargest(top_n, best.values())
+    out = []
+    for _, neg_pos in top:
+        a, b = items[-neg_pos]
+        seg = transcript[a] if b - a == 1 else _merge(transcript[a:b])
+        out.append({"start": seg["start"], "duration": seg.get("duration", 0), "text": seg["text"]})
+    return out
+
+
+def synthetic_transcript(n_segments=10000, seed=0, term_rate=0.15):
+    """
+    Deterministic lecture-like transcript: 6-14 word caption lines, 3 s apart,
+    ~30% ending a sentence, `term_rate` of the words drawn from economics terms.
+    """
+    rng = random.Random(seed)
+    terms = ("inflation money supply demand market price interest rate fiscal policy central bank credit "
+             "trade export growth labor wage unemployment output gdp consumer spending tax deficit debt").split()
+    filler = ("the of and a to in is that we so now this will it you be as are on for with what can if they "
+              "when there which more about just like look at see think here right then going one two first "
+              "because how also these our way get up out do make need other example question case point "
+              "number people year time mean really actually kind lot things different happen goes why").split()
+    segs = []
+    for i in range(n_segments):
+        text = " ".join(rng.choice(terms) if rng.random() < term_rate else rng.choice(filler)
+                        for _ in range(rng.randint(6, 14)))
+        if rng.random() < 0.3:
+            text += "."
+        segs.append({"text": text, "start": i * 3.0, "duration": 3.0})
+    return segs
+
+
+def _legacy_highlights(transcript, kws, top_n=TOP_N):
+    # Previous implementation: every keyword against every lowercased segment, full sort
+    highlights = [(t, sum(1 for kw in kws if kw.lower() in t["text"].lower())) for t in transcript]
+    top, seen = [], set()
+    for t, _ in sorted(highlights, key=lambda x: x[1], reverse=True):
+        if int(t["start"]) not in seen:
+            top.append(t)
+            seen.add(int(t["start"]))
+        if len(top) >= top_n:
+            break
+    return top
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark highlight extraction on a synthetic transcript")
+    ap.add_argument("--segments", type=int, default=10000)
+    ap.add_argument("--keywords", type=int, default=8, help="YAKE key terms per video")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    import yake
+    transcript = synthetic_transcript(args.segments)
+    text = " ".join(t["text"] for t in transcript)
+    extractor = yake.KeywordExtractor(lan="en", n=2, top=args.keywords)
+    t0 = time.perf_counter()
+    kws = [k for k, _ in extractor.extract_keywords(text)]
+    yake_s = time.perf_counter() - t0
+    print(f"{args.segments} segments, {len(text.split())} words, {len(kws)} key terms")
+    print(f"YAKE pass: {yake_s:.3f}s (previously run twice per video, now once)")
+
+    def _best(fn):
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        return min(times)
+
+    legacy = _best(lambda: _legacy_highlights(transcript, kws))
+    engine = _best(lambda: top_highlights(transcript, kws))
+    windowed = _best(lambda: top_highlights(transcript, kws, window=True))
+    many = [k for k, _ in yake.KeywordExtractor(lan="en", n=2, top=64).extract_keywords(text)]
+    legacy_many = _best(lambda: _legacy_highlights(transcript, many))
+    engine_many = _best(lambda: top_highlights(transcript, many))
+    print(f"Matching, {len(kws)} terms:  legacy {legacy * 1000:.1f} ms | engine {engine * 1000:.1f} ms "
+          f"| engine + sentence windows {windowed * 1000:.1f} ms")
+    print(f"Matching, {len(many)} terms: legacy {legacy_many * 1000:.1f} ms | engine {engine_many * 1000:.1f} ms")
+    print(f"Per video: legacy {2 * yake_s + legacy:.3f}s -> engine {yake_s + engine:.3f}s")
@@ -0,0 +1,243 @@
+# src/inference_backend.py
+"""
+Inference Backend Module
+------------------------
+CPU inference backends for the encoder (all-MiniLM-L6-v2) and the generator
+(flan-t5-small), selected with RAG_BACKEND and used transparently by the
+model registry (models.py):
+
+- torch:     plain fp32 PyTorch (default)
+- quantized: int8 dynamic quantization of every nn.Linear; quantized once and
+             saved to data/models/<name>-int8.pt, which later loads reuse
+- onnx:      ONNX Runtime; models are exported once to data/models/<name>-onnx
+             (needs `pip install optimum[onnxruntime]`)
+
+Usage:
+    python inference_backend.py export --backend onnx
+    python inference_backend.py check --backend quantized --k 5
+"""
+
+import argparse
+import gc
+import json
+import os
+import time
+from pathlib import Path
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT_DIR / "data"
+MODELS_DIR = DATA_DIR / "models"
+BACKENDS = ("torch", "quantized", "onnx")
+ONNX_HINT = "The onnx backend needs `pip install optimum[onnxruntime]`"
+
+
+def _onnx_dir(kind: str) -> Path:
+    return MODELS_DIR / f"{kind}-onnx"
+
+
+def _quantized_path(kind: str) -> Path:
+    return MODELS_DIR / f"{kind}-int8.pt"
+
+
+def _swap_linears(module):
+    # Replace every nn.Linear with an empty int8 dynamic Linear (the layout quantize_dynamic produces)
+    import torch
+    from torch.ao.nn.quantized.dynamic import Linear as QLinear
+
+    for parent in list(module.modules()):
+        for child_name, child in parent.named_children():
+            if type(child) is torch.nn.Linear:
+                setattr(parent, child_name, QLinear(child.in_features, child.out_features,
+                                                    bias_=child.bias is not None, dtype=torch.qint8))
+
+
+def _load_quantized(kind: str, name: str, model):
+    """
+    int8 dynamic quantization of every nn.Linear in `model`.
+
+    The quantized state dict is saved once to data/models/<kind>-int8.pt (with
+    the model name it came from); later loads swap in empty int8 layers and
+    load it, so quantize_dynamic only ever runs on the first load.
+    """
+    import torch
+
+    path = _quantized_path(kind)
+    saved = None
+    if path.exists():
+        try:
+            saved = torch.load(path, weights_only=True)
+        except Exception as e:
+            print(f"[WARN] Could not load {path} ({e}); re-quantizing {name}.")
+    if saved is not None and saved.get("name") == name:
+        _swap_linears(model)
+        model.load_state_dict(saved["state"])
+        return model
+    if saved is not None:
+        print(f"[INFO] {path.name} was quantized from {saved.get('name')}; re-quantizing {name}.")
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    torch.save({"name": name, "state": model.state_dict()}, tmp)
+    os.replace(tmp, path)
+    return model
+
+
+def load_encoder(name: str, backend: str = "torch", device: str = "cpu"):
+    """
+    SentenceTransformer for `name` running on `backend`; same .encode() API for all.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(name, device=device)
+    if backend == "quantized":
+        return _load_quantized("encoder", name, SentenceTransformer(name, device="cpu"))
+    if backend == "onnx":
+        try:
+            import optimum.onnxruntime  # noqa: F401  (what SentenceTransformer's onnx backend runs on)
+        except ImportError as e:
+            raise ImportError(ONNX_HINT) from e
+        out = _onnx_dir("encoder")
+        if out.exists():
+            return SentenceTransformer(str(out), backend="onnx", device="cpu")
+        model = SentenceTransformer(name, backend="onnx", device="cpu")  # exports on first load
+        out.parent.mkdir(parents=True, exist_ok=True)
+        model.save_pretrained(str(out))
+        return model
+    raise ValueError(f"Unknown backend {backend!r}; choose from {BACKENDS}")
+
+
+def load_generator(name: str, backend: str = "torch", device: str = "cpu"):
+    """
+    (tokenizer, model) for the seq2seq generator on `backend`; the model keeps
+    the transformers .generate() API (including streamers).
+    """
+    from transformers import AutoTokenizer
+
+    if backend in ("torch", "quantized"):
+        tokenizer = AutoTokenizer.from_pretrained(name)
+        from transformers import AutoModelForSeq2SeqLM
+        model = AutoModelForSeq2SeqLM.from_pretrained(name).to(device if backend == "torch" else "cpu")
+        model.eval()
+        return tokenizer, (_load_quantized("generator", name, model) if backend == "quantized" else model)
+    if backend == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError as e:
+            raise ImportError(ONNX_HINT) from e
+        out = _onnx_dir("generator")
+        if out.exists():
+            return AutoTokenizer.from_pretrained(str(out)), ORTModelForSeq2SeqLM.from_pretrained(str(out))
+        tokenizer = AutoTokenizer.from_pretrained(name)
+        model = ORTModelForSeq2SeqLM.from_pretrained(name, export=True)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        model.save_pretrained(str(out))
+        tokenizer.save_pretrained(str(out))
+        return tokenizer, model
+    raise ValueError(f"Unknown backend {backend!r}; choose from {BACKENDS}")
+
+
+def _rss_mb() -> float:
+    # Current resident set size (ru_maxrss is the process-wide peak, so it cannot show the
+    # second model's growth); None where neither /proc nor psutil is available
+    gc.collect()
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 2 ** 20
+
+
+def check(backend: str, k: int = 5, n_queries: int = 50, n_prompts: int = 3) -> dict:
+    """
+    Compare `backend` against the fp32 torch baseline.
+
+    Encoder: cosine between baseline and backend embeddings of stored chunks
+    and of sample queries, plus top-k overlap of retrieval with each. Generator:
+    exact-match rate of greedy answers. Both report per-call latency.
+
+    Returns:
+        dict: Accuracy and latency figures.
+    """
+    from models import ENCODER_NAME, GENERATOR_NAME
+    from retriever import Retriever
+
+    retriever = Retriever()
+    if not retriever.refresh() or not retriever.meta:
+        raise RuntimeError("No embed store found; run embed_store.py first.")
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(retriever.meta), min(n_queries, len(retriever.meta)), replace=False)
+    texts = [retriever.meta[r]["text"] for r in rows]
+    # Queries: the first sentence-ish span of each sampled chunk
+    queries = [" ".join(t.split()[:12]) or "economics" for t in texts]
+
+    report = {"backend": backend}
+    for label, loader in (("baseline", "torch"), ("candidate", backend)):
+        rss0 = _rss_mb()
+        enc = load_encoder(ENCODER_NAME, loader)
+        enc.encode(queries[:2], normalize_embeddings=True)  # warm-up
+        t0 = time.perf_counter()
+        q = np.asarray(enc.encode(queries, normalize_embeddings=True), dtype="float32")
+        q_ms = (time.perf_counter() - t0) * 1000.0 / len(queries)
+        c = np.asarray(enc.encode(texts, normalize_embeddings=True), dtype="float32")
+        rss1 = _rss_mb()
+        report[label] = {"q": q, "c": c, "encode_ms_per_query": round(q_ms, 2),
+                         "rss_growth_mb": None if rss0 is None else round(rss1 - rss0, 1)}
+        del enc  # released (and collected by _rss_mb) before the candidate is measured
+
+    base, cand = report.pop("baseline"), report.pop("candidate")
+    _, I_base = retriever.search_vectors(base["q"], k)
+    _, I_cand = retriever.search_vectors(cand["q"], k)
+    from ann_index import recall_at_k
+    report["encoder"] = {
+        "query_cosine_mean": round(float((base["q"] * cand["q"]).sum(1).mean()), 5),
+        "chunk_cosine_min": round(float((base["c"] * cand["c"]).sum(1).min()), 5),
+        f"top{k}_overlap": round(recall_at_k(I_cand, I_base), 4),
+        "encode_ms_per_query": {"torch": base["encode_ms_per_query"], backend: cand["encode_ms_per_query"]},
+        "rss_growth_mb": {"torch": base["rss_growth_mb"], backend: cand["rss_growth_mb"]},
+    }
+
+    prompts = [f"Answer briefly: {qq}?" for qq in queries[:n_prompts]]
+    answers, times = {}, {}
+    for loader in ("torch", backend):
+        tok, gen = load_generator(GENERATOR_NAME, loader)
+        t0 = time.perf_counter()
+        outs = []
+        for p in prompts:
+            ids = tok(p, return_tensors="pt", truncation=True)
+            outs.append(tok.decode(gen.generate(**ids, max_new_tokens=48, num_beams=1)[0], skip_special_tokens=True))
+        times[loader] = round((time.perf_counter() - t0) * 1000.0 / len(prompts), 1)
+        answers[loader] = outs
+        del gen
+    report["generator"] = {
+        "exact_match": round(float(np.mean([a == b for a, b in zip(answers["torch"], answers[backend])])), 3),
+        "generate_ms_per_answer": times,
+    }
+    return report
+
+
+if __name__ == "__main__":
+    from models import ENCODER_NAME, GENERATOR_NAME
+
+    ap = argparse.ArgumentParser(description="Export / check CPU inference backends")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    e = sub.add_parser("export", help="convert both models and store them under data/models")
+    e.add_argument("--backend", choices=["onnx"], default="onnx")
+    c = sub.add_parser("check", help="compare a backend against fp32 torch")
+    c.add_argument("--backend", choices=BACKENDS, required=True)
+    c.add_argument("--k", type=int, default=5)
+    c.add_argument("--queries", type=int, default=50)
+    args = ap.parse_args()
+
+    if args.cmd == "export":
+        load_encoder(ENCODER_NAME, args.backend)
+        load_generator(GENERATOR_NAME, args.backend)
+        print(f"✅ Exported {args.backend} models to {MODELS_DIR}")
+    else:
+        print(json.dumps(check(args.backend, args.k, args.queries), indent=2))
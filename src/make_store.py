@@ -1,17 +1,14 @@
 # src/make_store.py
-import json, pickle
-from pathlib import Path
-
-DATA_DIR = Path("../data")
-META_FILE = DATA_DIR / "emb_metadata.jsonl"
-STORE_FILE = DATA_DIR / "store.pkl"
-
-meta = []
-with open(META_FILE, "r", encoding="utf-8") as f:
-    for line in f:
-        meta.append(json.loads(line))
-
-with open(STORE_FILE, "wb") as f:
-    pickle.dump(meta, f)
-
-print("Wrote", STORE_FILE, "with", len(meta), "entries")
+# Builds the memory-mapped chunk store (data/chunk_store/) from emb_metadata.jsonl.
+# Replaces the old store.pkl: lookups are O(k) and nothing is unpickled.
+import argparse
+from chunk_store import META_FILE, STORE_DIR, build_from_jsonl
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Build data/chunk_store from emb_metadata.jsonl")
+    ap.add_argument("--meta", default=str(META_FILE))
+    ap.add_argument("--out", default=str(STORE_DIR))
+    args = ap.parse_args()
+
+    n = build_from_jsonl(args.meta, args.out)
+    print("Wrote", args.out, "with", n, "entries")
@@ -0,0 +1,94 @@
+# src/metadata_filter.py
+"""
+Metadata Filter Module
+----------------------
+Precomputed inverted row lists for filtering retrieval by subject, topic,
+difficulty and page range.
+
+Each categorical field maps value -> sorted array of metadata rows; pages are
+kept as one sorted array so a range resolves with two binary searches.
+A filter resolves to the set of allowed rows (intersection across fields,
+union within a field), which the Retriever hands to FAISS as an IDSelector so
+filtering happens during the search instead of after it.
+
+Filters are plain dicts:
+    {"subject": ["Economics"], "topic": ["Money"], "difficulty": ["easy"], "page_range": (10, 25)}
+Missing / empty entries do not restrict.
+"""
+
+import numpy as np
+
+FILTER_FIELDS = ("subject", "topic", "difficulty")
+
+
+def is_empty(filters: dict) -> bool:
+    """True if `filters` does not restrict anything."""
+    return not filters or not any(filters.get(f) for f in FILTER_FIELDS + ("page_range",))
+
+
+class FilterIndex:
+    """
+    Inverted lists over the metadata of one loaded index.
+
+    Args:
+        meta: ChunkStore (coded columns are used directly) or list of metadata dicts.
+    """
+
+    def __init__(self, meta):
+        self.n = len(meta)
+        self.lists = {}
+        if hasattr(meta, "column"):
+            for f in FILTER_FIELDS:
+                codes = np.asarray(meta.column(f))
+                order = np.argsort(codes, kind="stable")
+                bounds = np.searchsorted(codes[order], np.arange(len(meta.vocab(f)) + 1))
+                self.lists[f] = {v: order[bounds[c]:bounds[c + 1]] for c, v in enumerate(meta.vocab(f))}
+            pages = np.asarray(meta.column("page"))
+        else:
+            for f in FILTER_FIELDS:
+                groups = {}
+                for row, m in enumerate(meta):
+                    if m.get(f) is not None:
+                        groups.setdefault(m[f], []).append(row)
+                self.lists[f] = {v: np.asarray(rows, dtype="int64") for v, rows in groups.items()}
+            pages = np.array([m.get("page") if isinstance(m.get("page"), int) else -1 for m in meta], dtype="int64")
+        known = np.flatnonzero(pages >= 0)
+        order = known[np.argsort(pages[known], kind="stable")]
+        self._page_rows, self._pages = order, pages[order]
+
+    def values(self, field: str) -> list:
+        """Distinct values of a field, for building filter controls."""
+        return sorted(self.lists.get(field, {}), key=str)
+
+    def page_bounds(self):
+        """(min page, max page), or None if no chunk has a page."""
+        if not len(self._pages):
+            return None
+        return int(self._pages[0]), int(self._pages[-1])
+
+    def resolve(self, filters: dict):
+        """
+        Rows allowed by `filters`.
+
+        Returns:
+            np.ndarray | None: Sorted int64 rows, or None if nothing is filtered.
+        """
+        if is_empty(filters):
+            return None
+        allowed = None
+        for f in FILTER_FIELDS:
+            wanted = filters.get(f)
+            if not wanted:
+                continue
+            if isinstance(wanted, str):
+                wanted = [wanted]
+            parts = [self.lists[f][v] for v in wanted if v in self.lists.get(f, {})]
+            rows = np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype="int64")
+            allowed = rows if allowed is None else np.intersect1d(allowed, rows, assume_unique=True)
+        if filters.get("page_range"):
+            lo, hi = filters["page_range"]
+            a = np.searchsorted(self._pages, lo, side="left")
+            b = np.searchsorted(self._pages, hi, side="right")
+            rows = np.sort(self._page_rows[a:b])
+            allowed = rows if allowed is None else np.intersect1d(allowed, rows, assume_unique=True)
+        return np.asarray(allowed, dtype="int64")
@@ -0,0 +1,141 @@
+# src/models.py
+"""
+Model Registry
+--------------
+One lazily-loaded, process-wide instance per model.
+
+Nothing heavy is imported at module import time: sentence-transformers,
+transformers and torch are imported by the loader on first use, so code
+paths that never encode or generate never pay for them.
+
+Functions:
+- get_encoder(): shared SentenceTransformer (all-MiniLM-L6-v2).
+- get_generator(): shared (tokenizer, model) for flan-t5-small.
+- warm(*names, background=True): preload models, optionally in a thread.
+- register(name, instance): use a given instance (e.g. the benchmark's stand-in encoder).
+- load_times: seconds spent importing + loading each model.
+
+Usage:
+    python models.py            # print cold-start import/load times
+"""
+
+import os
+import threading
+import time
+
+ENCODER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+GENERATOR_NAME = "google/flan-t5-small"  # small, free
+DEVICE = "cpu"  # colab with GPU can use "cuda"
+# Inference backend: "torch" (fp32), "quantized" (int8 dynamic) or "onnx", see inference_backend.py
+BACKEND = os.environ.get("RAG_BACKEND", "torch")
+# Intra-op threads for torch inference; 0 keeps torch's default (physical cores)
+TORCH_THREADS = int(os.environ.get("RAG_TORCH_THREADS", "0"))
+
+_instances = {}
+_locks = {"encoder": threading.Lock(), "generator": threading.Lock()}
+load_times = {}
+
+
+def _set_threads():
+    if TORCH_THREADS > 0:
+        import torch
+        torch.set_num_threads(TORCH_THREADS)
+
+
+def _load_encoder():
+    _set_threads()
+    from inference_backend import load_encoder
+    return load_encoder(ENCODER_NAME, BACKEND, DEVICE)
+
+
+def _load_generator():
+    _set_threads()
+    from inference_backend import load_generator
+    return load_generator(GENERATOR_NAME, BACKEND, DEVICE)
+
+
+_LOADERS = {"encoder": _load_encoder, "generator": _load_generator}
+
+
+def get(name: str):
+    """
+    Return the shared instance of a model, loading it on first use.
+
+    Args:
+        name (str): "encoder" or "generator".
+    """
+    inst = _instances.get(name)
+    if inst is not None:
+        return inst
+    with _locks[name]:
+        if name not in _instances:
+            t0 = time.perf_counter()
+            _instances[name] = _LOADERS[name]()
+            load_times[name] = round(time.perf_counter() - t0, 3)
+            print(f"[INFO] Loaded {name} in {load_times[name]}s")
+    return _instances[name]
+
+
+def get_encoder():
+    """Shared SentenceTransformer encoder."""
+    return get("encoder")
+
+
+def get_generator():
+    """Shared (tokenizer, model) pair for the seq2seq generator."""
+    return get("generator")
+
+
+def register(name: str, instance) -> None:
+    """Use `instance` as the shared "encoder" / "generator" instead of loading the model."""
+    if name not in _LOADERS:
+        raise ValueError(f"Unknown model {name!r}; choose from {list(_LOADERS)}")
+    with _locks[name]:
+        _instances[name] = instance
+
+
+def is_loaded(name: str) -> bool:
+    return name in _instances
+
+
+def warm(*names, background: bool = True):
+    """
+    Preload models so the first request does not pay the load time.
+
+    Args:
+        *names (str): Models to load; defaults to all.
+        background (bool): Load in a daemon thread and return it immediately.
+
+    Returns:
+        threading.Thread | None: The loader thread when background=True.
+    """
+    names = [n for n in (names or _LOADERS) if not is_loaded(n)]
+    if not names:
+        return None
+
+    def _run():
+        for n in names:
+            try:
+                get(n)
+            except Exception as e:
+                print(f"[WARN] Could not warm {n}: {e}")
+
+    if not background:
+        _run()
+        return None
+    t = threading.Thread(target=_run, name="model-warmup", daemon=True)
+    t.start()
+    return t
+
+
+if __name__ == "__main__":
+    import importlib
+
+    for mod in ("numpy", "faiss", "torch", "transformers", "sentence_transformers"):
+        t0 = time.perf_counter()
+        importlib.import_module(mod)
+        print(f"import {mod:<22} {time.perf_counter() - t0:7.3f}s")
+    for n in _LOADERS:
+        get(n)
+    for n, s in load_times.items():
+        print(f"load   {n:<22} {s:7.3f}s")
@@ -0,0 +1,317 @@
+# src/pipeline.py
+"""
+Streaming Pipeline Module
+-------------------------
+PDF pages -> chunks -> embeddings -> FAISS index in one pass, with memory
+bounded by the batch size instead of the corpus size.
+
+Pages stream out of ingest_pdf.iter_pages, are chunked with
+chunker.chunk_records and encoded in fixed-size batches. Each batch is
+appended to the FAISS index, to an appendable embeddings .npy file and to the
+metadata JSONL, then dropped. IVF / PQ indexes are trained on the first
+`train_size` vectors read back from the embeddings file.
+
+The build happens in data/pipeline_work/ and is checkpointed every few
+batches (index, file sizes and pages consumed). An interrupted run resumes
+from the last checkpoint; a finished run moves the files into data/, where
+the Retriever and embed_store.py pick them up (same file layout and manifest).
+
+With emb_dtype "fp16" / "int8" the finished embeddings.npy is also
+streamed into the compact, memory-mapped retrieval copy (compact_embeddings.py).
+
+Note: the FAISS index itself still grows with the corpus (it is what
+retrieval serves from); ivf_pq keeps it at a few bytes per vector.
+
+Usage:
+    python pipeline.py data/books/ --batch-size 256 --index-type ivf_pq --workers 4
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import struct
+import time
+from pathlib import Path
+import numpy as np
+from tqdm import tqdm
+
+from chunker import chunk_records
+from chunk_store import build_from_jsonl
+from bm25_index import build_from_jsonl as bm25_from_jsonl
+from compact_embeddings import build_compact
+from embed_store import DATA_DIR, MODEL_NAME, ENCODE_BATCH_SIZE, store_paths, content_hash
+
+WORK_DIR_NAME = "pipeline_work"
+STATE_FILE_NAME = "pipeline_state.json"
+BATCH_SIZE = 256          # chunks encoded and appended per step
+CHECKPOINT_EVERY = 20     # batches between checkpoints
+TRAIN_SIZE = 100_000      # vectors used to train IVF / PQ indexes
+
+
+class NpyAppender:
+    """
+    A float32 (rows, dim) .npy file that grows by appending rows.
+
+    The header is padded to a fixed size so the row count can be rewritten in
+    place on every flush; the file is a valid .npy (np.load / mmap) after each flush.
+
+    Args:
+        path (Path): File to write.
+        dim (int): Row width.
+        rows (int): Existing rows to keep (resume); extra bytes are truncated.
+    """
+
+    HEADER_LEN = 128
+
+    def __init__(self, path: Path, dim: int, rows: int = 0):
+        self.path, self.dim, self.rows = Path(path), dim, rows
+        mode = "r+b" if rows and self.path.exists() else "w+b"
+        self._f = open(self.path, mode)
+        self._f.truncate(self.HEADER_LEN + rows * dim * 4)
+        self.flush()
+        self._f.seek(0, os.SEEK_END)
+
+    def _header(self) -> bytes:
+        d = f"{{'descr': '<f4', 'fortran_order': False, 'shape': ({self.rows}, {self.dim}), }}"
+        body = d.ljust(self.HEADER_LEN - 10 - 1) + "\n"
+        return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(body)) + body.encode("latin1")
+
+    def append(self, rows: np.ndarray) -> None:
+        rows = np.ascontiguousarray(rows, dtype="<f4")
+        self._f.write(rows.tobytes())
+        self.rows += rows.shape[0]
+
+    def flush(self) -> None:
+        pos = self._f.tell()
+        self._f.seek(0)
+        self._f.write(self._header())
+        self._f.seek(pos)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        self.flush()
+        self._f.close()
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _write_json(path: Path, obj) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def _write_manifest(path: Path, meta_path: Path, dim: int, next_id: int) -> None:
+    # Same layout as embed_store's manifest, streamed so it never sits in memory
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"model": MODEL_NAME, "dim": dim, "next_id": next_id})[:-1] + ', "chunks": {')
+        with open(meta_path, "r", encoding="utf-8") as meta:
+            for i, line in enumerate(meta):
+                m = json.loads(line)
+                entry = {"hash": content_hash(m["text"]), "faiss_id": m["faiss_id"]}
+                f.write((", " if i else "") + json.dumps(str(m["id"])) + ": " + json.dumps(entry))
+        f.write("}}")
+
+
+class _IndexSink:
+    """Owns the FAISS index: defers creation until enough vectors exist to train it."""
+
+    def __init__(self, params: dict, dim: int, train_size: int):
+        from ann_index import default_params
+        self.params, self.dim, self.train_size = dict(params), dim, train_size
+        self.needs_training = self.params["type"].startswith("ivf")
+        self.index = None
+        if not self.needs_training:
+            self._create(default_params(self.params["type"], 0, dim))
+
+    def _create(self, defaults: dict, train: np.ndarray = None) -> None:
+        import faiss
+        from ann_index import _make, apply_search_params
+        self.params = {**defaults, **self.params}
+        base = _make(self.dim, self.params)
+        if train is not None:
+            base.train(np.ascontiguousarray(train, dtype="float32"))
+        self.index = faiss.IndexIDMap(base)
+        apply_search_params(self.index, self.params)
+
+    def ready(self, total_rows: int, final: bool = False) -> bool:
+        return self.index is not None or total_rows >= self.train_size or (final and total_rows > 0)
+
+    def train_from(self, emb_path: Path, total_rows: int, block: int = 8192) -> None:
+        """Create + train the index on the stored rows, then add them in blocks."""
+        from ann_index import default_params
+        emb = np.load(emb_path, mmap_mode="r")
+        n_train = min(total_rows, self.train_size)
+        params = default_params(self.params["type"], n_train, self.dim)
+        if params["type"] == "ivf_pq" and n_train < 2 ** self.params.get("nbits", params["nbits"]):
+            print(f"[WARN] {n_train} vectors is too few to train ivf_pq; falling back to flat.")
+            self.params = {"type": "flat"}
+            params = default_params("flat", n_train, self.dim)
+        self._create(params, emb[:n_train] if params["type"].startswith("ivf") else None)
+        for s in range(0, total_rows, block):
+            e = min(s + block, total_rows)
+            self.add(np.asarray(emb[s:e]), np.arange(s, e, dtype="int64"))
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        self.index.add_with_ids(np.ascontiguousarray(vectors, dtype="float32"), ids)
+
+
+def run_pipeline(paths, data_dir: Path = None, batch_size: int = BATCH_SIZE, index_params: dict = None,
+                 workers: int = 1, backend: str = None, subject: str = "Economics",
+                 checkpoint_every: int = CHECKPOINT_EVERY, train_size: int = TRAIN_SIZE,
+                 resume: bool = True, emb_dtype: str = "fp32") -> dict:
+    """
+    Stream PDFs into a complete embed store.
+
+    Args:
+        paths (list): PDF files and/or folders.
+        data_dir (Path): Store directory; defaults to DATA_DIR.
+        batch_size (int): Chunks per encode/append step (peak memory scales with this).
+        index_params (dict): ann_index parameters, e.g. {"type": "ivf_pq"}; default flat.
+        workers (int): Processes for PDF page extraction.
+        backend (str): PDF backend (see ingest_pdf.BACKENDS).
+        subject (str): Subject recorded on every chunk.
+        checkpoint_every (int): Batches between checkpoints.
+        train_size (int): Vectors used to train IVF / PQ indexes.
+        resume (bool): Continue from an existing checkpoint for the same inputs.
+        emb_dtype (str): "fp32", "fp16" or "int8" compact copy of the embeddings for retrieval.
+
+    Returns:
+        dict: {"pages", "chunks", "seconds", "chunks_per_sec", "peak_rss_mb"}.
+    """
+    import faiss
+    from ann_index import save_params, replace_index
+    from ingest_pdf import iter_pages, collect_pdfs
+    from models import get_encoder
+
+    data_dir = Path(data_dir) if data_dir else DATA_DIR
+    work = data_dir / WORK_DIR_NAME
+    out, final = store_paths(work), store_paths(data_dir)
+    state_path = work / STATE_FILE_NAME
+    inputs = [str(p.resolve()) for p in collect_pdfs(paths)]
+    params = dict(index_params or {"type": "flat"})
+    model = get_encoder()
+    dim = int(model.get_sentence_embedding_dimension())
+
+    state = None
+    if resume and state_path.exists():
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("inputs") != inputs or state.get("model") != MODEL_NAME or state.get("type") != params["type"]:
+            print("[WARN] Checkpoint is for different inputs or settings; starting over.")
+            state = None
+    if state is None:
+        shutil.rmtree(work, ignore_errors=True)
+        work.mkdir(parents=True)
+        state = {"inputs": inputs, "model": MODEL_NAME, "type": params["type"], "params": params,
+                 "pages": 0, "rows": 0, "meta_bytes": 0, "indexed": False}
+    else:
+        print(f"[INFO] Resuming after {state['pages']} pages / {state['rows']} chunks.")
+
+    sink = _IndexSink(state["params"], dim, train_size)
+    if state["indexed"]:
+        sink.index = faiss.read_index(str(out["index"]))
+        sink.params = state["params"]
+    emb_file = NpyAppender(out["embeddings"], dim, rows=state["rows"])
+    meta_f = open(out["meta"], "a+b")
+    meta_f.truncate(state["meta_bytes"])
+    meta_f.seek(0, os.SEEK_END)
+
+    def checkpoint():
+        emb_file.flush()
+        meta_f.flush()
+        os.fsync(meta_f.fileno())
+        if sink.index is not None:
+            tmp = out["index"].with_name(out["index"].name + ".tmp")
+            faiss.write_index(sink.index, str(tmp))
+            os.replace(tmp, out["index"])
+        state.update(rows=emb_file.rows, meta_bytes=meta_f.tell(), indexed=sink.index is not None,
+                     params=sink.params)
+        _write_json(state_path, state)
+
+    def flush(batch):
+        vecs = model.encode([c["text"] for c in batch], batch_size=ENCODE_BATCH_SIZE,
+                            convert_to_numpy=True, normalize_embeddings=True)
+        start = emb_file.rows
+        ids = np.arange(start, start + len(batch), dtype="int64")
+        emb_file.append(vecs)
+        for c, fid in zip(batch, ids):
+            meta_f.write((json.dumps(dict(c, faiss_id=int(fid)), ensure_ascii=False) + "\n").encode("utf-8"))
+        if sink.index is not None:
+            sink.add(vecs, ids)
+        elif sink.ready(emb_file.rows):
+            emb_file.flush()
+            sink.train_from(out["embeddings"], emb_file.rows)
+
+    t0 = time.perf_counter()
+    pages_done, n_batches, batch, rows0 = state["pages"], 0, [], state["rows"]
+    try:
+        pages = iter_pages(paths, backend, workers, subject, skip=pages_done)
+        for page in tqdm(pages, desc="Pages", unit="page", initial=pages_done):
+            batch.extend(chunk_records([page]))
+            pages_done += 1
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+                n_batches += 1
+                # Buffer is empty here, so every consumed page is fully stored
+                state["pages"] = pages_done
+                if n_batches % checkpoint_every == 0:
+                    checkpoint()
+        if batch:
+            flush(batch)
+        state["pages"] = pages_done
+        if sink.index is None and sink.ready(emb_file.rows, final=True):
+            emb_file.flush()
+            sink.train_from(out["embeddings"], emb_file.rows)
+        checkpoint()
+    finally:
+        emb_file.close()
+        meta_f.close()
+
+    if sink.index is None:
+        print("⚠️ No text found in the given PDFs; nothing to index.")
+        return {"pages": pages_done, "chunks": 0}
+
+    # Finalize: params + manifest, then move into place (manifest last marks a consistent store)
+    save_params(out["index"], sink.params)
+    _write_manifest(out["manifest"], out["meta"], dim, emb_file.rows)
+    replace_index(out["index"], final["index"])  # index, then its params
+    for key in ("embeddings", "meta", "manifest"):
+        os.replace(out[key], final[key])
+    shutil.rmtree(work, ignore_errors=True)
+    build_from_jsonl(final["meta"], final["chunk_store"])
+    bm25_from_jsonl(final["meta"], final["index"])
+    build_compact(final["embeddings"], emb_dtype)
+
+    secs = time.perf_counter() - t0
+    n_new = emb_file.rows - rows0
+    stats = {"pages": pages_done, "chunks": emb_file.rows, "seconds": round(secs, 1),
+             "chunks_per_sec": round(n_new / secs, 1) if secs else 0.0, "peak_rss_mb": round(_peak_rss_mb(), 1)}
+    print(f"✅ Indexed {stats['chunks']} chunks from {pages_done} pages into {data_dir} "
+          f"({stats['chunks_per_sec']} chunks/sec, peak RSS {stats['peak_rss_mb']} MB).")
+    return stats
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Stream PDFs -> chunks -> embeddings -> FAISS index")
+    ap.add_argument("paths", nargs="*", default=[str(DATA_DIR)], help="PDF files or folders (default: data/)")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--index-type", choices=["flat", "ivf_flat", "hnsw", "ivf_pq"], default="flat")
+    ap.add_argument("--workers", type=int, default=1, help="PDF extraction processes")
+    ap.add_argument("--backend", choices=["pymupdf", "pypdf2"], default=None)
+    ap.add_argument("--subject", default="Economics")
+    ap.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY)
+    ap.add_argument("--no-resume", action="store_true", help="ignore an existing checkpoint")
+    ap.add_argument("--emb-dtype", choices=["fp32", "fp16", "int8"], default="fp32",
+                    help="also write fp16 / int8 memory-mapped embeddings for retrieval")
+    args = ap.parse_args()
+    run_pipeline(args.paths, batch_size=args.batch_size, index_params={"type": args.index_type},
+                 workers=args.workers, backend=args.backend, subject=args.subject,
+                 checkpoint_every=args.checkpoint_every, resume=not args.no_resume, emb_dtype=args.emb_dtype)
@@ -1,75 +1,259 @@
 # src/process_videos.py
-from youtube_transcript_api import YouTubeTranscriptApi
+"""
+Video Lessons Module
+--------------------
+Turns YouTube videos into lesson records (transcript text, key terms,
+timestamped highlights, MCQs, essay question) in video_transcripts.jsonl.
+
+- Transcripts are fetched concurrently, rate-limited and cached per video
+  (see transcript_fetcher.py); lessons are generated as transcripts arrive.
+- YAKE runs once per video; its key terms drive the highlight engine
+  (highlights.py).
+- MCQ and essay prompts of many videos are generated together in padded,
+  token-length-bucketed batches (generate_questions.generate_batch).
+- Output is append-only and resumable: videos already in the output file are
+  skipped, records are flushed after every generation batch, and per-video
+  job state (data/lesson_jobs.json) keeps failed or unavailable videos from
+  being retried forever.
+
+Usage:
+    python process_videos.py                                 # data/video_playlist.txt
+    python process_videos.py OPV1BOs1ISI https://youtu.be/... --workers 8 --rate 5
+    python process_videos.py --transport local --local-dir tests/transcripts
+"""
+
+import argparse
 import json
+import os
+import time
 from pathlib import Path
 from tqdm import tqdm
 import yake
-from generate_questions import generate_questions_for_text
+from generate_questions import generate_questions_for_text, generate_questions_for_texts
+import transcript_fetcher as tf
+from highlights import top_highlights
 
-DATA_DIR = Path("../data")
-VIDEO_IDS = [
-    # example: parse playlist to get IDs or manually list
-    # 'OPV1BOs1ISI' etc. For the playlist you provided, you can extract IDs
-]
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT_DIR / "data"
+PLAYLIST_FILE = DATA_DIR / "video_playlist.txt"
 
 OUT_TRANSCRIPTS = DATA_DIR / "video_transcripts.jsonl"
+JOBS_FILE = DATA_DIR / "lesson_jobs.json"
+GEN_BATCH_VIDEOS = 16  # videos whose MCQ / essay prompts are generated together
+MAX_ATTEMPTS = 3       # runs that retry a video after transient failures
 YAKE_KW = yake.KeywordExtractor(lan="en", n=2, top=8)
 
-def get_transcript(video_id):
+def get_transcript(video_id, transport=None):
     try:
-        trans = YouTubeTranscriptApi.get_transcript(video_id)
-        return trans
+        return tf.fetch_with_retry((transport or tf.YouTubeTransport()).fetch, video_id)
     except Exception as e:
         print("Transcript error", video_id, e)
         return []
 
-def timestamped_highlights(transcript, top_n=8):
-    # aggregate sentences -> compute scores by keyword counts
-    text = " ".join([t['text'] for t in transcript])
-    kws = [k for k, _ in YAKE_KW.extract_keywords(text)]
-    highlights = []
-    for t in transcript:
-        score = sum(1 for kw in kws if kw.lower() in t['text'].lower())
-        highlights.append((t, score))
-    highlights_sorted = sorted(highlights, key=lambda x: x[1], reverse=True)
-    # return top_n unique timestamps
-    top = []
-    seen_t = set()
-    for t, sc in highlights_sorted:
-        start = int(t['start'])
-        if start not in seen_t:
-            top.append({"start": t['start'], "duration": t.get('duration',0), "text": t['text']})
-            seen_t.add(start)
-        if len(top) >= top_n:
-            break
-    return top
-
-def process(video_id):
-    trans = get_transcript(video_id)
-    if not trans:
-        return
+def timestamped_highlights(transcript, top_n=8, keywords=None, window=False):
+    # Segments mentioning the most key terms; pass the video's keyterms to skip a second YAKE run
+    if keywords is None:
+        text = " ".join([t['text'] for t in transcript])
+        keywords = [k for k, _ in YAKE_KW.extract_keywords(text)]
+    return top_highlights(transcript, keywords, top_n=top_n, window=window)
+
+def analyze(video_id, trans, window=False):
+    # Lesson record without the generated questions
     text = " ".join([t['text'] for t in trans])
     keyterms = [k for k,_ in YAKE_KW.extract_keywords(text)]
-    highlights = timestamped_highlights(trans)
+    highlights = timestamped_highlights(trans, keywords=keyterms, window=window)
+    return {"video_id": video_id, "text": text, "keyterms": keyterms, "highlights": highlights}
+
+def process(video_id, transcript=None, window=False):
+    trans = transcript if transcript is not None else get_transcript(video_id)
+    if not trans:
+        return
+    rec = analyze(video_id, trans, window)
     # generate questions
-    mcqs, essay = generate_questions_for_text(text)
-    rec = {
-        "video_id": video_id,
-        "text": text,
-        "keyterms": keyterms,
-        "highlights": highlights,
-        "mcqs": mcqs,
-        "essay": essay
-    }
+    rec["mcqs"], rec["essay"] = generate_questions_for_text(rec["text"])
     return rec
 
+class JobState:
+    """
+    Per-video job status (done / generating / failed / unavailable), saved
+    atomically to a JSON file so interrupted or failed runs resume.
+
+    Args:
+        path (Path): State file.
+    """
+
+    def __init__(self, path=JOBS_FILE):
+        self.path = Path(path)
+        self.jobs = {}
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.jobs = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"[WARN] Ignoring unreadable job state {self.path}: {e}")
+
+    def mark(self, video_id, status, error=None):
+        job = self.jobs.setdefault(video_id, {"attempts": 0})
+        if status in ("failed", "unavailable"):
+            job["attempts"] += 1
+        job.update(status=status, error=None if error is None else str(error), updated=time.time())
+
+    def runnable(self, video_id, retry_failed=False):
+        """False for videos that are done or should not be retried."""
+        job = self.jobs.get(video_id)
+        if job is None or retry_failed:
+            return True
+        if job["status"] == "unavailable":
+            return False
+        return job["status"] != "done" and job["attempts"] < MAX_ATTEMPTS
+
+    def counts(self):
+        out = {}
+        for job in self.jobs.values():
+            out[job["status"]] = out.get(job["status"], 0) + 1
+        return out
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.jobs, f)
+        os.replace(tmp, self.path)
+
+def processed_ids(out_path=OUT_TRANSCRIPTS):
+    """
+    Video ids already in the output file. A torn last line (crash mid-write)
+    is cut off so appending continues from the last complete record.
+    """
+    out_path = Path(out_path)
+    if not out_path.exists():
+        return set()
+    done, good = set(), 0
+    with open(out_path, "rb") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["video_id"])
+            except (ValueError, KeyError):
+                break
+            good += len(line)
+    if good < out_path.stat().st_size:
+        print(f"[WARN] Truncating incomplete record at byte {good} of {out_path}")
+        with open(out_path, "r+b") as f:
+            f.truncate(good)
+    return done
+
+def run(video_ids, out_path=OUT_TRANSCRIPTS, transport=None, workers=tf.WORKERS, calls=tf.RATE_CALLS,
+        period=tf.RATE_PERIOD, retries=tf.RETRIES, cache_dir=tf.CACHE_DIR, resume=True, window=False,
+        gen_batch=GEN_BATCH_VIDEOS, jobs_path=JOBS_FILE, retry_failed=False):
+    """
+    Fetch and process videos, appending one lesson record per video.
+
+    Transcripts are analysed as they arrive; every `gen_batch` videos the MCQ
+    and essay prompts are generated together in padded, length-bucketed
+    batches and the finished lessons are appended.
+
+    Args:
+        video_ids (list[str]): Videos to process.
+        out_path (Path): Output JSONL.
+        transport: Transcript transport (default YouTubeTransport).
+        workers, calls, period, retries: Fetcher concurrency, rate limit and retries.
+        cache_dir (Path): Per-video transcript cache (None disables it).
+        resume (bool): Skip videos already in out_path; False starts a new file.
+        window (bool): Build highlights from sentence windows instead of single caption lines.
+        gen_batch (int): Videos per lesson-generation batch.
+        jobs_path (Path): Per-video job state file.
+        retry_failed (bool): Also retry videos that failed before or have no transcript.
+
+    Returns:
+        dict: Counts of written, skipped and failed videos.
+    """
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    if not resume:
+        for p in (out_path, Path(jobs_path)):
+            if p.exists():
+                p.unlink()
+    jobs = JobState(jobs_path)
+    done = processed_ids(out_path)
+    for vid in done:
+        if jobs.jobs.get(vid, {}).get("status") != "done":
+            jobs.mark(vid, "done")
+    unique = list(dict.fromkeys(video_ids))
+    todo = [v for v in unique if v not in done and jobs.runnable(v, retry_failed)]
+    stats = {"written": 0, "skipped": len(unique) - len(todo), "failed": 0}
+    if stats["skipped"]:
+        print(f"[INFO] Resuming: skipping {stats['skipped']} videos ({jobs.counts()})")
+
+    gen_stats, t0 = {"calls": 0, "tokens": 0, "padded_tokens": 0}, time.perf_counter()  # zero if every prompt is cached
+
+    def _flush(pending, f):
+        # One batched generation pass for all pending videos, then append their lessons
+        questions = generate_questions_for_texts([rec["text"] for rec in pending], stats=gen_stats)
+        for rec, (mcqs, essay) in zip(pending, questions):
+            rec["mcqs"], rec["essay"] = mcqs, essay
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+        for rec in pending:
+            jobs.mark(rec["video_id"], "done")
+        jobs.save()
+        stats["written"] += len(pending)
+        hours = (time.perf_counter() - t0) / 3600
+        padding = 1 - gen_stats["tokens"] / max(gen_stats["padded_tokens"], 1)
+        print(f"Lessons: {stats['written']} videos ({stats['written'] / hours:.0f} videos/hour, "
+              f"{gen_stats['calls']} generate calls, {padding:.0%} padding)")
+        pending.clear()
+
+    fetched = tf.fetch_transcripts(todo, transport, workers, calls, period, retries, cache_dir=cache_dir)
+    pending = []
+    try:
+        with open(out_path, "a", encoding="utf-8") as f:
+            for vid, trans, err in tqdm(fetched, total=len(todo), desc="Videos"):
+                if err is not None or not trans:
+                    print("Transcript error", vid, err or "empty transcript")
+                    permanent = err is None or isinstance(err, tf.TranscriptUnavailable)
+                    jobs.mark(vid, "unavailable" if permanent else "failed", err)
+                    jobs.save()
+                    stats["failed"] += 1
+                    continue
+                pending.append(analyze(vid, trans, window))
+                jobs.mark(vid, "generating")
+                if len(pending) >= gen_batch:
+                    _flush(pending, f)
+            if pending:
+                _flush(pending, f)
+    finally:
+        jobs.save()
+    return stats
+
 if __name__=="__main__":
-    # list video ids manually or parse playlist
-    # For demo, fill VIDEO_IDS with a few IDs
-    VIDEO_IDS = ["OPV1BOs1ISI"]  # example
-    with open(OUT_TRANSCRIPTS, "w", encoding="utf-8") as f:
-        for vid in VIDEO_IDS:
-            rec = process(vid)
-            if rec:
-                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
-    print("Saved transcripts and lessons to", OUT_TRANSCRIPTS)
\ No newline at end of file
+    ap = argparse.ArgumentParser(description="Fetch YouTube transcripts and generate lesson records")
+    ap.add_argument("videos", nargs="*", help="video ids or URLs (default: read --playlist)")
+    ap.add_argument("--playlist", default=str(PLAYLIST_FILE), help="file with one video id / URL per line")
+    ap.add_argument("--out", default=str(OUT_TRANSCRIPTS))
+    ap.add_argument("--workers", type=int, default=tf.WORKERS)
+    ap.add_argument("--rate", type=int, default=tf.RATE_CALLS, help="max transcript requests per --period")
+    ap.add_argument("--period", type=float, default=tf.RATE_PERIOD, help="rate limit window in seconds")
+    ap.add_argument("--retries", type=int, default=tf.RETRIES)
+    ap.add_argument("--transport", choices=sorted(tf.TRANSPORTS), default="youtube")
+    ap.add_argument("--local-dir", help="transcript directory for --transport local")
+    ap.add_argument("--no-cache", action="store_true", help="do not read or write the transcript cache")
+    ap.add_argument("--sentence-windows", action="store_true",
+                    help="merge adjacent caption lines into sentence windows for highlights")
+    ap.add_argument("--gen-batch", type=int, default=GEN_BATCH_VIDEOS, help="videos per lesson-generation batch")
+    ap.add_argument("--retry-failed", action="store_true", help="retry videos that failed in earlier runs")
+    ap.add_argument("--fresh", action="store_true", help="start a new output file instead of resuming")
+    args = ap.parse_args()
+    if args.transport == "local" and not args.local_dir:
+        ap.error("--transport local needs --local-dir")
+
+    if args.videos:
+        video_ids = [v for v in map(tf.parse_video_id, args.videos) if v]
+    else:
+        video_ids = tf.read_playlist(args.playlist)
+    transport = tf.LocalTransport(args.local_dir) if args.transport == "local" else tf.YouTubeTransport()
+    stats = run(video_ids, args.out, transport, args.workers, args.rate, args.period, args.retries,
+                cache_dir=None if args.no_cache else tf.CACHE_DIR, resume=not args.fresh,
+                window=args.sentence_windows, gen_batch=args.gen_batch, retry_failed=args.retry_failed)
+    print(f"Saved transcripts and lessons to {args.out} "
+          f"({stats['written']} new, {stats['skipped']} already done, {stats['failed']} failed)")
@@ -0,0 +1,188 @@
+# src/query_cache.py
+"""
+Query Cache Module
+------------------
+Two-tier cache in front of retrieval and answer generation.
+
+- Exact tier: LRU of normalized query text -> (query embedding, top-k rows).
+  A hit skips both the encoder and the FAISS search.
+- Semantic tier: past query embeddings -> (retrieved chunks, generated answer).
+  A new query whose cosine similarity to a cached one passes `threshold`
+  reuses that answer without calling flan-t5, but only if the answer was
+  generated with the same settings (decoding strategy, token budgets).
+
+Both tiers are size-bounded (LRU eviction), optionally persisted to disk, and
+cleared automatically when the index fingerprint changes (index rebuilt).
+"""
+
+import json
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", text.strip().lower()).rstrip(" ?!.")
+
+
+class QueryCache:
+    """
+    Exact LRU + semantic answer cache.
+
+    Args:
+        max_exact (int): Max entries in the exact (text) tier.
+        max_semantic (int): Max entries in the semantic (embedding) tier.
+        threshold (float): Cosine similarity needed for a semantic hit.
+        path (Path): Directory for on-disk persistence; None keeps it in memory only.
+    """
+
+    def __init__(self, max_exact=1024, max_semantic=512, threshold=0.92, path=None):
+        self.max_exact = max_exact
+        self.max_semantic = max_semantic
+        self.threshold = threshold
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._exact = OrderedDict()     # norm text -> (emb, rows)
+        self._semantic = OrderedDict()  # norm text -> (emb, payload)
+        self._sem_matrix = None         # stacked semantic embeddings, rebuilt lazily
+        self.counters = {"exact_hits": 0, "exact_misses": 0, "semantic_hits": 0, "semantic_misses": 0}
+        if self.path:
+            self.load()
+
+    # -----------------------------
+    # Invalidation
+    # -----------------------------
+    def validate(self, fingerprint) -> None:
+        """Clear both tiers if the index fingerprint differs from the cached one."""
+        fingerprint = json.loads(json.dumps(fingerprint))  # tuples -> lists, as persisted
+        if fingerprint != self._fingerprint:
+            with self._lock:
+                if self._exact or self._semantic:
+                    print("[INFO] Index changed; clearing query cache.")
+                self._exact.clear()
+                self._semantic.clear()
+                self._sem_matrix = None
+                self._fingerprint = fingerprint
+
+    # -----------------------------
+    # Exact tier
+    # -----------------------------
+    def get_exact(self, query: str, k: int):
+        """
+        Returns:
+            tuple | None: (embedding, rows) on a hit. rows may be None when only
+            the embedding is reusable (cached search used a smaller k).
+        """
+        key = normalize_query(query)
+        with self._lock:
+            hit = self._exact.get(key)
+            if hit is None:
+                self.counters["exact_misses"] += 1
+                return None
+            self._exact.move_to_end(key)
+            self.counters["exact_hits"] += 1
+            emb, rows = hit
+            return emb, (rows[:k] if len(rows) >= k else None)
+
+    def put_exact(self, query: str, emb: np.ndarray, rows) -> None:
+        key = normalize_query(query)
+        with self._lock:
+            self._exact[key] = (np.asarray(emb, dtype="float32"), [int(r) for r in rows])
+            self._exact.move_to_end(key)
+            while len(self._exact) > self.max_exact:
+                self._exact.popitem(last=False)
+
+    # -----------------------------
+    # Semantic tier
+    # -----------------------------
+    def get_semantic(self, emb: np.ndarray, settings: dict = None):
+        """
+        Args:
+            emb (np.ndarray): Query embedding.
+            settings (dict): Generation settings the answer must have been cached with
+                (see put_semantic); entries cached with other settings never match.
+
+        Returns:
+            dict | None: cached payload ({"results", "answer", "query", "settings", "similarity"}) on a hit.
+        """
+        settings = json.loads(json.dumps(settings))  # tuples -> lists, as persisted
+        with self._lock:
+            if not self._semantic:
+                self.counters["semantic_misses"] += 1
+                return None
+            if self._sem_matrix is None:
+                self._sem_matrix = np.stack([e for e, _ in self._semantic.values()])
+            sims = self._sem_matrix @ np.asarray(emb, dtype="float32")
+            same = np.array([p.get("settings") == settings for _, p in self._semantic.values()])
+            sims = np.where(same, sims, -np.inf)
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.counters["semantic_misses"] += 1
+                return None
+            key = list(self._semantic.keys())[best]
+            self._semantic.move_to_end(key)
+            self._sem_matrix = None
+            self.counters["semantic_hits"] += 1
+            return dict(self._semantic[key][1], similarity=float(sims[best]))
+
+    def put_semantic(self, query: str, emb: np.ndarray, results: list[dict], answer: str,
+                     settings: dict = None) -> None:
+        """Cache an answer; `settings` are the generation settings it was produced with."""
+        key = normalize_query(query)
+        payload = {"query": query, "results": results, "answer": answer,
+                   "settings": json.loads(json.dumps(settings))}
+        with self._lock:
+            self._semantic[key] = (np.asarray(emb, dtype="float32"), payload)
+            self._semantic.move_to_end(key)
+            while len(self._semantic) > self.max_semantic:
+                self._semantic.popitem(last=False)
+            self._sem_matrix = None
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def save(self) -> None:
+        """Write both tiers to `path` (no-op without a path)."""
+        if not self.path:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            exact_keys = list(self._exact.keys())
+            sem_keys = list(self._semantic.keys())
+            np.savez(
+                self.path / "embeddings.npz",
+                exact=np.stack([self._exact[k][0] for k in exact_keys]) if exact_keys else np.zeros((0, 0), "float32"),
+                semantic=np.stack([self._semantic[k][0] for k in sem_keys]) if sem_keys else np.zeros((0, 0), "float32"),
+            )
+            state = {
+                "fingerprint": self._fingerprint,
+                "exact": [[k, self._exact[k][1]] for k in exact_keys],
+                "semantic": [[k, self._semantic[k][1]] for k in sem_keys],
+            }
+        with open(self.path / "entries.json", "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+
+    def load(self) -> None:
+        entries, embs = self.path / "entries.json", self.path / "embeddings.npz"
+        if not (entries.exists() and embs.exists()):
+            return
+        try:
+            with open(entries, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            arrays = np.load(embs)
+            self._fingerprint = state["fingerprint"]
+            for (key, rows), emb in zip(state["exact"], arrays["exact"]):
+                self._exact[key] = (emb, rows)
+            for (key, payload), emb in zip(state["semantic"], arrays["semantic"]):
+                self._semantic[key] = (emb, payload)
+        except Exception as e:
+            print(f"[WARN] Could not load query cache from {self.path}: {e}")
+            self._exact.clear()
+            self._semantic.clear()
+
+    def stats(self) -> dict:
+        return dict(self.counters, exact_size=len(self._exact), semantic_size=len(self._semantic))
@@ -0,0 +1,238 @@
+# src/query_server.py
+"""
+Query Server Module
+-------------------
+Micro-batching front end for retrieval and grading.
+
+Concurrent requests are collected for a short window (a few ms) and served
+together: one SentenceTransformer.encode call for every query / answer /
+reference text in the batch, then one multi-row FAISS search.
+
+Usage:
+- In-process:  batcher = QueryBatcher(retriever); await batcher.retrieve("What is GDP?")
+- Local socket: python query_server.py --port 8765   (JSON lines, one request per line)
+    {"op": "retrieve", "query": "What is GDP?", "k": 5}
+    {"op": "grade", "answer": "...", "references": ["...", "..."]}
+    {"op": "stats"}
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+import numpy as np
+from retriever import Retriever
+
+
+class QueryBatcher:
+    """
+    Collects concurrent retrieve/grade requests and serves them in batches.
+
+    Args:
+        retriever (Retriever): Resident retriever (encoder + index).
+        max_wait_ms (float): How long the first request of a batch waits for company.
+        max_batch_size (int): Flush as soon as this many requests are queued.
+    """
+
+    def __init__(self, retriever: Retriever = None, max_wait_ms: float = 5.0, max_batch_size: int = 64):
+        self.retriever = retriever or Retriever()
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = None
+        self._worker = None
+        self._started = None
+        self._n_requests = 0
+        self._n_batches = 0
+        self._busy_s = 0.0
+        self._waits = deque(maxlen=2000)
+
+    async def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._started = time.perf_counter()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the worker; requests still queued or in a running batch are cancelled."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            while not self._queue.empty():
+                fut = self._queue.get_nowait()[2]
+                if not fut.done():
+                    fut.cancel()
+
+    async def _submit(self, kind, payload):
+        await self.start()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((kind, payload, fut, time.perf_counter()))
+        return await fut
+
+    async def retrieve(self, query: str, k: int = 5) -> list[dict]:
+        """Top-k metadata records for a query (batched with concurrent callers)."""
+        if not query.strip():
+            return []
+        return await self._submit("retrieve", (query, k))
+
+    async def grade(self, student_answer: str, reference_texts: list[str]):
+        """(score 0-100, per-reference similarities), same contract as assess_answer.grade_answer."""
+        if not student_answer.strip() or not reference_texts:
+            return 0.0, []
+        return await self._submit("grade", (student_answer, list(reference_texts)))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                await self._serve(loop, batch)
+        except asyncio.CancelledError:
+            # stop(): callers of an unfinished batch must not wait forever
+            for item in batch:
+                if not item[2].done():
+                    item[2].cancel()
+            raise
+
+    async def _serve(self, loop, batch):
+        # Fill `batch` for up to max_wait, then serve it in the executor
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        now = time.perf_counter()
+        self._waits.extend(now - item[3] for item in batch)
+        try:
+            results = await loop.run_in_executor(None, self._serve_batch, batch)
+            for item, res in zip(batch, results):
+                if not item[2].done():
+                    item[2].set_result(res)
+        except Exception as e:
+            print(f"[ERROR] batch of {len(batch)} failed: {e}")
+            for item in batch:
+                if not item[2].done():
+                    item[2].set_exception(e)
+        self._busy_s += time.perf_counter() - now
+        self._n_batches += 1
+        self._n_requests += len(batch)
+
+    def _serve_batch(self, batch) -> list:
+        # One encode call for every distinct text in the batch
+        texts, pos = [], {}
+        for kind, payload, _, _ in batch:
+            parts = [payload[0]] if kind == "retrieve" else [payload[0]] + payload[1]
+            for t in parts:
+                if t not in pos:
+                    pos[t] = len(texts)
+                    texts.append(t)
+        embs = self.retriever.encode(texts)
+
+        # One multi-row FAISS search for all retrieval requests
+        retr = [(i, payload) for i, (kind, payload, _, _) in enumerate(batch) if kind == "retrieve"]
+        results = [None] * len(batch)
+        if retr:
+            k_max = max(k for _, (_, k) in retr)
+            q = embs[[pos[query] for _, (query, _) in retr]]
+            _, I = self.retriever.search_vectors(q, k_max)
+            for row, (i, (_, k)) in zip(I, retr):
+                results[i] = self.retriever.lookup(row[:k])
+
+        for i, (kind, payload, _, _) in enumerate(batch):
+            if kind == "grade":
+                answer, refs = payload
+                sims = embs[[pos[r] for r in refs]] @ embs[pos[answer]]
+                results[i] = (round(float(sims.mean()) * 100, 1), sims.tolist())
+        return results
+
+    def stats(self) -> dict:
+        """Throughput and queue-latency figures for tuning the batching window."""
+        uptime = time.perf_counter() - self._started if self._started else 0.0
+        waits_ms = np.array(self._waits) * 1000.0
+        return {
+            "requests": self._n_requests,
+            "batches": self._n_batches,
+            "avg_batch_size": round(self._n_requests / self._n_batches, 2) if self._n_batches else 0.0,
+            "throughput_qps": round(self._n_requests / uptime, 2) if uptime else 0.0,
+            "busy_fraction": round(self._busy_s / uptime, 3) if uptime else 0.0,
+            "queue_ms_p50": round(float(np.percentile(waits_ms, 50)), 3) if len(waits_ms) else 0.0,
+            "queue_ms_p95": round(float(np.percentile(waits_ms, 95)), 3) if len(waits_ms) else 0.0,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_batch_size": self.max_batch_size,
+        }
+
+
+async def _handle_client(batcher: QueryBatcher, reader, writer):
+    async def answer(line):
+        try:
+            req = json.loads(line)
+            op = req.get("op")
+            if op == "retrieve":
+                res = await batcher.retrieve(req.get("query", ""), int(req.get("k", 5)))
+            elif op == "grade":
+                score, sims = await batcher.grade(req.get("answer", ""), req.get("references", []))
+                res = {"score": score, "sims": sims}
+            elif op == "stats":
+                res = batcher.stats()
+            else:
+                raise ValueError(f"unknown op: {op}")
+            out = {"ok": True, "result": res}
+        except Exception as e:
+            out = {"ok": False, "error": str(e)}
+        return json.dumps(out, ensure_ascii=False) + "\n"
+
+    # Requests on one connection are answered in order but served concurrently,
+    # so a pipelining client also benefits from batching.
+    pending = asyncio.Queue()
+
+    async def write_in_order():
+        while True:
+            task = await pending.get()
+            if task is None:
+                break
+            writer.write((await task).encode("utf-8"))
+            await writer.drain()
+
+    writer_task = asyncio.create_task(write_in_order())
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                await pending.put(asyncio.create_task(answer(line)))
+        await pending.put(None)
+        await writer_task
+    finally:
+        writer.close()
+
+
+async def serve(host="127.0.0.1", port=8765, max_wait_ms=5.0, max_batch_size=64, stats_every=30.0):
+    batcher = QueryBatcher(max_wait_ms=max_wait_ms, max_batch_size=max_batch_size)
+    await batcher.start()
+    server = await asyncio.start_server(lambda r, w: _handle_client(batcher, r, w), host, port)
+    print(f"Query server listening on {host}:{port} (window={max_wait_ms}ms, max_batch={max_batch_size})")
+    async with server:
+        while True:
+            await asyncio.sleep(stats_every)
+            print("[STATS]", json.dumps(batcher.stats()))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Micro-batching retrieval/grading server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--window-ms", type=float, default=5.0, help="batching window in milliseconds")
+    ap.add_argument("--max-batch", type=int, default=64, help="maximum requests per batch")
+    ap.add_argument("--stats-every", type=float, default=30.0, help="seconds between stats prints")
+    args = ap.parse_args()
+    asyncio.run(serve(args.host, args.port, args.window_ms, args.max_batch, args.stats_every))
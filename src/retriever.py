@@ -0,0 +1,403 @@
+# src/retriever.py
+"""
+Retriever Module
+----------------
+Keeps the FAISS index, the id -> metadata table and the sentence encoder
+resident in memory between queries, so a search only costs encode + search.
+
+The index and metadata files are fingerprinted (mtime + size) and reloaded
+only when they change on disk, e.g. after `embed_store.py` rebuilds them.
+Metadata is read from the memory-mapped chunk store (chunk_store.py) when it
+is up to date, so lookups cost O(k); otherwise the JSONL file is parsed.
+Stored embeddings come from the fp16 / int8 compact store
+(compact_embeddings.py) when it matches embeddings.npy, else from the fp32
+file; both are memory-mapped and shared between worker processes.
+
+Classes:
+- Retriever: long-lived search object used by assess_answer and the app.
+"""
+
+import json
+import threading
+from pathlib import Path
+import numpy as np
+import faiss
+from ann_index import load_params, params_path, apply_search_params, search_parameters
+from chunk_store import ChunkStore, MANIFEST_NAME as STORE_MANIFEST, is_current as store_is_current
+from bm25_index import BM25Index, bm25_paths, is_current as bm25_is_current, rrf
+from metadata_filter import FilterIndex
+from compact_embeddings import CompactEmbeddings, MANIFEST_NAME as COMPACT_MANIFEST, compact_path, \
+    is_current as compact_is_current
+from models import ENCODER_NAME, get_encoder
+
+# Project root-aware paths (same artifacts embed_store.py writes)
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT_DIR / "data"
+META_FILE = DATA_DIR / "emb_metadata.jsonl"
+EMB_FILE = DATA_DIR / "embeddings.npy"
+FAISS_INDEX_FILE = DATA_DIR / "faiss_index.index"
+STORE_DIR = DATA_DIR / "chunk_store"
+MODEL_NAME = ENCODER_NAME
+# Filters matching at most this many chunks are scored exactly against the
+# stored embeddings instead of going through the ANN index
+EXACT_FILTER_MAX = 4096
+
+
+def file_fingerprint(*paths: Path) -> tuple:
+    """
+    Cheap change detector for on-disk artifacts.
+
+    Args:
+        *paths (Path): Files to fingerprint.
+
+    Returns:
+        tuple: (mtime_ns, size) per file, or None for a missing file.
+    """
+    fp = []
+    for p in paths:
+        try:
+            st = Path(p).stat()
+            fp.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            fp.append(None)
+    return tuple(fp)
+
+
+class Retriever:
+    """
+    Resident FAISS retriever.
+
+    Args:
+        index_path (Path): FAISS index file.
+        meta_path (Path): JSONL metadata file, one row per indexed vector.
+        model: Optional SentenceTransformer; the shared registry encoder otherwise.
+        mmap (bool): Open the index with faiss.IO_FLAG_MMAP instead of reading it into RAM.
+        emb_path (Path): Stored chunk embeddings (row-aligned with metadata), memory-mapped.
+        store_path (Path): Chunk store directory; defaults to chunk_store/ next to the metadata.
+    """
+
+    def __init__(self, index_path=FAISS_INDEX_FILE, meta_path=META_FILE, model=None, mmap=False,
+                 emb_path=None, store_path=None):
+        self.index_path = Path(index_path)
+        self.meta_path = Path(meta_path)
+        self.emb_path = Path(emb_path) if emb_path else self.index_path.with_name(EMB_FILE.name)
+        self.store_path = Path(store_path) if store_path else self.meta_path.with_name(STORE_DIR.name)
+        self.compact_path = compact_path(self.emb_path)
+        self.mmap = mmap
+        self._model = model
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self.index = None
+        self.meta = []
+        self._id_to_row = None
+        self._filter_index = None
+        self._bm25 = None
+        self._bm25_fp = None
+        self.params = {}
+        self.embeddings = None
+
+    @property
+    def model(self):
+        # Resolved on first encode, so index-only work never loads the encoder
+        return self._model if self._model is not None else get_encoder()
+
+    @property
+    def fingerprint(self) -> tuple:
+        """Fingerprint of the artifacts currently loaded (None before first load)."""
+        return self._fingerprint
+
+    def refresh(self) -> bool:
+        """
+        Reload index and metadata if the files changed since the last load.
+
+        Returns:
+            bool: True if an index is loaded and ready to search.
+        """
+        fp = file_fingerprint(self.index_path, self.meta_path, params_path(self.index_path), self.emb_path,
+                              self.store_path / STORE_MANIFEST, self.compact_path / COMPACT_MANIFEST)
+        if fp == self._fingerprint and self.index is not None:
+            return True
+        with self._lock:
+            if fp == self._fingerprint and self.index is not None:
+                return True
+            if fp[0] is None:
+                print(f"[WARN] FAISS index not found at {self.index_path}. Run embed_store.py first.")
+                self.index, self.meta, self._fingerprint = None, [], fp
+                return False
+            flags = faiss.IO_FLAG_MMAP if self.mmap else 0
+            self.index = faiss.read_index(str(self.index_path), flags)
+            # Index type and search parameters (nprobe / efSearch) come from the saved artifact
+            self.params = load_params(self.index_path)
+            apply_search_params(self.index, self.params)
+            self.meta = self._load_meta()
+            self._id_to_row = self._build_id_map(self.meta)
+            self._filter_index = None  # rebuilt lazily on the first filtered search
+            self._bm25, self._bm25_fp = None, None  # loaded on the first lexical search
+            self.embeddings = self._load_embeddings()
+            self._fingerprint = fp
+            if self.index.ntotal != len(self.meta):
+                print(f"[WARN] Index has {self.index.ntotal} vectors but metadata has {len(self.meta)} rows.")
+        return True
+
+    def _load_meta(self):
+        # Memory-mapped chunk store when it matches the metadata file, else parse the JSONL
+        if store_is_current(self.store_path, self.meta_path):
+            try:
+                return ChunkStore(self.store_path)
+            except Exception as e:
+                print(f"[WARN] Could not open chunk store {self.store_path} ({e}); reading {self.meta_path}.")
+        if not self.meta_path.exists():
+            print(f"[WARN] Metadata file {self.meta_path} not found. Run embed_store.py first.")
+            return []
+        print(f"[INFO] Chunk store at {self.store_path} is missing or stale; run make_store.py for O(k) lookups.")
+        meta = []
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    meta.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return meta
+
+    def _load_embeddings(self):
+        # Memory-mapped: only the rows that get graded are paged in. The compact
+        # (fp16 / int8) store is preferred when it was built from embeddings.npy.
+        if compact_is_current(self.compact_path, self.emb_path):
+            try:
+                emb = CompactEmbeddings(self.compact_path)
+                if len(emb) == len(self.meta):
+                    return emb
+                print(f"[WARN] {self.compact_path} has {len(emb)} rows but metadata has {len(self.meta)}; ignoring it.")
+            except Exception as e:
+                print(f"[WARN] Could not open compact embeddings {self.compact_path} ({e}); using {self.emb_path}.")
+        if not self.emb_path.exists():
+            return None
+        emb = np.load(self.emb_path, mmap_mode="r")
+        if emb.ndim != 2 or emb.shape[0] != len(self.meta):
+            print(f"[WARN] {self.emb_path} has {emb.shape[0]} rows but metadata has {len(self.meta)}; ignoring it.")
+            return None
+        return emb
+
+    @staticmethod
+    def _build_id_map(meta):
+        # Incremental builds address vectors by stable FAISS ids (metadata "faiss_id");
+        # older stores use the row position as the id.
+        if isinstance(meta, ChunkStore):
+            ids = np.asarray(meta.column("faiss_id"))
+            if not len(ids):
+                return None
+            id_to_row = np.full(int(ids.max()) + 1, -1, dtype="int64")
+            id_to_row[ids] = np.arange(len(ids))
+            return id_to_row
+        ids = [m.get("faiss_id") for m in meta]
+        if not meta or any(i is None for i in ids):
+            return None
+        id_to_row = np.full(max(ids) + 1, -1, dtype="int64")
+        id_to_row[ids] = np.arange(len(ids))
+        return id_to_row
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """Encode texts into normalized float32 embeddings."""
+        embs = self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(embs, dtype="float32")
+
+    @property
+    def filters(self) -> FilterIndex:
+        """Inverted lists over the loaded metadata (built on first use)."""
+        self.refresh()
+        if self._filter_index is None:
+            self._filter_index = FilterIndex(self.meta)
+        return self._filter_index
+
+    def _row_ids(self, rows: np.ndarray) -> np.ndarray:
+        # FAISS ids of metadata rows
+        if isinstance(self.meta, ChunkStore):
+            return np.asarray(self.meta.column("faiss_id"))[rows]
+        if self._id_to_row is not None:
+            return np.array([self.meta[r]["faiss_id"] for r in rows], dtype="int64")
+        return rows.astype("int64")
+
+    def _search_rows(self, q: np.ndarray, k: int, rows: np.ndarray):
+        # Search restricted to `rows`: exact scoring for small subsets, else an IDSelector
+        n = len(q)
+        D = np.full((n, k), -np.inf, dtype="float32")
+        I = np.full((n, k), -1, dtype="int64")
+        if not len(rows):
+            return D, I
+        if len(rows) <= EXACT_FILTER_MAX and self.embeddings is not None:
+            if isinstance(self.embeddings, CompactEmbeddings):
+                scores = self.embeddings.dot(q, rows)
+            else:
+                scores = q @ np.asarray(self.embeddings[rows], dtype="float32").T
+            kk = min(k, len(rows))
+            top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, 1), axis=1), 1)
+            D[:, :kk], I[:, :kk] = np.take_along_axis(scores, top, 1), rows[top]
+            return D, I
+        selector = faiss.IDSelectorBatch(self._row_ids(rows))
+        D, ids = self.index.search(q, k, params=search_parameters(self.index, self.params, selector))
+        return D, self._ids_to_rows(ids)
+
+    def _ids_to_rows(self, I: np.ndarray) -> np.ndarray:
+        if self._id_to_row is not None:
+            valid = (I >= 0) & (I < len(self._id_to_row))
+            I = np.where(valid, self._id_to_row[np.where(valid, I, 0)], -1)
+        I[(I < 0) | (I >= len(self.meta))] = -1
+        return I
+
+    def search_vectors(self, q_embs: np.ndarray, k: int = 5, filters: dict = None):
+        """
+        Search the index with precomputed query embeddings.
+
+        Args:
+            q_embs (np.ndarray): (n, dim) float32 query embeddings.
+            k (int): Number of neighbours per query.
+            filters (dict): Optional metadata filter (see metadata_filter), applied
+                inside the search so up to k matching chunks are returned.
+
+        Returns:
+            tuple: (scores, rows) arrays of shape (n, k); rows are metadata
+            positions, -1 where no result was found.
+        """
+        if not self.refresh():
+            n = len(q_embs)
+            return np.zeros((n, k), dtype="float32"), np.full((n, k), -1, dtype="int64")
+        q = np.ascontiguousarray(q_embs, dtype="float32")
+        allowed = self.filters.resolve(filters) if filters else None
+        if allowed is not None:
+            return self._search_rows(q, k, allowed)
+        D, I = self.index.search(q, k)
+        return D, self._ids_to_rows(I)
+
+    def lookup(self, rows) -> list[dict]:
+        """Return metadata records (plus their "row" position) for valid rows, in order."""
+        if not self.refresh():
+            return []
+        return [dict(self.meta[r], row=int(r)) for r in rows if 0 <= r < len(self.meta)]
+
+    def vectors(self, rows) -> np.ndarray:
+        """
+        Stored embeddings for metadata rows, without re-encoding the chunk text.
+
+        Reads the memory-mapped compact store (dequantized) or embeddings.npy,
+        or reconstructs the vectors from the FAISS index when neither exists.
+
+        Returns:
+            np.ndarray | None: (len(rows), dim) float32, or None if unavailable.
+        """
+        if not self.refresh():
+            return None
+        rows = np.asarray(rows, dtype="int64")
+        if self.embeddings is not None:
+            return np.asarray(self.embeddings[rows], dtype="float32")
+        try:
+            ids = [self.meta[r].get("faiss_id", r) for r in rows]
+            index = faiss.downcast_index(self.index)
+            if isinstance(index, faiss.IndexIDMap):
+                id_map = faiss.vector_to_array(index.id_map)
+                pos = {int(i): p for p, i in enumerate(id_map)}
+                inner = faiss.downcast_index(index.index)
+                return np.stack([inner.reconstruct(pos[int(i)]) for i in ids]).astype("float32")
+            return np.stack([index.reconstruct(int(i)) for i in ids]).astype("float32")
+        except Exception as e:
+            print(f"[WARN] Could not reconstruct vectors from the index: {e}")
+            return None
+
+    def scores(self, rows, q: np.ndarray) -> np.ndarray:
+        """
+        Dot products of stored vectors with query vectors, for grading and
+        re-scoring: rows (k,) against q (dim,) -> (k,), or rows (n, k) against
+        q (n, dim) -> (n, k), each query against its own rows. Computed on the
+        fp16 / int8 codes when the compact store is loaded.
+
+        Returns:
+            np.ndarray | None: float32 scores, or None if no vectors are available.
+        """
+        if not self.refresh():
+            return None
+        rows = np.asarray(rows, dtype="int64")
+        q = np.asarray(q, dtype="float32")
+        single = q.ndim == 1
+        if single:
+            rows, q = rows[None], q[None]
+        if isinstance(self.embeddings, CompactEmbeddings):
+            out = self.embeddings.row_dot(rows, q)
+        else:
+            ref = self.vectors(rows.ravel())
+            if ref is None:
+                return None
+            out = np.einsum("nkd,nd->nk", ref.reshape(*rows.shape, -1), q)
+        return out[0] if single else out
+
+    @property
+    def lexical(self):
+        """
+        BM25 index for the loaded metadata, or None if it is missing or stale.
+
+        The query path never writes it: embed_store / pipeline build it with the
+        store, and `python bm25_index.py` rebuilds it. Until then lexical search
+        returns nothing and hybrid search ranks by the dense results alone.
+        """
+        fp = file_fingerprint(*bm25_paths(self.index_path), self.meta_path)
+        if fp != self._bm25_fp:
+            with self._lock:
+                if fp != self._bm25_fp:
+                    if bm25_is_current(self.index_path, self.meta_path):
+                        self._bm25 = BM25Index(self.index_path)
+                    else:
+                        print("[WARN] BM25 index missing or stale; falling back to dense retrieval. "
+                              "Rebuild it with: python bm25_index.py")
+                        self._bm25 = None
+                    self._bm25_fp = fp
+        return self._bm25
+
+    @property
+    def has_lexical(self) -> bool:
+        """True if an index is loaded and its BM25 index is current."""
+        return self.refresh() and self.lexical is not None
+
+    def search_lexical(self, query: str, k: int = 5, filters: dict = None):
+        """
+        BM25 search; never touches the encoder.
+
+        Returns:
+            tuple: (scores, rows) 1-D arrays, best first (may be shorter than k).
+        """
+        if not self.refresh():
+            return np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+        bm25 = self.lexical
+        if bm25 is None:
+            return np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+        allowed = self.filters.resolve(filters) if filters else None
+        return bm25.search(query, k, allowed)
+
+    def search_hybrid(self, q_emb: np.ndarray, query: str, k: int = 5, filters: dict = None,
+                      fetch: int = None) -> list[int]:
+        """
+        Dense + BM25 results merged with reciprocal rank fusion.
+
+        Args:
+            q_emb (np.ndarray): Query embedding.
+            query (str): Query text for BM25.
+            fetch (int): Candidates taken from each ranking (default max(4k, 20)).
+
+        Returns:
+            list[int]: Top-k fused metadata rows.
+        """
+        fetch = fetch or max(4 * k, 20)
+        _, dense = self.search_vectors(q_emb[None, :], fetch, filters)
+        _, lexical = self.search_lexical(query, fetch, filters)
+        return rrf([dense[0], lexical], k)
+
+    def search_batch(self, queries: list[str], k: int = 5, filters: dict = None) -> list[list[dict]]:
+        """Encode several queries at once and return metadata records per query."""
+        if not queries or not self.refresh():
+            return [[] for _ in queries]
+        _, I = self.search_vectors(self.encode(queries), k, filters)
+        return [self.lookup(row) for row in I]
+
+    def search(self, query: str, k: int = 5, filters: dict = None) -> list[dict]:
+        """Return the top-k metadata records for one query."""
+        if not query.strip():
+            return []
+        return self.search_batch([query], k, filters)[0]
@@ -0,0 +1,353 @@
+# src/sharded_retriever.py
+"""
+Sharded Retriever Module
+------------------------
+Searches the per-subject / per-book stores built by
+`embed_store.py --shard-by subject` (data/shards/<name>/), with the same
+interface as Retriever so assess_answer and the app can use either.
+
+- Shards load lazily: each is a Retriever that reads its files on the first
+  search that selects it. A query filtered to one subject (when sharded by
+  subject) or to explicit shards never touches the others.
+- A query fans out to the selected shards in a thread pool (FAISS releases
+  the GIL) and the per-shard top-k lists are merged with a heap.
+- Rows are global: shard rows laid end to end in shard-name order, using the
+  row counts in shards.json, so lookup() / vectors() work as before.
+- Filter controls read subject / topic / difficulty values and page ranges
+  from shards.json without loading any shard.
+
+Usage:
+    retriever = ShardedRetriever()
+    D, I = retriever.search_vectors(q, k=5, filters={"subject": ["Economics"]})
+    retriever.search_vectors(q, k=5, filters={"shards": ["Physics"]})
+"""
+
+import bisect
+import heapq
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+import numpy as np
+from retriever import Retriever, file_fingerprint, META_FILE, FAISS_INDEX_FILE, EMB_FILE, STORE_DIR
+from bm25_index import RRF_K, is_current as bm25_is_current, rrf
+from metadata_filter import FILTER_FIELDS
+from models import get_encoder
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT_DIR / "data"
+SHARDS_DIR = DATA_DIR / "shards"
+SHARDS_MANIFEST = "shards.json"
+FANOUT_WORKERS = min(8, os.cpu_count() or 1)
+
+
+class ShardFilters:
+    """Filter values and page bounds over all shards, from the shards manifest."""
+
+    def __init__(self, shards: dict):
+        self.shards = shards
+
+    def values(self, field: str) -> list:
+        return sorted({v for s in self.shards.values() for v in s["values"].get(field, [])}, key=str)
+
+    def page_bounds(self):
+        pages = [s["pages"] for s in self.shards.values() if s.get("pages")]
+        if not pages:
+            return None
+        return min(p[0] for p in pages), max(p[1] for p in pages)
+
+
+class _Rows:
+    # Read-only sequence view of all shards' metadata in global row order
+    def __init__(self, owner):
+        self._owner = owner
+
+    def __len__(self):
+        return self._owner._offsets[-1] if self._owner._offsets else 0
+
+    def __getitem__(self, row):
+        name, local = self._owner._locate(int(row))
+        shard = self._owner._shard(name)
+        shard.refresh()
+        return shard.meta[local]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class ShardedRetriever:
+    """
+    Fan-out retriever over named shards.
+
+    Args:
+        shards_dir (Path): Directory with shards.json and one store per shard.
+        model: Optional SentenceTransformer; the shared registry encoder otherwise.
+        mmap (bool): Open shard indexes with faiss.IO_FLAG_MMAP.
+        workers (int): Threads used to search shards in parallel.
+    """
+
+    def __init__(self, shards_dir=SHARDS_DIR, model=None, mmap=False, workers=FANOUT_WORKERS):
+        self.shards_dir = Path(shards_dir)
+        self.mmap = mmap
+        self.workers = workers
+        self._model = model
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._pool = None
+        self.manifest = {}
+        self.names = []
+        self._offsets = []
+        self._retrievers = {}
+        self.meta = _Rows(self)
+
+    @property
+    def model(self):
+        return self._model if self._model is not None else get_encoder()
+
+    @property
+    def fingerprint(self) -> tuple:
+        """Fingerprint of the shards manifest (rewritten by every shard build)."""
+        return self._fingerprint
+
+    @property
+    def loaded(self) -> list[str]:
+        """Names of the shards that have been opened so far."""
+        return [n for n, r in self._retrievers.items() if r.index is not None]
+
+    def refresh(self) -> bool:
+        """
+        Re-read shards.json if it changed. Shard files are only opened (and
+        re-opened after a rebuild) by searches that select the shard.
+
+        Returns:
+            bool: True if at least one shard exists.
+        """
+        path = self.shards_dir / SHARDS_MANIFEST
+        fp = file_fingerprint(path)
+        if fp == self._fingerprint:
+            return bool(self.names)
+        with self._lock:
+            if fp != self._fingerprint:
+                if fp[0] is None:
+                    print(f"[WARN] No shards found at {self.shards_dir}. Run embed_store.py --shard-by subject first.")
+                    self.manifest, self.names, self._offsets, self._retrievers = {}, [], [], {}
+                else:
+                    with open(path, "r", encoding="utf-8") as f:
+                        self.manifest = json.load(f)
+                    self.names = sorted(self.manifest["shards"])
+                    self._offsets = [0]
+                    for n in self.names:
+                        self._offsets.append(self._offsets[-1] + int(self.manifest["shards"][n]["rows"]))
+                    self._retrievers = {n: r for n, r in self._retrievers.items() if n in self.manifest["shards"]}
+                self._fingerprint = fp
+        return bool(self.names)
+
+    def _shard(self, name: str) -> Retriever:
+        # Retriever objects are cheap; files are read on the shard's first refresh()
+        r = self._retrievers.get(name)
+        if r is None:
+            d = self.shards_dir / name
+            r = self._retrievers.setdefault(name, Retriever(
+                d / FAISS_INDEX_FILE.name, d / META_FILE.name, model=self._model, mmap=self.mmap,
+                emb_path=d / EMB_FILE.name, store_path=d / STORE_DIR.name))
+        return r
+
+    def _locate(self, row: int):
+        # Global row -> (shard name, local row)
+        if not 0 <= row < (self._offsets[-1] if self._offsets else 0):
+            raise IndexError(row)
+        i = bisect.bisect_right(self._offsets, row) - 1
+        return self.names[i], row - self._offsets[i]
+
+    def select(self, filters: dict = None) -> list[str]:
+        """
+        Shards a query has to search: filters["shards"] if given, narrowed by
+        the filter on the shard field (e.g. subject), else all shards.
+        """
+        self.refresh()
+        names = self.names
+        if filters and filters.get("shards"):
+            wanted = set(filters["shards"])
+            names = [n for n in names if n in wanted]
+        field = self.manifest.get("shard_by")
+        if filters and field in FILTER_FIELDS and filters.get(field):
+            wanted = filters[field]
+            wanted = {wanted} if isinstance(wanted, str) else set(wanted)
+            names = [n for n in names if self.manifest["shards"][n]["value"] in wanted]
+        return names
+
+    def _fan_out(self, fn, names):
+        # Run fn(name) for every selected shard, in parallel when there are several
+        if len(names) <= 1 or self.workers <= 1:
+            return [fn(n) for n in names]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="shard")
+        return list(self._pool.map(fn, names))
+
+    @staticmethod
+    def _merge(ranked, k: int):
+        # Heap merge of per-shard lists that are each sorted best first
+        top = list(islice(heapq.merge(*ranked, key=lambda x: -x[0]), k))
+        scores = np.full(k, -np.inf, dtype="float32")
+        rows = np.full(k, -1, dtype="int64")
+        if top:
+            scores[:len(top)] = [s for s, _ in top]
+            rows[:len(top)] = [r for _, r in top]
+        return scores, rows
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """Encode texts into normalized float32 embeddings."""
+        embs = self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(embs, dtype="float32")
+
+    @property
+    def filters(self) -> ShardFilters:
+        self.refresh()
+        return ShardFilters(self.manifest.get("shards", {}))
+
+    def _shard_filters(self, filters: dict):
+        # The shard field is resolved by shard selection; the rest is filtered inside each shard
+        if not filters:
+            return None
+        field = self.manifest.get("shard_by")
+        return {f: v for f, v in filters.items() if f not in ("shards", field)} or None
+
+    def search_vectors(self, q_embs: np.ndarray, k: int = 5, filters: dict = None):
+        """
+        Search the selected shards and merge their top-k lists.
+
+        Returns:
+            tuple: (scores, rows) arrays of shape (n, k); rows are global, -1 where
+            no result was found.
+        """
+        q = np.ascontiguousarray(q_embs, dtype="float32")
+        D = np.full((len(q), k), -np.inf, dtype="float32")
+        I = np.full((len(q), k), -1, dtype="int64")
+        names = self.select(filters) if self.refresh() else []
+        if not names:
+            return D, I
+        inner = self._shard_filters(filters)
+        parts = self._fan_out(lambda n: self._shard(n).search_vectors(q, k, inner), names)
+        offsets = {n: self._offsets[self.names.index(n)] for n in names}
+        for qi in range(len(q)):
+            ranked = [[(float(s), int(r) + offsets[n]) for s, r in zip(Dn[qi], In[qi]) if r >= 0]
+                      for n, (Dn, In) in zip(names, parts)]
+            D[qi], I[qi] = self._merge(ranked, k)
+        return D, I
+
+    @property
+    def has_lexical(self) -> bool:
+        """True if every shard has a current BM25 index (checked on disk, no shard is opened)."""
+        if not self.refresh():
+            return False
+        stale = [n for n in self.names if not bm25_is_current(self.shards_dir / n / FAISS_INDEX_FILE.name,
+                                                             self.shards_dir / n / META_FILE.name)]
+        if stale:
+            print(f"[WARN] BM25 index missing or stale in shards {stale}; rebuild them with embed_store.py.")
+        return not stale
+
+    def search_lexical(self, query: str, k: int = 5, filters: dict = None):
+        """
+        BM25 search of the selected shards, merged by rank.
+
+        Each shard scores with its own IDF and average document length, so raw
+        BM25 scores are not comparable across shards; the per-shard lists are
+        fused with reciprocal-rank scores instead (as in rrf), which interleaves
+        the shards' hits rank by rank.
+
+        Returns:
+            tuple: (scores, rows) 1-D arrays, best first (may be shorter than k);
+            scores are reciprocal-rank scores, not BM25 scores.
+        """
+        names = self.select(filters) if self.refresh() else []
+        if not names:
+            return np.zeros(0, dtype="float32"), np.zeros(0, dtype="int64")
+        inner = self._shard_filters(filters)
+        parts = self._fan_out(lambda n: self._shard(n).search_lexical(query, k, inner), names)
+        ranked = [[(1.0 / (RRF_K + rank + 1), int(r) + self._offsets[self.names.index(n)])
+                   for rank, r in enumerate(part[1])]
+                  for n, part in zip(names, parts)]
+        scores, rows = self._merge(ranked, k)
+        keep = rows >= 0
+        return scores[keep], rows[keep]
+
+    def search_hybrid(self, q_emb: np.ndarray, query: str, k: int = 5, filters: dict = None,
+                      fetch: int = None) -> list[int]:
+        """Dense + BM25 results (each merged across shards) fused with reciprocal rank fusion."""
+        fetch = fetch or max(4 * k, 20)
+        _, dense = self.search_vectors(q_emb[None, :], fetch, filters)
+        _, lexical = self.search_lexical(query, fetch, filters)
+        return rrf([dense[0], lexical], k)
+
+    def _by_shard(self, rows):
+        # {shard name: [(position in rows, local row)]} for valid global rows
+        groups = {}
+        for pos, row in enumerate(rows):
+            row = int(row)
+            if 0 <= row < len(self.meta):
+                name, local = self._locate(row)
+                groups.setdefault(name, []).append((pos, local))
+        return groups
+
+    def lookup(self, rows) -> list[dict]:
+        """Return metadata records (plus their global "row") for valid rows, in order."""
+        if not self.refresh():
+            return []
+        rows = list(rows)
+        out = {}
+        for name, items in self._by_shard(rows).items():
+            for (pos, _), rec in zip(items, self._shard(name).lookup([local for _, local in items])):
+                out[pos] = dict(rec, row=int(rows[pos]), shard=name)
+        return [out[p] for p in sorted(out)]
+
+    def vectors(self, rows) -> np.ndarray:
+        """Stored embeddings for global rows (see Retriever.vectors)."""
+        if not self.refresh():
+            return None
+        rows = np.asarray(rows, dtype="int64")
+        out = None
+        for name, items in self._by_shard(rows).items():
+            vecs = self._shard(name).vectors([local for _, local in items])
+            if vecs is None:
+                return None
+            if out is None:
+                out = np.zeros((len(rows), vecs.shape[1]), dtype="float32")
+            out[[pos for pos, _ in items]] = vecs
+        return out
+
+    def scores(self, rows, q: np.ndarray) -> np.ndarray:
+        """Dot products of stored vectors with query vectors (see Retriever.scores), per shard."""
+        if not self.refresh():
+            return None
+        rows = np.asarray(rows, dtype="int64")
+        q = np.asarray(q, dtype="float32")
+        single = q.ndim == 1
+        if single:
+            rows, q = rows[None], q[None]
+        flat = rows.ravel()
+        query_of = np.repeat(np.arange(len(q)), rows.shape[1])
+        out = np.zeros(len(flat), dtype="float32")
+        for name, items in self._by_shard(flat).items():
+            pos = np.array([p for p, _ in items])
+            local = np.array([r for _, r in items], dtype="int64")
+            s = self._shard(name).scores(local[:, None], q[query_of[pos]])
+            if s is None:
+                return None
+            out[pos] = s[:, 0]
+        out = out.reshape(rows.shape)
+        return out[0] if single else out
+
+    def search_batch(self, queries: list[str], k: int = 5, filters: dict = None) -> list[list[dict]]:
+        """Encode several queries at once and return metadata records per query."""
+        if not queries or not self.refresh():
+            return [[] for _ in queries]
+        _, I = self.search_vectors(self.encode(queries), k, filters)
+        return [self.lookup(row) for row in I]
+
+    def search(self, query: str, k: int = 5, filters: dict = None) -> list[dict]:
+        """Return the top-k metadata records for one query."""
+        if not query.strip():
+            return []
+        return self.search_batch([query], k, filters)[0]
@@ -0,0 +1,216 @@
+# src/synthetic_corpus.py
+"""
+Synthetic Corpus Module
+-----------------------
+Deterministic economics-textbook-like data for benchmarks that run offline
+and at any scale: the same seed always gives the same pages, chunks, PDFs,
+queries and answers.
+
+- Text is built from topic vocabularies (money, inflation, trade, ...) and
+  sentence templates; every page starts with a heading, so chunker topics
+  and YAKE key terms look like the real books'.
+- Pages / chunks are streamed with the same fields ingest_pdf.iter_pages /
+  chunker.chunk_records produce, so they go straight into chunker.run or
+  embed_store.build_index. Chunk i depends only on (seed, i).
+- write_pdf renders pages into a real PDF with PyMuPDF for load_pdf.
+- HashingEncoder is a SentenceTransformer stand-in (feature hashing of
+  words and word bigrams, normalized) so million-chunk stores can be built
+  without a model download; benchmark.py registers it as the shared encoder
+  unless --encoder model is given.
+
+Usage:
+    python synthetic_corpus.py --chunks 1000 --out /tmp/chunks.jsonl
+    python synthetic_corpus.py --pdf /tmp/book.pdf --pages 50
+"""
+
+import argparse
+import json
+import random
+import zlib
+from pathlib import Path
+import numpy as np
+
+SUBJECT = "Economics"
+SEED = 0
+CHUNK_WORDS = 60     # words per synthetic chunk (real chunks are 300; smaller keeps 1M-chunk runs in memory)
+PAGE_WORDS = 450
+HASH_DIM = 384       # same width as all-MiniLM-L6-v2
+
+TOPICS = {
+    "Money and Banking": "money supply central bank reserves deposits credit interest rate liquidity lending "
+                         "monetary base velocity currency open market operations",
+    "Inflation": "inflation price level consumer price index purchasing power wages expectations deflation "
+                 "cost push demand pull hyperinflation indexation",
+    "Markets": "demand supply equilibrium price elasticity surplus shortage consumer producer market "
+               "competition monopoly marginal cost revenue",
+    "Fiscal Policy": "government spending taxation budget deficit public debt multiplier transfer payments "
+                     "automatic stabilizers crowding out fiscal stimulus",
+    "International Trade": "exports imports comparative advantage tariffs quotas exchange rate balance of "
+                           "payments current account trade deficit globalization",
+    "Growth and Labor": "gross domestic product productivity capital labor unemployment labor force "
+                        "technology human capital business cycle recession output",
+}
+_TEMPLATES = (
+    "The {a} depends on the {b}, which is why economists study {c}.",
+    "When the {a} rises, the {b} usually falls and {c} adjusts over time.",
+    "A change in {a} shifts {b}; in the long run {c} returns to equilibrium.",
+    "Policy makers watch {a} and {b} closely because {c} affects households.",
+    "In this chapter we compare {a} with {b} and explain the role of {c}.",
+    "Empirical studies show that {a} and {b} move together during periods of {c}.",
+)
+_QUESTIONS = ("What is {a}?", "How does {a} affect {b}?", "Explain the relationship between {a} and {b}.",
+              "Why does {a} matter for {b}?")
+_TOPIC_NAMES = sorted(TOPICS)
+_TERMS = {t: TOPICS[t].split() for t in _TOPIC_NAMES}
+
+
+def _phrase(rng, words):
+    n = rng.choice((1, 1, 2, 2, 3))
+    start = rng.randrange(max(1, len(words) - n + 1))
+    return " ".join(words[start:start + n])
+
+
+def sentences(rng: random.Random, topic: str, n_words: int):
+    """Template sentences about `topic` (with some cross-topic terms) totalling ~n_words words."""
+    words, out, count = _TERMS[topic], [], 0
+    while count < n_words:
+        other = _TERMS[rng.choice(_TOPIC_NAMES)] if rng.random() < 0.2 else words
+        s = rng.choice(_TEMPLATES).format(a=_phrase(rng, words), b=_phrase(rng, other), c=_phrase(rng, words))
+        out.append(s)
+        count += len(s.split())
+    return " ".join(out)
+
+
+def page_text(i: int, seed: int = SEED, n_words: int = PAGE_WORDS) -> str:
+    """Text of page i: a heading line, then paragraphs on the page's topic."""
+    rng = random.Random(seed * 1_000_003 + 2 * i)
+    topic = _TOPIC_NAMES[(i // 8) % len(_TOPIC_NAMES)]  # eight pages per section
+    paras = [sentences(rng, topic, n_words // 3) for _ in range(3)]
+    return f"{topic}\n" + "\n".join(paras)
+
+
+def iter_pages(n_pages: int, seed: int = SEED, n_words: int = PAGE_WORDS, source: str = "synthetic.pdf"):
+    """Page records shaped like ingest_pdf.iter_pages output."""
+    for i in range(n_pages):
+        yield {"id": f"page-{i + 1}", "subject": SUBJECT, "topic": None, "subtopic": None, "difficulty": None,
+               "page": i + 1, "source": source, "text": page_text(i, seed, n_words)}
+
+
+def iter_chunks(n_chunks: int, seed: int = SEED, n_words: int = CHUNK_WORDS, books: int = 4):
+    """Chunk records shaped like chunker.chunk_records output (topic, page and book vary)."""
+    for i in range(n_chunks):
+        rng = random.Random(seed * 1_000_003 + 2 * i + 1)
+        topic = _TOPIC_NAMES[rng.randrange(len(_TOPIC_NAMES))]
+        page = i // 6 + 1
+        yield {"id": f"page-{page}_chunk_{i % 6}", "subject": SUBJECT, "topic": topic, "subtopic": None,
+               "difficulty": ("easy", "medium", "hard")[i % 3], "page": page,
+               "source": f"book-{i % books + 1}.pdf", "text": sentences(rng, topic, n_words)}
+
+
+def queries(n: int, seed: int = SEED) -> list[str]:
+    """Distinct student-style questions (distinct so the exact query cache never hits)."""
+    rng = random.Random(f"{seed}:queries")
+    out = []
+    for i in range(n):
+        topic = rng.choice(_TOPIC_NAMES)
+        q = rng.choice(_QUESTIONS).format(a=_phrase(rng, _TERMS[topic]), b=_phrase(rng, _TERMS[topic]))
+        out.append(f"{q} ({i})")
+    return out
+
+
+def answers(n: int, seed: int = SEED, n_words: int = 40) -> list[str]:
+    """Student answers of ~n_words words."""
+    rng = random.Random(f"{seed}:answers")
+    return [sentences(rng, rng.choice(_TOPIC_NAMES), n_words) for _ in range(n)]
+
+
+def write_jsonl(records, path: Path) -> int:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            n += 1
+    return n
+
+
+def write_pdf(path: Path, n_pages: int, seed: int = SEED, n_words: int = PAGE_WORDS) -> Path:
+    """Render synthetic pages into a text PDF (needs PyMuPDF)."""
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc = pymupdf.open()
+    for i in range(n_pages):
+        page = doc.new_page()  # A4-ish default size
+        page.insert_textbox(page.rect + (50, 50, -50, -50), page_text(i, seed, n_words), fontsize=9)
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+class HashingEncoder:
+    """
+    Deterministic, model-free stand-in for the SentenceTransformer encoder.
+
+    Words and word bigrams are hashed (crc32) into `dim` signed buckets and
+    the counts are L2-normalized, so texts sharing terms get similar vectors.
+    Implements the encode() / get_sentence_embedding_dimension() subset the
+    repo uses.
+
+    Args:
+        dim (int): Embedding width.
+    """
+
+    def __init__(self, dim: int = HASH_DIM):
+        self.dim = dim
+        self._buckets = {}  # feature -> signed bucket (+/- (index + 1))
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _bucket(self, feature: str) -> int:
+        b = self._buckets.get(feature)
+        if b is None:
+            h = zlib.crc32(feature.encode("utf-8"))
+            b = self._buckets[feature] = (h % self.dim + 1) * (1 if h & 0x80000000 else -1)
+        return b
+
+    def encode(self, texts, batch_size: int = 64, show_progress_bar: bool = False, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = True, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        rows, buckets = [], []
+        for i, t in enumerate(texts):
+            toks = t.lower().replace(".", " ").replace(",", " ").replace("?", " ").split()
+            feats = toks + [a + " " + b for a, b in zip(toks, toks[1:])]
+            buckets.extend(map(self._bucket, feats))
+            rows.append(len(feats))
+        b = np.asarray(buckets, dtype=np.int64)
+        flat = np.repeat(np.arange(len(texts)) * self.dim, rows) + np.abs(b) - 1
+        out = np.bincount(flat, weights=np.sign(b), minlength=len(texts) * self.dim)
+        out = out.reshape(len(texts), self.dim).astype("float32")
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out[0] if single else out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Write a deterministic synthetic economics corpus")
+    ap.add_argument("--chunks", type=int, help="write this many chunk records to --out")
+    ap.add_argument("--pages", type=int, default=50, help="pages for --pdf / --pages-out")
+    ap.add_argument("--out", help="chunk JSONL output")
+    ap.add_argument("--pages-out", help="page JSONL output (chunker.run input)")
+    ap.add_argument("--pdf", help="PDF output")
+    ap.add_argument("--seed", type=int, default=SEED)
+    args = ap.parse_args()
+
+    if args.chunks and args.out:
+        print("Wrote", write_jsonl(iter_chunks(args.chunks, args.seed), args.out), "chunks to", args.out)
+    if args.pages_out:
+        print("Wrote", write_jsonl(iter_pages(args.pages, args.seed), args.pages_out), "pages to", args.pages_out)
+    if args.pdf:
+        print("Wrote", write_pdf(args.pdf, args.pages, args.seed))
@@ -0,0 +1,31 @@
+# src/test_sharded_retriever.py
+import tempfile
+from pathlib import Path
+
+import models
+from embed_store import build_shards
+from sharded_retriever import ShardedRetriever
+from synthetic_corpus import HashingEncoder, iter_chunks
+
+models.register("encoder", HashingEncoder())
+chunks = list(iter_chunks(60))
+
+with tempfile.TemporaryDirectory() as tmp:
+    shards_dir = Path(tmp) / "shards"
+    build_shards(chunks, shard_by="source", shards_dir=shards_dir, workers=1)
+
+    # Fresh retriever: no shard has been searched (or refreshed) yet
+    r = ShardedRetriever(shards_dir)
+    assert r.refresh() and not r.loaded, "Shards should open lazily"
+    rows = [0, len(r.meta) - 1, 17]
+    recs = r.lookup(rows)
+    print("Looked up rows:", [(rec["row"], rec["shard"], rec["id"]) for rec in recs])
+    assert [rec["row"] for rec in recs] == rows, "lookup() lost rows of unsearched shards"
+
+    # The meta view opens shards on demand too
+    r = ShardedRetriever(shards_dir)
+    r.refresh()
+    assert r.meta[rows[-1]]["id"] == recs[-1]["id"], "meta[row] disagrees with lookup()"
+    assert len(list(r.meta)) == len(chunks), "meta view does not cover every chunk"
+
+print("Lookups on never-searched shards work ✅")
@@ -0,0 +1,228 @@
+# src/transcript_fetcher.py
+"""
+Transcript Fetcher Module
+-------------------------
+Concurrent, rate-limited YouTube transcript fetching with retries and an
+on-disk per-video cache.
+
+- Fetches run in a thread pool (the work is network-bound); a shared
+  `ratelimit` limiter caps requests per period across all threads.
+- Transient failures are retried with exponential backoff; videos without a
+  transcript (TranscriptUnavailable) fail immediately.
+- Every fetched transcript is written to data/transcript_cache/<id>.json, so
+  reruns and crash restarts never refetch a video.
+- The transport is pluggable: YouTubeTransport talks to YouTube,
+  LocalTransport serves <video_id>.json files from a directory (for tests
+  and offline runs).
+
+Usage:
+    ids = read_playlist(PLAYLIST_FILE)
+    for vid, transcript, err in fetch_transcripts(ids, YouTubeTransport(), workers=8):
+        ...
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT_DIR / "data"
+PLAYLIST_FILE = DATA_DIR / "video_playlist.txt"
+CACHE_DIR = DATA_DIR / "transcript_cache"
+
+WORKERS = 8
+RATE_CALLS, RATE_PERIOD = 5, 1.0  # at most 5 requests per second
+RETRIES = 3
+BACKOFF = 1.0  # seconds before the first retry, doubled each time
+
+_VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+
+class TranscriptUnavailable(Exception):
+    """The video has no transcript (disabled, private, removed); retrying will not help."""
+
+
+class YouTubeTransport:
+    """Fetches transcripts with youtube-transcript-api."""
+
+    def __init__(self, languages=("en",)):
+        from youtube_transcript_api import YouTubeTranscriptApi
+        self._api = YouTubeTranscriptApi
+        self.languages = list(languages)
+
+    def fetch(self, video_id: str) -> list[dict]:
+        from youtube_transcript_api import NoTranscriptFound, TranscriptsDisabled, VideoUnavailable
+        try:
+            return self._api.get_transcript(video_id, languages=self.languages)
+        except (NoTranscriptFound, TranscriptsDisabled, VideoUnavailable) as e:
+            raise TranscriptUnavailable(str(e)) from e
+
+
+class LocalTransport:
+    """
+    Serves transcripts from <root>/<video_id>.json (a list of
+    {"text", "start", "duration"} segments), a local stand-in for YouTube.
+
+    Args:
+        root (Path): Directory with one JSON file per video.
+        latency (float): Seconds to sleep per fetch, to mimic network time.
+    """
+
+    def __init__(self, root: Path, latency: float = 0.0):
+        self.root = Path(root)
+        self.latency = latency
+
+    def fetch(self, video_id: str) -> list[dict]:
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.root / f"{video_id}.json"
+        if not path.exists():
+            raise TranscriptUnavailable(f"no local transcript for {video_id}")
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+TRANSPORTS = {"youtube": YouTubeTransport, "local": LocalTransport}
+
+
+def parse_video_id(line: str):
+    """Video id from a bare id or a watch / youtu.be / shorts / embed URL, else None."""
+    line = line.strip()
+    if _VIDEO_ID_RE.match(line):
+        return line
+    url = urlparse(line if "//" in line else "https://" + line)
+    if url.hostname and url.hostname.endswith("youtu.be"):
+        candidate = url.path.strip("/").split("/")[0]
+    elif "v" in parse_qs(url.query):
+        candidate = parse_qs(url.query)["v"][0]
+    else:
+        parts = url.path.strip("/").split("/")
+        candidate = parts[1] if len(parts) > 1 and parts[0] in ("shorts", "embed", "live") else ""
+    return candidate if _VIDEO_ID_RE.match(candidate) else None
+
+
+def read_playlist(path: Path = PLAYLIST_FILE) -> list[str]:
+    """
+    Video ids from a playlist file: one id or URL per line, '#' comments and
+    blank lines ignored, duplicates dropped (first occurrence kept).
+    """
+    ids = []
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.split(" #", 1)[0].strip()
+            if not line or line.startswith("#"):
+                continue
+            vid = parse_video_id(line)
+            if vid is None:
+                print(f"[WARN] {path}:{n}: no video id in {line!r} (playlist-only URLs are not expanded)")
+            else:
+                ids.append(vid)
+    return list(dict.fromkeys(ids))
+
+
+class TranscriptCache:
+    """
+    One JSON file per video under `root`, written atomically.
+
+    Args:
+        root (Path): Cache directory (created on first write).
+    """
+
+    def __init__(self, root: Path = CACHE_DIR):
+        self.root = Path(root)
+
+    def path(self, video_id: str) -> Path:
+        return self.root / f"{video_id}.json"
+
+    def get(self, video_id: str):
+        path = self.path(video_id)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def put(self, video_id: str, transcript: list[dict]):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.path(video_id).with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(transcript, f, ensure_ascii=False)
+        os.replace(tmp, self.path(video_id))
+
+
+def rate_limited(fn, calls: int = RATE_CALLS, period: float = RATE_PERIOD):
+    """Wrap `fn` so that all threads together make at most `calls` calls per `period` seconds."""
+    from ratelimit import limits, sleep_and_retry
+    return sleep_and_retry(limits(calls=calls, period=period)(fn))
+
+
+def fetch_with_retry(fetch, video_id: str, retries: int = RETRIES, backoff: float = BACKOFF) -> list[dict]:
+    """Call fetch(video_id), retrying transient errors with exponential backoff and jitter."""
+    for attempt in range(retries + 1):
+        try:
+            return fetch(video_id)
+        except TranscriptUnavailable:
+            raise
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+            print(f"[WARN] Transcript fetch {video_id} failed ({e}); retry {attempt + 1}/{retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def fetch_transcripts(video_ids, transport=None, workers: int = WORKERS, calls: int = RATE_CALLS,
+                      period: float = RATE_PERIOD, retries: int = RETRIES, backoff: float = BACKOFF,
+                      cache_dir: Path = CACHE_DIR):
+    """
+    Fetch transcripts concurrently, serving cached videos without a request.
+
+    Args:
+        video_ids (list[str]): Videos to fetch.
+        transport: Object with fetch(video_id) -> segments (default YouTubeTransport).
+        workers (int): Fetch threads.
+        calls, period: Rate limit shared by all threads (calls per period seconds).
+        retries (int): Retries per video for transient errors.
+        backoff (float): First retry delay in seconds.
+        cache_dir (Path): Per-video transcript cache; None disables it.
+
+    Yields:
+        tuple: (video_id, transcript or None, error or None), cached videos
+        first, the rest in completion order.
+    """
+    cache = TranscriptCache(cache_dir) if cache_dir else None
+    todo = []
+    for vid in dict.fromkeys(video_ids):
+        cached = cache.get(vid) if cache else None
+        if cached is not None:
+            yield vid, cached, None
+        else:
+            todo.append(vid)
+    if not todo:
+        return
+
+    transport = transport or YouTubeTransport()
+    fetch = rate_limited(transport.fetch, calls, period)
+
+    def _job(vid):
+        transcript = fetch_with_retry(fetch, vid, retries, backoff)
+        if cache:
+            cache.put(vid, transcript)
+        return transcript
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(_job, vid): vid for vid in todo}
+        for fut in as_completed(futures):
+            vid = futures[fut]
+            try:
+                yield vid, fut.result(), None
+            except Exception as e:
+                yield vid, None, e